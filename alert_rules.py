@@ -0,0 +1,102 @@
+"""
+Automatic alerts raised after a risk refresh.
+
+A rule fires only on a transition between the previous snapshot and the
+new result (e.g. Low -> High, or not overdue -> overdue), and at most
+once per customer and rule within settings.alert_cooldown_hours.
+"""
+from datetime import timedelta
+from typing import Dict, List, Tuple
+from sqlalchemy.orm import Session
+from models import Alert, AlertCooldown, utcnow
+from crud import alerts_crud, email_outbox_crud
+from email_service import alert_email
+from settings import settings
+
+
+LEVEL_RANK = {"Safe": 0, "Low": 1, "Medium": 2, "High": 3}
+
+
+def detect_transitions(previous: Dict | None, current: Dict) -> List[Tuple[str, str]]:
+    """(rule, message) pairs for one customer. No previous snapshot -> no alerts."""
+    if previous is None:
+        return []
+
+    transitions = []
+    old_rank = LEVEL_RANK.get(previous["risk_level"], 0)
+    new_rank = LEVEL_RANK.get(current["risk_level"], 0)
+
+    if new_rank > old_rank and new_rank >= LEVEL_RANK.get(settings.auto_alert_min_level, 3):
+        transitions.append((
+            f"level_{current['risk_level'].lower()}",
+            f"Risk level rose from {previous['risk_level']} to {current['risk_level']} "
+            f"(score {current['risk_score']:.0f}).",
+        ))
+
+    if current["has_overdue"] and not previous["has_overdue"]:
+        transitions.append((
+            "became_overdue",
+            f"Customer now has an overdue invoice (open debt {current['total_open_debt']:.2f}).",
+        ))
+
+    return transitions
+
+
+def apply_alert_rules(db: Session, previous: Dict[int, Dict], results: List[Dict]) -> List[Alert]:
+    """
+    Create alerts (and queue their emails) for new transitions in `results`,
+    skipping customer/rule pairs still in their cooldown window.
+    Only flushed: the caller commits them with the snapshots they compare,
+    so a failure can't store the new snapshots without their alerts.
+    """
+    candidates = []
+    for r in results:
+        for rule, message in detect_transitions(previous.get(r["customer_id"]), r):
+            candidates.append((r, rule, message))
+
+    if not candidates:
+        return []
+
+    now = utcnow()
+    window_start = now - timedelta(hours=settings.alert_cooldown_hours)
+    cooldowns = alerts_crud.get_cooldowns(db, list({r["customer_id"] for r, _, _ in candidates}))
+
+    alerts = []
+    for r, rule, message in candidates:
+        key = (r["customer_id"], rule)
+        cooldown = cooldowns.get(key)
+        if cooldown and cooldown.last_fired_at > window_start:
+            continue
+
+        if cooldown:
+            cooldown.last_fired_at = now
+        else:
+            cooldowns[key] = AlertCooldown(customer_id=r["customer_id"], rule=rule, last_fired_at=now)
+            db.add(cooldowns[key])
+
+        alert = Alert(
+            customer_id=r["customer_id"],
+            customer_name=r["customer_name"],
+            message=message,
+            status="sent",
+        )
+        db.add(alert)
+        alerts.append(alert)
+
+    db.flush()  # assigns alert ids
+
+    if settings.email_to:
+        for alert in alerts:
+            subject, body = alert_email(alert.customer_name, alert.message)
+            email_outbox_crud.enqueue_email(
+                db,
+                to_email=settings.email_to,
+                subject=subject,
+                body=body,
+                from_name=settings.email_from_name,
+                alert_id=alert.id,
+                commit=False,
+            )
+
+    db.flush()
+    return alerts
@@ -1,21 +1,49 @@
-from typing import List
-from fastapi import FastAPI, HTTPException, Depends
+from typing import List, Literal
+from contextlib import asynccontextmanager
+from datetime import datetime
+from fastapi import FastAPI, HTTPException, Depends, Request, Response, Query
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 import models
-from db import Base, engine, get_db
-from dolibarr_client import DolibarrClient
-from risk_service import RiskService
-from schemas import CustomerRiskOut
-from crud import alerts_crud, risk_crud
+from db import Base, engine, get_async_db, SessionLocal, create_missing_indexes
+from dolibarr_client import DolibarrClient, AsyncDolibarrClient, close_http_client, close_async_http_client
+from mirror_service import MirrorDataSource
+from refresh_service import (
+    refresh_customers_risk, refresh_customers_risk_async, sync_mirror_exclusive,
+    refresher, start_refresh_job, get_refresh_job,
+)
+from schemas import CustomerRiskOut, RiskLevel, RiskSimulationIn
+from crud import alerts_crud, risk_crud, email_outbox_crud, history_crud
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from settings import settings
-from fastapi import BackgroundTasks
-from email_service import send_email_smtp
+from email_service import alert_email, email_dispatcher
+from streaming import wants_ndjson, ndjson_response
+import metrics
+import numpy as np
+from risk_vectorized import LEVELS, level_codes, simulate_scores
 
 
 Base.metadata.create_all(bind=engine)
+# filter/sort/keyset indexes on pre-existing alerts and snapshot tables
+create_missing_indexes(models.Alert.__table__, models.CustomerRiskSnapshot.__table__)
+
+MAX_BATCH_ALERTS = 1000
+
 
-app = FastAPI(title="Smart Customer Alerts API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    refresher.start()
+    email_dispatcher.start()
+    yield
+    refresher.stop()
+    email_dispatcher.stop()
+    # release pooled Dolibarr connections on shutdown
+    close_http_client()
+    await close_async_http_client()
+
+
+app = FastAPI(title="Smart Customer Alerts API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -25,120 +53,367 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 
+def _stream_snapshot_rows():
+    # own session: the request-scoped one may be closed while the body streams
+    db = SessionLocal()
+    try:
+        yield from risk_crud.iter_customer_risk_rows(db)
+    finally:
+        db.close()
+
+
+def _refresh_from_mirror(incremental: bool) -> List[dict]:
+    # RISK_DATA_SOURCE=mirror: sync the mirror, then score from it, as refresh jobs do
+    db = SessionLocal()
+    try:
+        sync_mirror_exclusive(db, DolibarrClient())
+        return refresh_customers_risk(db, MirrorDataSource(), incremental=incremental)
+    finally:
+        db.close()
+
+
 # GET /risk/customers
 @app.get("/risk/customers", response_model=List[CustomerRiskOut])
-def get_risk_customers(db: Session = Depends(get_db)):
+async def get_risk_customers(
+    request: Request,
+    mode: Literal["full", "incremental"] = "full",
+    refresh: bool = False,
+    format: Literal["json", "ndjson"] | None = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    # ndjson via ?format=ndjson or "Accept: application/x-ndjson"
+    stream = wants_ndjson(request, format)
+
     try:
-        client = DolibarrClient()
-        service = RiskService(client)
-
-        results = service.get_customers_risk()   
-
-        for r in results:
-            risk_crud.upsert_customer_risk_snapshot(db, {
-                "customer_id": r["customer_id"],
-                "customer_name": r["customer_name"],
-                "unpaid_count": r["unpaid_count"],
-                "total_open_debt": r["total_open_debt"],
-                "has_overdue": r["has_overdue"],
-                "risk_score": r["risk_score"],
-                "risk_level": r["risk_level"],
-                "reasons": r["reasons"],  # list
-            })
+        # served from stored snapshots; the background refresher keeps them fresh
+        if not refresh and await db.run_sync(risk_crud.has_customer_risks):
+            if stream:
+                return ndjson_response(_stream_snapshot_rows())
+            return await db.run_sync(risk_crud.list_customer_risk_dicts)
+
+        incremental = mode == "incremental"
+        if settings.risk_data_source == "mirror":
+            # the mirror path is sync DB work end to end
+            results = await run_in_threadpool(_refresh_from_mirror, incremental)
+        else:
+            results = await refresh_customers_risk_async(db, AsyncDolibarrClient(), incremental=incremental)
 
+        if mode == "incremental":
+            # only changed customers were recomputed, the rest come from snapshots
+            if stream:
+                return ndjson_response(_stream_snapshot_rows())
+            return await db.run_sync(risk_crud.list_customer_risk_dicts)
+
+        if stream:
+            return ndjson_response(results)
         return results
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+# GET /risk/snapshots
+@app.get("/risk/snapshots", response_model=List[CustomerRiskOut])
+async def list_risk_snapshots(
+    response: Response,
+    level: List[RiskLevel] | None = Query(None),
+    min_score: float | None = None,
+    max_score: float | None = None,
+    min_debt: float | None = None,
+    max_debt: float | None = None,
+    has_overdue: bool | None = None,
+    sort: Literal["risk_score", "total_open_debt", "unpaid_count", "customer_id"] = "risk_score",
+    order: Literal["asc", "desc"] = "desc",
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: str | None = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    try:
+        rows, next_cursor = await db.run_sync(
+            risk_crud.list_customer_risks_page,
+            limit,
+            cursor=cursor,
+            levels=level,
+            min_score=min_score,
+            max_score=max_score,
+            min_debt=min_debt,
+            max_debt=max_debt,
+            has_overdue=has_overdue,
+            sort=sort,
+            descending=(order == "desc"),
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+
+    return rows
+
+
+# GET /risk/customers/{customer_id}/history
+@app.get("/risk/customers/{customer_id}/history")
+async def get_customer_risk_history(
+    customer_id: int,
+    days: int = Query(90, ge=1, le=3650),
+    db: AsyncSession = Depends(get_async_db),
+):
+    return await db.run_sync(history_crud.get_customer_history, customer_id, days)
+
+
+def _simulate(db: Session, params: RiskSimulationIn) -> dict:
+    ids, unpaid, debt, overdue, scores = risk_crud.get_scoring_columns(db)
+    thresholds = {
+        "debt_threshold": settings.debt_threshold if params.debt_threshold is None else params.debt_threshold,
+        "unpaid_n": settings.unpaid_n if params.unpaid_n is None else params.unpaid_n,
+    }
+
+    # one vectorized pass over the stored snapshot columns
+    current = level_codes(np.asarray(scores, dtype=np.float64))
+    new_scores = simulate_scores(
+        np.asarray(unpaid, dtype=np.int64),
+        np.asarray(debt, dtype=np.float64),
+        np.asarray(overdue, dtype=bool),
+        overdue_weight=params.overdue_weight,
+        debt_weight=params.debt_weight,
+        unpaid_weight=params.unpaid_weight,
+        **thresholds,
+    )
+    simulated = level_codes(new_scores, params.low_max, params.medium_max)
+
+    changed = np.flatnonzero(current != simulated)
+    # biggest simulated risk first
+    shown = changed[np.lexsort((np.asarray(ids)[changed], -new_scores[changed]))][:params.limit]
+    names = risk_crud.get_snapshot_states(db, [ids[i] for i in shown.tolist()])
+
+    def distribution(codes) -> dict:
+        counts = np.bincount(codes, minlength=len(LEVELS)) if len(codes) else [0] * len(LEVELS)
+        return {level: int(counts[i]) for i, level in enumerate(LEVELS)}
+
+    return {
+        "customers": len(ids),
+        "parameters": {**params.model_dump(exclude={"limit"}), **thresholds},
+        "current_distribution": distribution(current),
+        "simulated_distribution": distribution(simulated),
+        "changed_count": int(len(changed)),
+        "changes": [
+            {
+                "customer_id": ids[i],
+                "customer_name": names[ids[i]]["customer_name"],
+                "current_score": scores[i],
+                "current_level": LEVELS[current[i]],
+                "simulated_score": float(new_scores[i]),
+                "simulated_level": LEVELS[simulated[i]],
+            }
+            for i in shown.tolist()
+        ],
+    }
+
+
+# POST /risk/simulate
+@app.post("/risk/simulate")
+async def simulate_risk(params: RiskSimulationIn, db: AsyncSession = Depends(get_async_db)):
+    # what-if scoring from stored snapshots; nothing is written and Dolibarr is not called
+    if params.medium_max < params.low_max:
+        raise HTTPException(status_code=400, detail="medium_max must be >= low_max")
+    return await db.run_sync(_simulate, params)
+
+
+# POST /risk/refresh
+@app.post("/risk/refresh", status_code=202)
+async def start_risk_refresh(
+    mode: Literal["full", "incremental"] = "full",
+    source: Literal["dolibarr", "mirror"] | None = None,
+    mirror_sync: Literal["incremental", "full", "none"] = "incremental",
+):
+    # source=mirror&mirror_sync=none re-scores from the local mirror only (e.g. after a threshold change)
+    return start_refresh_job(mode, source or settings.risk_data_source, mirror_sync).to_dict()
+
+
+@app.get("/risk/refresh/{job_id}")
+async def get_risk_refresh(job_id: str):
+    job = get_refresh_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Refresh job not found")
+    return job.to_dict()
     
 
+def _alert_message(payload: dict) -> str:
+    raw_message = (
+        payload.get("message")
+        or payload.get("preview")
+        or payload.get("email_body")
+    )
+    return raw_message.strip() if isinstance(raw_message, str) and raw_message.strip() else "Automatic risk alert"
+
+
+def _queue_alert_email(db: Session, alert) -> None:
+    if not settings.email_to:
+        return
+    subject, body = alert_email(alert.customer_name, alert.message)
+    email_outbox_crud.enqueue_email(
+        db,
+        to_email=settings.email_to,          # always your email
+        subject=subject,
+        body=body,
+        from_name=settings.email_from_name,
+        alert_id=alert.id,
+        commit=False,
+    )
+
+
+def _create_alert_with_email(db: Session, customer_id: int, message: str) -> dict:
+    # alert (customer_name pulled from the snapshot) + queued email in one transaction
+    alert = alerts_crud.create_alert_from_snapshot(
+        db=db,
+        customer_id=customer_id,
+        message = message,
+        commit=False,
+    )
+    _queue_alert_email(db, alert)
+    db.commit()
+    return {"alert_id": alert.id, "customer_name": alert.customer_name}
+
+
+def _create_alert_batch_with_emails(db: Session, valid: list) -> list:
+    alerts = alerts_crud.create_alerts_from_snapshots(
+        db, [(cid, message) for _, cid, message in valid], commit=False,
+    )
+    for alert in alerts:
+        if alert is not None:
+            _queue_alert_email(db, alert)
+    db.commit()
+    return [(a.id, a.customer_name) if a is not None else None for a in alerts]
+
+
 @app.post("/alerts/send")
-def send_alert(
+async def send_alert(
     payload: dict,
-    background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     # 1) validate input
     try:
         customer_id = int(payload["customer_id"])
-        message = str(payload.get("message") or "Automatic risk alert")
     except Exception:
         raise HTTPException(status_code=400, detail="customer_id is required")
 
-    # 2) create alert in DB (this pulls customer_name from the snapshot internally)
-    raw_message = (
-    payload.get("message")
-    or payload.get("preview")
-    or payload.get("email_body")
-)
-
-    message = raw_message.strip() if isinstance(raw_message, str) and raw_message.strip() else "Automatic risk alert"
-
+    # 2) create alert + queue its email (the dispatcher sends it)
     try:
-        alert = alerts_crud.create_alert_from_snapshot(
-            db=db,
-            customer_id=customer_id,
-            message = message,
-        )
+        created = await db.run_sync(_create_alert_with_email, customer_id, _alert_message(payload))
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
-    # 3) email content (UI-friendly)
-    customer_name = alert.customer_name
-    subject = f"🚨 Risk Alert – {customer_name}"
-    body = f"""Smart Customer Alerts
-
-Customer: {customer_name}
-
-Message:
-{alert.message}
-"""
-
-    # 4) send email asynchronously
-    background_tasks.add_task(
-        send_email_smtp,
-        settings.email_host,
-        settings.email_port,
-        settings.email_user,
-        settings.email_pass,
-        settings.email_to,          # always your email
-        subject,
-        body,
-        settings.email_from_name,
-    )
+    email_dispatcher.notify()
 
-    # 5) response
+    # 3) response
     return {
         "status": "sent",
-        "alert_id": alert.id,
-        "customer_name": customer_name,
+        "alert_id": created["alert_id"],
+        "customer_name": created["customer_name"],
+        "email_sent_to": settings.email_to,
+    }
+
+
+# POST /alerts/send-batch
+@app.post("/alerts/send-batch")
+async def send_alerts_batch(
+    payload: dict,
+    db: AsyncSession = Depends(get_async_db),
+):
+    items = payload.get("items")
+    if not isinstance(items, list) or not items:
+        raise HTTPException(status_code=400, detail="items must be a non-empty list")
+    if len(items) > MAX_BATCH_ALERTS:
+        raise HTTPException(status_code=400, detail=f"at most {MAX_BATCH_ALERTS} items per batch")
+
+    # 1) validate every item, keep going on bad ones
+    results = [None] * len(items)
+    valid = []  # (index, customer_id, message)
+    for i, item in enumerate(items):
+        try:
+            customer_id = int(item["customer_id"])
+        except Exception:
+            results[i] = {"index": i, "status": "error", "detail": "customer_id is required"}
+            continue
+        valid.append((i, customer_id, _alert_message(item)))
+
+    # 2) one snapshot lookup + one transaction for all alerts and their emails
+    created = await db.run_sync(_create_alert_batch_with_emails, valid)
+    email_dispatcher.notify()
+
+    for (i, customer_id, _), alert in zip(valid, created):
+        if alert is None:
+            results[i] = {
+                "index": i,
+                "customer_id": customer_id,
+                "status": "error",
+                "detail": "No risk snapshot found for this customer. Refresh risk first.",
+            }
+            continue
+
+        alert_id, customer_name = alert
+        results[i] = {
+            "index": i,
+            "customer_id": customer_id,
+            "status": "sent",
+            "alert_id": alert_id,
+            "customer_name": customer_name,
+        }
+
+    sent = sum(1 for r in results if r["status"] == "sent")
+    return {
+        "sent": sent,
+        "failed": len(results) - sent,
         "email_sent_to": settings.email_to,
+        "results": results,
     }
 
 
 # GET /alerts
 @app.get("/alerts")
-def alerts_history(db: Session = Depends(get_db)):
-    rows = alerts_crud.get_alerts(db)
-
-    return [
-        {
-            "id": a.id,
-            "customer_id": a.customer_id,
-            "customer_name": a.customer_name,
-            "message": a.message,
-            "status": a.status,
-            "timestamp": a.timestamp,
-        }
-        for a in rows
-    ]
+async def alerts_history(
+    response: Response,
+    limit: int = Query(200, ge=1, le=1000),
+    cursor: str | None = None,
+    customer_id: int | None = None,
+    status: str | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+    db: AsyncSession = Depends(get_async_db),
+):
+    try:
+        rows, next_cursor = await db.run_sync(
+            alerts_crud.list_alerts_page,
+            limit,
+            cursor=cursor,
+            customer_id=customer_id,
+            status=status,
+            since=since,
+            until=until,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # pass it back as ?cursor= to get the next (older) page
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+
+    return rows
     
 
+@app.get("/metrics")
+async def prometheus_metrics():
+    # email queue depth is read from the DB during the scrape
+    body, content_type = await run_in_threadpool(metrics.render)
+    return Response(content=body, media_type=content_type)
+
+
 @app.get("/health")
-def health():
+async def health():
     return {"status": "ok"}
     
 
@@ -0,0 +1,161 @@
+"""
+Synthetic Dolibarr REST stand-in for benchmarks.
+
+Serves the subset of the API the app reads (thirdparties and invoices,
+paged with limit/page, 404 on an empty page, status / thirdparty_ids
+filters) from a generated tenant, with optional per-request latency.
+"""
+import json
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+from urllib.parse import parse_qs, urlparse
+
+
+API_PREFIX = "/api/index.php"
+API_KEY = "bench-key"
+
+
+@dataclass
+class Tenant:
+    customers: List[Dict]
+    invoices: List[Dict]
+    by_customer: Dict[int, List[Dict]] = field(default_factory=dict)
+
+    def __post_init__(self):
+        for inv in self.invoices:
+            self.by_customer.setdefault(inv["socid"], []).append(inv)
+
+
+def make_tenant(customers: int, invoices_per_customer: int, seed: int = 42) -> Tenant:
+    """
+    customers x invoices_per_customer invoices, about half unpaid and a
+    quarter of those overdue, with due dates in the formats Dolibarr emits.
+    """
+    rng = random.Random(seed)
+    today = date.today()
+    modified = int(time.time()) - 86400
+
+    rows, invoices = [], []
+    for cid in range(1, customers + 1):
+        rows.append({"id": cid, "name": f"Customer {cid:06d}", "date_modification": modified})
+        for n in range(invoices_per_customer):
+            paid = rng.random() < 0.5
+            due = today + timedelta(days=rng.randint(-60, 180) if rng.random() < 0.25 else rng.randint(1, 180))
+            invoices.append({
+                "id": len(invoices) + 1,
+                "ref": f"FA{cid:06d}-{n:04d}",
+                "socid": cid,
+                "total_ttc": round(rng.uniform(10, 2500), 2),
+                "paid": 1 if paid else 0,
+                "statut": 2 if paid else 1,
+                "date_lim_reglement": due.isoformat() if n % 2 else due.strftime("%d/%m/%Y"),
+                "date_modification": modified,
+            })
+    return Tenant(rows, invoices)
+
+
+class FakeDolibarr:
+    """
+    Threaded HTTP server on 127.0.0.1 serving a Tenant.
+
+    latency_ms is slept before every response; max_limit caps the page size
+    a client may ask for, like Dolibarr's own API limit.
+    """
+
+    def __init__(self, tenant: Tenant, latency_ms: float = 0, max_limit: int = 1000):
+        self.tenant = tenant
+        self.latency = latency_ms / 1000
+        self.max_limit = max_limit
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def start(self) -> "FakeDolibarr":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-dolibarr", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _count(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def _page(self, rows: List[Dict], query: Dict[str, str]) -> List[Dict] | None:
+        limit = min(int(query.get("limit", 100)), self.max_limit)
+        start = int(query.get("page", 0)) * limit
+        page = rows[start:start + limit]
+        return page or None
+
+    def route(self, path: str, query: Dict[str, str]):
+        """(status, payload) for a GET on path."""
+        tenant = self.tenant
+        if path == "/thirdparties":
+            page = self._page(tenant.customers, query)
+        elif m := re.fullmatch(r"/thirdparties/(\d+)", path):
+            cid = int(m.group(1))
+            page = tenant.customers[cid - 1] if 0 < cid <= len(tenant.customers) else None
+        elif path == "/invoices":
+            if "thirdparty_ids" in query:
+                rows = tenant.by_customer.get(int(query["thirdparty_ids"]), [])
+            else:
+                rows = tenant.invoices
+            if query.get("status") == "unpaid":
+                rows = [inv for inv in rows if not inv["paid"]]
+            page = self._page(rows, query)
+        else:
+            return 404, {"error": {"code": 404, "message": "Not found"}}
+
+        if page is None:
+            return 404, {"error": {"code": 404, "message": "No result found"}}
+        return 200, page
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, like a real server
+
+            def do_GET(self):
+                fake._count()
+                if fake.latency:
+                    time.sleep(fake.latency)
+
+                if self.headers.get("DOLAPIKEY") != API_KEY:
+                    status, payload = 401, {"error": {"code": 401, "message": "Unauthorized"}}
+                else:
+                    url = urlparse(self.path)
+                    query = {k: v[0] for k, v in parse_qs(url.query).items()}
+                    status, payload = fake.route(url.path.removeprefix(API_PREFIX), query)
+
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,264 @@
+"""
+Benchmark harness: runs the app against a synthetic Dolibarr and prints JSON.
+
+    python -m benchmarks.run --customers 500 --invoices 20 --latency-ms 5 --output bench.json
+    python -m benchmarks.run --customers 500 --invoices 20 --baseline bench.json
+
+Measures end-to-end GET /risk/customers?refresh=true, RiskService._calc_risk
+throughput (python and numpy engines), bulk snapshot upsert time and
+GET /alerts page latency. With --baseline, medians are compared to an
+earlier run and the exit code is 1 when one got slower than --tolerance.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List
+
+from benchmarks.fake_dolibarr import API_KEY, FakeDolibarr, make_tenant
+
+
+def summarize(samples: List[float]) -> Dict:
+    ordered = sorted(samples)
+    return {
+        "runs": len(ordered),
+        "min": ordered[0],
+        "median": statistics.median(ordered),
+        "p95": ordered[min(len(ordered) - 1, round(0.95 * (len(ordered) - 1)))],
+        "mean": statistics.fmean(ordered),
+        "max": ordered[-1],
+    }
+
+
+def timed(fn: Callable, repeat: int) -> List[float]:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def _git_revision() -> str | None:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.stdout.strip()
+
+
+def _configure_app(args, base_url: str, workdir: str) -> None:
+    # settings are read at import time, so this runs before any app module is imported
+    os.environ.update({
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        "DOLIBARR_BASE_URL": base_url,
+        "DOLIBARR_API_KEY": API_KEY,
+        "DOLIBARR_PAGE_SIZE": str(args.page_size),
+        "DOLIBARR_CONCURRENCY": str(args.concurrency),
+        "DOLIBARR_MAX_CONCURRENCY": str(args.concurrency),
+        "DOLIBARR_RATE_LIMIT": str(args.rate_limit),
+        "DOLIBARR_CACHE_TTL_SECONDS": "0",  # measure real crawls
+        "RISK_FETCH_MODE": args.fetch_mode,
+        "RISK_REFRESH_INTERVAL_SECONDS": "0",
+        "AUTO_ALERTS_ENABLED": "0",
+        "EMAIL_HOST": "",
+        "EMAIL_TO": "",
+    })
+
+
+def bench_risk_customers(args, fake: FakeDolibarr) -> Dict:
+    from fastapi.testclient import TestClient
+    from app import app
+
+    requests_before = fake.requests
+    with TestClient(app) as client:
+        def refresh():
+            response = client.get("/risk/customers", params={"refresh": "true"})
+            response.raise_for_status()
+
+        samples = timed(refresh, args.repeat)
+
+    return {
+        "seconds": summarize(samples),
+        "dolibarr_requests_per_run": (fake.requests - requests_before) / args.repeat,
+        "fetch_mode": args.fetch_mode,
+    }
+
+
+def bench_calc_risk(args, tenant) -> Dict:
+    from risk_service import RiskService
+    from risk_vectorized import calc_risk_many
+
+    groups = [tenant.by_customer.get(c["id"], []) for c in tenant.customers]
+    service = RiskService(client=None)
+    invoices = len(tenant.invoices)
+
+    python_samples = timed(lambda: [service._calc_risk(g) for g in groups], args.repeat)
+    numpy_samples = timed(lambda: calc_risk_many(groups, service._parse_date), args.repeat)
+
+    return {
+        "python_seconds": summarize(python_samples),
+        "python_invoices_per_second": invoices / statistics.median(python_samples),
+        "numpy_seconds": summarize(numpy_samples),
+        "numpy_invoices_per_second": invoices / statistics.median(numpy_samples),
+    }
+
+
+def bench_snapshot_upsert(args, tenant) -> Dict:
+    from db import SessionLocal
+    from models import CustomerRiskSnapshot
+    from crud import risk_crud
+    from risk_service import RiskService
+
+    service = RiskService(client=None)
+    rows = [
+        {"customer_id": c["id"], "customer_name": c["name"], **service._calc_risk(tenant.by_customer.get(c["id"], []))}
+        for c in tenant.customers
+    ]
+
+    db = SessionLocal()
+    try:
+        def insert():
+            db.query(CustomerRiskSnapshot).delete()
+            db.commit()
+            started = time.perf_counter()
+            risk_crud.bulk_upsert_customer_risk_snapshots(db, rows)
+            return time.perf_counter() - started
+
+        insert_samples = [insert() for _ in range(args.repeat)]
+        update_samples = timed(lambda: risk_crud.bulk_upsert_customer_risk_snapshots(db, rows), args.repeat)
+    finally:
+        db.close()
+
+    return {
+        "rows": len(rows),
+        "insert_seconds": summarize(insert_samples),
+        "update_seconds": summarize(update_samples),
+    }
+
+
+def bench_alerts_query(args) -> Dict:
+    from fastapi.testclient import TestClient
+    from app import app
+    from db import SessionLocal
+    from models import Alert
+
+    db = SessionLocal()
+    try:
+        db.query(Alert).delete()
+        db.bulk_insert_mappings(Alert, [
+            {"customer_id": i % 1000 + 1, "customer_name": f"Customer {i % 1000 + 1:06d}",
+             "message": "Automatic risk alert", "status": "sent"}
+            for i in range(args.alerts)
+        ])
+        db.commit()
+    finally:
+        db.close()
+
+    first_page, next_pages = [], []
+    with TestClient(app) as client:
+        for _ in range(args.repeat):
+            started = time.perf_counter()
+            response = client.get("/alerts", params={"limit": 200})
+            first_page.append(time.perf_counter() - started)
+
+            cursor = response.headers.get("X-Next-Cursor")
+            for _ in range(args.pages):
+                if not cursor:
+                    break
+                started = time.perf_counter()
+                response = client.get("/alerts", params={"limit": 200, "cursor": cursor})
+                next_pages.append(time.perf_counter() - started)
+                cursor = response.headers.get("X-Next-Cursor")
+
+    return {
+        "alerts": args.alerts,
+        "first_page_seconds": summarize(first_page),
+        "next_page_seconds": summarize(next_pages) if next_pages else None,
+    }
+
+
+def compare(current: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Medians (seconds) that got slower than baseline * (1 + tolerance)."""
+    regressions = []
+    for bench, metrics in current["results"].items():
+        for name, value in metrics.items():
+            if not isinstance(value, dict) or "median" not in value:
+                continue
+            old = baseline.get("results", {}).get(bench, {}).get(name)
+            if not isinstance(old, dict) or not old.get("median"):
+                continue
+            ratio = value["median"] / old["median"]
+            if ratio > 1 + tolerance:
+                regressions.append(f"{bench}.{name}: {old['median']:.4f}s -> {value['median']:.4f}s (x{ratio:.2f})")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--customers", type=int, default=200)
+    parser.add_argument("--invoices", type=int, default=10, help="invoices per customer")
+    parser.add_argument("--latency-ms", type=float, default=0, help="delay added to every fake Dolibarr response")
+    parser.add_argument("--max-limit", type=int, default=1000, help="largest page the fake server returns")
+    parser.add_argument("--page-size", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rate-limit", type=float, default=0, help="Dolibarr requests per second, 0 = unlimited")
+    parser.add_argument("--fetch-mode", choices=("per_customer", "bulk"), default="per_customer")
+    parser.add_argument("--alerts", type=int, default=10000, help="alerts seeded for the /alerts benchmark")
+    parser.add_argument("--pages", type=int, default=5, help="cursor pages walked per /alerts run")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the JSON results here instead of stdout")
+    parser.add_argument("--baseline", help="earlier results to compare medians against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown vs baseline (0.2 = 20%%)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    tenant = make_tenant(args.customers, args.invoices, seed=args.seed)
+
+    with tempfile.TemporaryDirectory() as workdir, \
+         FakeDolibarr(tenant, latency_ms=args.latency_ms, max_limit=args.max_limit) as fake:
+        _configure_app(args, fake.base_url, workdir)
+
+        report = {
+            "meta": {
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "git_revision": _git_revision(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "params": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")},
+            },
+            "results": {
+                "risk_customers_e2e": bench_risk_customers(args, fake),
+                "calc_risk": bench_calc_risk(args, tenant),
+                "snapshot_upsert": bench_snapshot_upsert(args, tenant),
+                "alerts_query": bench_alerts_query(args),
+            },
+        }
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+from datetime import date
+from typing import Dict, List, Tuple
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from models import CustomerInvoiceAggregate, CustomerRiskSnapshot, OpenInvoice
+from crud.batching import chunks
+
+# (invoice_id, customer_id, (amount, due_date) while open / None once paid or gone)
+InvoiceChange = Tuple[int, int, Tuple[float, date | None] | None]
+
+#GET
+def get_aggregates(db: Session, customer_ids: List[int]) -> Dict[int, CustomerInvoiceAggregate]:
+    aggregates = {}
+    for chunk in chunks(customer_ids):
+        for agg in db.query(CustomerInvoiceAggregate).filter(CustomerInvoiceAggregate.customer_id.in_(chunk)):
+            aggregates[agg.customer_id] = agg
+    return aggregates
+
+def get_customers_turning_overdue(db: Session, today: date) -> List[int]:
+    """Customers with an open invoice now past due whose stored snapshot still says not overdue."""
+    rows = db.query(CustomerInvoiceAggregate.customer_id)\
+             .join(CustomerRiskSnapshot, CustomerRiskSnapshot.customer_id == CustomerInvoiceAggregate.customer_id)\
+             .filter(CustomerInvoiceAggregate.min_open_due_date < today)\
+             .filter(CustomerRiskSnapshot.has_overdue.is_(False))\
+             .order_by(CustomerInvoiceAggregate.customer_id)\
+             .all()
+    return [cid for (cid,) in rows]
+
+def _stored_invoices(db: Session, column, ids) -> Dict[int, OpenInvoice]:
+    """{invoice_id: OpenInvoice} of the rows whose `column` is in ids."""
+    stored = {}
+    for chunk in chunks(ids):
+        for inv in db.query(OpenInvoice).filter(column.in_(chunk)):
+            stored[inv.invoice_id] = inv
+    return stored
+
+#SAVE
+def _store_changes(db: Session, changes: Dict[int, tuple], stored: Dict[int, OpenInvoice]) -> set:
+    """
+    Write {invoice_id: (customer_id, state)} to open_invoices, skipping
+    invoices whose (customer, amount, due) is unchanged.
+    Returns the customers whose aggregate has to be rebuilt.
+    """
+    touched = set()
+    for invoice_id, (cid, state) in changes.items():
+        prev = stored.get(invoice_id)
+        if state is None:
+            if prev is not None:
+                touched.add(prev.customer_id)
+                db.delete(prev)
+            continue
+
+        amount, due = state
+        if prev is None:
+            db.add(OpenInvoice(invoice_id=invoice_id, customer_id=cid, amount=amount, due_date=due))
+            touched.add(cid)
+        elif (prev.customer_id, prev.amount, prev.due_date) != (cid, amount, due):
+            touched.update((prev.customer_id, cid))
+            prev.customer_id, prev.amount, prev.due_date = cid, amount, due
+    return touched
+
+def _rebuild_aggregates(db: Session, customer_ids: List[int]) -> None:
+    """Recompute the aggregates of customer_ids from open_invoices, one grouped query per chunk."""
+    aggregates = get_aggregates(db, customer_ids)
+    for chunk in chunks(customer_ids):
+        totals = {
+            cid: (count, debt, min_due)
+            for cid, count, debt, min_due in db.query(
+                OpenInvoice.customer_id,
+                func.count(OpenInvoice.invoice_id),
+                func.sum(OpenInvoice.amount),
+                func.min(OpenInvoice.due_date),
+            ).filter(OpenInvoice.customer_id.in_(chunk)).group_by(OpenInvoice.customer_id)
+        }
+        for cid in chunk:
+            agg = aggregates.get(cid)
+            if agg is None:
+                agg = aggregates[cid] = CustomerInvoiceAggregate(customer_id=cid)
+                db.add(agg)
+            # nothing open: exactly zero, no float residue
+            agg.unpaid_count, agg.total_open_debt, agg.min_open_due_date = totals.get(cid, (0, 0.0, None))
+
+def apply_invoice_changes(db: Session, changes: List[InvoiceChange], commit: bool = True) -> List[int]:
+    """
+    Apply single invoice changes to open_invoices. Only the customers an
+    actual change touched get their aggregate rebuilt, from their open
+    invoices, so repeated identical data never moves the stored totals.
+    Returns the customer ids whose aggregate was rebuilt.
+    """
+    # last change of an invoice wins, it holds the invoice's final state
+    pending = {invoice_id: (cid, state) for invoice_id, cid, state in changes}
+    if not pending:
+        return []
+
+    touched = _store_changes(db, pending, _stored_invoices(db, OpenInvoice.invoice_id, pending))
+    db.flush()
+    _rebuild_aggregates(db, sorted(touched))
+
+    if commit:
+        db.commit()
+    return sorted(touched)
+
+def replace_customer_invoices(
+    db: Session,
+    open_by_customer: Dict[int, Dict[int, Tuple[float, date | None]]],
+    commit: bool = True,
+) -> List[int]:
+    """
+    open_by_customer is the full set of open invoices ({invoice_id: (amount, due)})
+    of each listed customer, e.g. from a crawl. Invoices stored for those
+    customers but missing from their set are treated as paid.
+    """
+    stored = _stored_invoices(db, OpenInvoice.customer_id, open_by_customer)
+    pending = {invoice_id: (inv.customer_id, None) for invoice_id, inv in stored.items()}
+    for cid, invoices in open_by_customer.items():
+        for invoice_id, state in invoices.items():
+            pending[invoice_id] = (cid, state)
+
+    # new here, or moved over from a customer outside this set
+    stored.update(_stored_invoices(db, OpenInvoice.invoice_id, [i for i in pending if i not in stored]))
+
+    touched = _store_changes(db, pending, stored)
+    db.flush()
+    _rebuild_aggregates(db, sorted(touched))
+
+    if commit:
+        db.commit()
+    return sorted(touched)
@@ -1,11 +1,22 @@
+from datetime import datetime, timezone
+from typing import List, Tuple
+from sqlalchemy import and_, or_
 from sqlalchemy.orm import Session
-from models import Alert, CustomerRiskSnapshot
+from models import Alert, AlertCooldown, CustomerRiskSnapshot
+from crud.batching import CHUNK_SIZE, chunks
+from crud.pagination import encode_cursor, decode_cursor
+
+ALERT_COLUMNS = (
+    Alert.id, Alert.customer_id, Alert.customer_name,
+    Alert.message, Alert.status, Alert.timestamp,
+)
 
 #SAVE / UPSERT
 def create_alert_from_snapshot(
     db: Session,
     customer_id: int,
     message: str,
+    commit: bool = True,
 ) -> Alert:
     snap = db.query(CustomerRiskSnapshot)\
              .filter(CustomerRiskSnapshot.customer_id == customer_id)\
@@ -22,9 +33,52 @@ def create_alert_from_snapshot(
     )
 
     db.add(alert)
-    db.commit()
+    if commit:
+        db.commit()
+    else:
+        db.flush()  # assigns alert.id
     return alert
 
+def create_alerts_from_snapshots(
+    db: Session,
+    items: List[Tuple[int, str]],
+    commit: bool = True,
+    chunk_size: int = CHUNK_SIZE,
+) -> List[Alert | None]:
+    """
+    Bulk version of create_alert_from_snapshot for (customer_id, message) pairs.
+    Customer names come from one IN query per chunk and all alerts go into a
+    single transaction. Returns one entry per item, None when the customer
+    has no snapshot.
+    """
+    ids = list({cid for cid, _ in items})
+    names = {}
+    for chunk in chunks(ids, chunk_size):
+        names.update(
+            db.query(CustomerRiskSnapshot.customer_id, CustomerRiskSnapshot.customer_name)
+              .filter(CustomerRiskSnapshot.customer_id.in_(chunk))
+              .all()
+        )
+
+    alerts = []
+    for customer_id, message in items:
+        if customer_id not in names:
+            alerts.append(None)
+            continue
+        alerts.append(Alert(
+            customer_id=customer_id,
+            customer_name=names[customer_id],
+            message=message,
+            status="sent",
+        ))
+
+    db.add_all([a for a in alerts if a is not None])
+    if commit:
+        db.commit()
+    else:
+        db.flush()  # assigns alert ids
+    return alerts
+
 #GET
 def get_alerts(db: Session, limit: int = 200):
     return db.query(Alert)\
@@ -32,6 +86,71 @@ def get_alerts(db: Session, limit: int = 200):
              .limit(limit)\
              .all()
 
+def _timestamp_param(db: Session, ts: datetime) -> datetime:
+    # SQLite has no time zones and CURRENT_TIMESTAMP is UTC: compare as naive UTC
+    if ts.tzinfo is not None and db.get_bind().dialect.name == "sqlite":
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return ts
+
+def list_alerts_page(
+    db: Session,
+    limit: int = 200,
+    *,
+    cursor: str | None = None,
+    customer_id: int | None = None,
+    status: str | None = None,
+    since: datetime | None = None,
+    until: datetime | None = None,
+) -> Tuple[List[dict], str | None]:
+    """
+    Newest-first page of alerts as plain dicts, keyset-paginated on
+    (timestamp, id). Returns (rows, next_cursor); next_cursor is None on
+    the last page. Raises ValueError for a malformed cursor.
+    """
+    q = db.query(*ALERT_COLUMNS)
+
+    if customer_id is not None:
+        q = q.filter(Alert.customer_id == customer_id)
+    if status is not None:
+        q = q.filter(Alert.status == status)
+    if since is not None:
+        q = q.filter(Alert.timestamp >= _timestamp_param(db, since))
+    if until is not None:
+        q = q.filter(Alert.timestamp < _timestamp_param(db, until))
+
+    if cursor:
+        try:
+            last_ts, last_id = decode_cursor(cursor)
+            last_ts = _timestamp_param(db, datetime.fromisoformat(last_ts))
+            last_id = int(last_id)
+        except (TypeError, ValueError):
+            raise ValueError("Invalid cursor")
+
+        q = q.filter(or_(
+            Alert.timestamp < last_ts,
+            and_(Alert.timestamp == last_ts, Alert.id < last_id),
+        ))
+
+    rows = q.order_by(Alert.timestamp.desc(), Alert.id.desc())\
+            .limit(limit + 1)\
+            .all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last.timestamp.isoformat(), last.id)
+
+    return [row._asdict() for row in rows], next_cursor
+
+def get_cooldowns(db: Session, customer_ids: List[int], chunk_size: int = CHUNK_SIZE) -> dict:
+    """{(customer_id, rule): AlertCooldown} via the (customer_id, rule) primary key."""
+    cooldowns = {}
+    for chunk in chunks(customer_ids, chunk_size):
+        for c in db.query(AlertCooldown).filter(AlertCooldown.customer_id.in_(chunk)):
+            cooldowns[(c.customer_id, c.rule)] = c
+    return cooldowns
+
 def get_alert_by_id(db: Session, alert_id: int) -> Alert | None:
     return db.query(Alert).filter(Alert.id == alert_id).first()
 
@@ -0,0 +1,17 @@
+from typing import Iterable, Iterator, List
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+# rows per IN list / multi-row VALUES, well under the drivers' bound-parameter limits
+CHUNK_SIZE = 500
+
+
+def chunks(items: Iterable, size: int = CHUNK_SIZE) -> Iterator[List]:
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def upsert_insert(db: Session):
+    """insert() with ON CONFLICT support for the session's database, None when it has none."""
+    return {"sqlite": sqlite.insert, "postgresql": postgresql.insert}.get(db.get_bind().dialect.name)
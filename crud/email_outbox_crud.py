@@ -0,0 +1,94 @@
+from datetime import timedelta
+from typing import List
+from sqlalchemy.orm import Session
+from models import OutboundEmail, utcnow
+
+#SAVE
+def enqueue_email(
+    db: Session,
+    *,
+    to_email: str,
+    subject: str,
+    body: str,
+    from_name: str,
+    alert_id: int | None = None,
+    commit: bool = True,
+) -> OutboundEmail:
+    email = OutboundEmail(
+        alert_id=alert_id,
+        to_email=to_email,
+        subject=subject,
+        body=body,
+        from_name=from_name,
+        status="pending",
+        next_attempt_at=utcnow(),
+    )
+    db.add(email)
+
+    if commit:
+        db.commit()
+    return email
+
+#CLAIM
+def claim_due_emails(db: Session, limit: int, lease_seconds: int) -> List[OutboundEmail]:
+    """
+    Lease up to `limit` due emails for sending. Rows left in "sending" by a
+    crashed worker become claimable again once their lease runs out.
+    Each row is claimed with a conditional UPDATE, so two workers never
+    get the same email.
+    """
+    now = utcnow()
+    candidates = db.query(OutboundEmail.id, OutboundEmail.status)\
+                   .filter(OutboundEmail.status.in_(("pending", "sending")))\
+                   .filter(OutboundEmail.next_attempt_at <= now)\
+                   .order_by(OutboundEmail.next_attempt_at, OutboundEmail.id)\
+                   .limit(limit)\
+                   .all()
+
+    claimed_ids = []
+    lease_until = now + timedelta(seconds=lease_seconds)
+    for email_id, status in candidates:
+        updated = db.query(OutboundEmail)\
+                    .filter(OutboundEmail.id == email_id, OutboundEmail.status == status,
+                            OutboundEmail.next_attempt_at <= now)\
+                    .update({"status": "sending", "next_attempt_at": lease_until}, synchronize_session=False)
+        if updated:
+            claimed_ids.append(email_id)
+    db.commit()
+
+    if not claimed_ids:
+        return []
+    return db.query(OutboundEmail).filter(OutboundEmail.id.in_(claimed_ids)).order_by(OutboundEmail.id).all()
+
+# UPDATE
+def mark_sent(db: Session, email: OutboundEmail) -> None:
+    email.status = "sent"
+    email.attempts += 1
+    email.sent_at = utcnow()
+    email.last_error = None
+    db.commit()
+
+def mark_attempt_failed(
+    db: Session,
+    email: OutboundEmail,
+    error: str,
+    *,
+    max_attempts: int,
+    retry_base_seconds: float,
+) -> None:
+    """Back off exponentially (base, 2*base, 4*base, ...) until max_attempts."""
+    email.attempts += 1
+    email.last_error = error
+
+    if email.attempts >= max_attempts:
+        email.status = "failed"
+    else:
+        email.status = "pending"
+        delay = retry_base_seconds * (2 ** (email.attempts - 1))
+        email.next_attempt_at = utcnow() + timedelta(seconds=delay)
+
+    db.commit()
+
+#GET
+def count_pending(db: Session) -> int:
+    return db.query(OutboundEmail).filter(OutboundEmail.status.in_(("pending", "sending"))).count()
@@ -0,0 +1,107 @@
+from datetime import date, timedelta
+from typing import Dict, List
+from sqlalchemy import func, insert, select
+from sqlalchemy.orm import Session
+from models import CustomerRiskHistory, utcnow
+from crud.batching import chunks
+
+HISTORY_FIELDS = ("unpaid_count", "total_open_debt", "risk_score", "risk_level")
+
+#SAVE
+def record_changes(db: Session, previous: Dict[int, dict], results: List[dict], commit: bool = True) -> int:
+    """
+    Append a history row for every result that differs from its previous
+    snapshot (or has none). Unchanged customers write nothing.
+    """
+    now = utcnow()
+    rows = []
+    for r in results:
+        prev = previous.get(r["customer_id"])
+        if prev and all(prev[f] == r[f] for f in HISTORY_FIELDS):
+            continue
+        rows.append({
+            "customer_id": r["customer_id"],
+            "recorded_on": now.date(),
+            "recorded_at": now,
+            **{f: r[f] for f in HISTORY_FIELDS},
+        })
+
+    if rows:
+        db.execute(insert(CustomerRiskHistory), rows)
+    if commit:
+        db.commit()
+    return len(rows)
+
+#GET
+def get_customer_history(db: Session, customer_id: int, days: int = 90) -> List[dict]:
+    """
+    Points for the last `days` days, oldest first. The last change before
+    the window is included too, so the series starts with the value that
+    was in effect at the window start.
+    """
+    since = utcnow() - timedelta(days=days)
+    columns = (CustomerRiskHistory.recorded_at,) + tuple(getattr(CustomerRiskHistory, f) for f in HISTORY_FIELDS)
+    base = db.query(*columns).filter(CustomerRiskHistory.customer_id == customer_id)
+
+    before = base.filter(CustomerRiskHistory.recorded_at < since)\
+                 .order_by(CustomerRiskHistory.recorded_at.desc())\
+                 .first()
+    rows = base.filter(CustomerRiskHistory.recorded_at >= since)\
+               .order_by(CustomerRiskHistory.recorded_at)\
+               .all()
+
+    return [row._asdict() for row in ([before] if before else []) + rows]
+
+# DELETE / DOWNSAMPLE
+def _delete_ids(db: Session, ids: List[int]) -> None:
+    for chunk in chunks(ids):
+        db.query(CustomerRiskHistory).filter(CustomerRiskHistory.id.in_(chunk)).delete(synchronize_session=False)
+
+def compact_history(
+    db: Session,
+    full_resolution_days: int,
+    retention_days: int,
+    today: date | None = None,
+) -> dict:
+    """
+    Keep the table bounded: rows older than retention_days are dropped,
+    rows older than full_resolution_days are downsampled to the last change
+    per customer per ISO week.
+
+    The newest row of each customer before the retention cutoff is kept:
+    history only stores changes, so it holds the value still in effect
+    (for a customer stable since then, their only row).
+    """
+    today = today or utcnow().date()
+    retention_cutoff = today - timedelta(days=retention_days)
+    full_cutoff = today - timedelta(days=full_resolution_days)
+
+    # ascending id = write order, as for the downsampling below
+    anchors = select(func.max(CustomerRiskHistory.id))\
+                .where(CustomerRiskHistory.recorded_on < retention_cutoff)\
+                .group_by(CustomerRiskHistory.customer_id)
+    anchor_ids = set(db.scalars(anchors))
+
+    expired = db.query(CustomerRiskHistory)\
+                .filter(CustomerRiskHistory.recorded_on < retention_cutoff)\
+                .filter(CustomerRiskHistory.id.notin_(anchors))\
+                .delete(synchronize_session=False)
+
+    # ascending id = write order, so the last id seen per bucket is the one to keep
+    keep = {}
+    old_ids = []
+    rows = db.query(CustomerRiskHistory.id, CustomerRiskHistory.customer_id, CustomerRiskHistory.recorded_on)\
+             .filter(CustomerRiskHistory.recorded_on < full_cutoff)\
+             .order_by(CustomerRiskHistory.id)\
+             .yield_per(1000)
+    for row_id, customer_id, recorded_on in rows:
+        week = recorded_on.isocalendar()[:2]
+        old_ids.append(row_id)
+        keep[(customer_id, week)] = row_id
+
+    kept = set(keep.values()) | anchor_ids
+    downsampled = [row_id for row_id in old_ids if row_id not in kept]
+    _delete_ids(db, downsampled)
+
+    db.commit()
+    return {"expired": expired, "downsampled": len(downsampled)}
@@ -0,0 +1,147 @@
+import json
+from typing import Dict, Iterator, List
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+from models import MirrorInvoice, MirrorThirdparty
+from crud.batching import CHUNK_SIZE, chunks, upsert_insert
+
+INVOICE_STATUSES = {"draft": 0, "unpaid": 1, "paid": 2, "cancelled": 3}
+
+
+def _int_or_none(value) -> int | None:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _thirdparty_values(row: Dict) -> Dict:
+    return {
+        "id": int(row["id"]),
+        "name": row.get("name") or row.get("nom"),
+        "date_modification": _int_or_none(row.get("date_modification")),
+        "data": json.dumps(row),
+    }
+
+
+def _invoice_values(row: Dict) -> Dict:
+    return {
+        "id": int(row["id"]),
+        "customer_id": int(row["socid"]),
+        "status": _int_or_none(row.get("statut", row.get("status"))),
+        "paid": _int_or_none(row.get("paid")),
+        "date_modification": _int_or_none(row.get("date_modification")),
+        "data": json.dumps(row),
+    }
+
+
+def _status_filter(query, status: str | None):
+    if status == "unpaid":
+        # rows stored without a status fall back to the paid flag
+        return query.filter(or_(MirrorInvoice.status == 1, MirrorInvoice.status.is_(None)))\
+                    .filter(or_(MirrorInvoice.paid == 0, MirrorInvoice.paid.is_(None)))
+    if status is not None:
+        return query.filter(MirrorInvoice.status == INVOICE_STATUSES[status])
+    return query
+
+
+def matches_status(row: Dict, status: str | None) -> bool:
+    """_status_filter for a single Dolibarr invoice row."""
+    code = _int_or_none(row.get("statut", row.get("status")))
+    if status == "unpaid":
+        return code in (1, None) and _int_or_none(row.get("paid")) in (0, None)
+    if status is not None:
+        return code == INVOICE_STATUSES[status]
+    return True
+
+
+def _upsert(db: Session, model, values: List[Dict]) -> None:
+    columns = [c for c in values[0] if c != "id"]
+    insert = upsert_insert(db)
+    for chunk in chunks(values):
+        if insert is not None:
+            stmt = insert(model).values(chunk)
+            db.execute(stmt.on_conflict_do_update(
+                index_elements=[model.id],
+                set_={col: stmt.excluded[col] for col in columns},
+            ))
+            continue
+        for v in chunk:
+            db.merge(model(**v))
+
+#SAVE / UPSERT
+def upsert_thirdparties(db: Session, rows: List[Dict], commit: bool = True) -> int:
+    values = list({v["id"]: v for v in map(_thirdparty_values, rows)}.values())
+    if values:
+        _upsert(db, MirrorThirdparty, values)
+    if commit:
+        db.commit()
+    return len(values)
+
+def upsert_invoices(db: Session, rows: List[Dict], commit: bool = True) -> int:
+    values = list({v["id"]: v for v in map(_invoice_values, rows)}.values())
+    if values:
+        _upsert(db, MirrorInvoice, values)
+    if commit:
+        db.commit()
+    return len(values)
+
+#GET
+def list_thirdparties(db: Session) -> List[Dict]:
+    return [json.loads(data) for (data,) in db.query(MirrorThirdparty.data).order_by(MirrorThirdparty.id)]
+
+def get_thirdparty(db: Session, customer_id: int) -> Dict | None:
+    row = db.query(MirrorThirdparty.data).filter(MirrorThirdparty.id == customer_id).first()
+    return json.loads(row.data) if row else None
+
+def iter_thirdparties(db: Session, modified_since: int | None = None) -> Iterator[Dict]:
+    query = db.query(MirrorThirdparty.data)
+    if modified_since is not None:
+        query = query.filter(MirrorThirdparty.date_modification >= modified_since)
+    for (data,) in query.order_by(MirrorThirdparty.id).yield_per(CHUNK_SIZE):
+        yield json.loads(data)
+
+def iter_invoices(db: Session, status: str | None = "unpaid", modified_since: int | None = None) -> Iterator[Dict]:
+    """Same filters as DolibarrClient.iter_invoices."""
+    query = _status_filter(db.query(MirrorInvoice.data), status)
+    if modified_since is not None:
+        query = query.filter(MirrorInvoice.date_modification >= modified_since)
+    for (data,) in query.order_by(MirrorInvoice.id).yield_per(CHUNK_SIZE):
+        yield json.loads(data)
+
+def invoices_by_customers(db: Session, customer_ids: List[int], status: str | None = None) -> Dict[int, List[Dict]]:
+    """{customer_id: [invoice, ...]} in invoice id order, one query per chunk of customers."""
+    grouped = {cid: [] for cid in customer_ids}
+    for chunk in chunks(customer_ids):
+        query = db.query(MirrorInvoice.customer_id, MirrorInvoice.data)\
+                  .filter(MirrorInvoice.customer_id.in_(chunk))
+        rows = _status_filter(query, status).order_by(MirrorInvoice.id)
+        for cid, data in rows:
+            grouped[cid].append(json.loads(data))
+    return grouped
+
+def invoice_ids(db: Session) -> Dict[int, int]:
+    """{invoice_id: customer_id} of every mirrored invoice."""
+    return dict(db.query(MirrorInvoice.id, MirrorInvoice.customer_id))
+
+def thirdparty_ids(db: Session) -> List[int]:
+    return [cid for (cid,) in db.query(MirrorThirdparty.id)]
+
+def counts(db: Session) -> Dict[str, int]:
+    return {
+        "thirdparties": db.query(MirrorThirdparty.id).count(),
+        "invoices": db.query(MirrorInvoice.id).count(),
+    }
+
+# DELETE
+def delete_invoices(db: Session, ids: List[int], commit: bool = True) -> None:
+    for chunk in chunks(ids):
+        db.query(MirrorInvoice).filter(MirrorInvoice.id.in_(chunk)).delete(synchronize_session=False)
+    if commit:
+        db.commit()
+
+def delete_thirdparties(db: Session, ids: List[int], commit: bool = True) -> None:
+    for chunk in chunks(ids):
+        db.query(MirrorThirdparty).filter(MirrorThirdparty.id.in_(chunk)).delete(synchronize_session=False)
+    if commit:
+        db.commit()
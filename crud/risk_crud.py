@@ -1,5 +1,16 @@
+from typing import Iterator, List, Tuple
+from sqlalchemy import and_, or_, select
 from sqlalchemy.orm import Session
 from models import CustomerRiskSnapshot
+from crud.batching import CHUNK_SIZE, chunks, upsert_insert
+from crud.pagination import encode_cursor, decode_cursor
+from metrics import SNAPSHOT_UPSERT_SECONDS, SNAPSHOT_UPSERT_ROWS
+
+SNAPSHOT_COLUMNS = (
+    "customer_name", "unpaid_count", "total_open_debt", "has_overdue",
+    "risk_score", "risk_level", "reasons",
+)
+SNAPSHOT_SORT_KEYS = ("risk_score", "total_open_debt", "unpaid_count", "customer_id")
 
 #SAVE / UPSERT
 def upsert_customer_risk_snapshot(db: Session, data: dict) -> CustomerRiskSnapshot:
@@ -46,6 +57,70 @@ def upsert_customer_risk_snapshot(db: Session, data: dict) -> CustomerRiskSnapsh
     db.commit()
     return snap
 
+def _snapshot_values(data: dict) -> dict:
+    reasons_text = data.get("reasons", [])
+    if isinstance(reasons_text, list):
+        reasons_text = "; ".join(reasons_text)
+
+    return {
+        "customer_id": data["customer_id"],
+        "customer_name": data["customer_name"],
+        "unpaid_count": data["unpaid_count"],
+        "total_open_debt": float(data["total_open_debt"]),
+        "has_overdue": bool(data["has_overdue"]),
+        "risk_score": float(data["risk_score"]),
+        "risk_level": data["risk_level"],
+        "reasons": reasons_text,
+    }
+
+@SNAPSHOT_UPSERT_SECONDS.time()
+def bulk_upsert_customer_risk_snapshots(
+    db: Session,
+    rows: List[dict],
+    chunk_size: int = CHUNK_SIZE,
+    commit: bool = True,
+) -> int:
+    """
+    Upsert many snapshots in a single transaction (one commit, or none with commit=False).
+    rows use the same keys as upsert_customer_risk_snapshot.
+    Uses INSERT ... ON CONFLICT(customer_id) DO UPDATE on SQLite/Postgres,
+    chunked to stay under the bound-parameter limits.
+    """
+    # last row wins if a customer appears twice (ON CONFLICT can't touch a row twice)
+    values = list({r["customer_id"]: _snapshot_values(r) for r in rows}.values())
+    if not values:
+        return 0
+
+    insert = upsert_insert(db)
+    for chunk in chunks(values, chunk_size):
+        if insert is not None:
+            stmt = insert(CustomerRiskSnapshot).values(chunk)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[CustomerRiskSnapshot.customer_id],
+                set_={col: stmt.excluded[col] for col in SNAPSHOT_COLUMNS},
+            )
+            db.execute(stmt)
+            continue
+
+        # other databases: one SELECT per chunk, then update / insert in the session
+        existing = {
+            s.customer_id: s
+            for s in db.query(CustomerRiskSnapshot)
+                       .filter(CustomerRiskSnapshot.customer_id.in_([v["customer_id"] for v in chunk]))
+        }
+        for v in chunk:
+            snap = existing.get(v["customer_id"])
+            if snap:
+                for col in SNAPSHOT_COLUMNS:
+                    setattr(snap, col, v[col])
+            else:
+                db.add(CustomerRiskSnapshot(**v))
+
+    if commit:
+        db.commit()
+    SNAPSHOT_UPSERT_ROWS.inc(len(values))
+    return len(values)
+
 #GET
 def get_customer_risk(db: Session, customer_id: int) -> CustomerRiskSnapshot | None:
     return db.query(CustomerRiskSnapshot).filter(CustomerRiskSnapshot.customer_id == customer_id).first()
@@ -53,6 +128,129 @@ def get_customer_risk(db: Session, customer_id: int) -> CustomerRiskSnapshot | N
 def list_customer_risks(db: Session):
     return db.query(CustomerRiskSnapshot).order_by(CustomerRiskSnapshot.risk_score.desc()).all()
 
+def get_snapshot_states(db: Session, customer_ids: List[int], chunk_size: int = CHUNK_SIZE) -> dict:
+    """{customer_id: snapshot dict} for the given ids (missing ids are left out)."""
+    columns = [getattr(CustomerRiskSnapshot, c) for c in ("customer_id",) + SNAPSHOT_COLUMNS]
+    states = {}
+    for chunk in chunks(customer_ids, chunk_size):
+        for row in db.query(*columns).filter(CustomerRiskSnapshot.customer_id.in_(chunk)):
+            states[row.customer_id] = snapshot_to_dict(row)
+    return states
+
+def get_scoring_columns(db: Session) -> Tuple[tuple, ...]:
+    """
+    (customer_ids, unpaid_counts, total_open_debts, has_overdue, risk_scores)
+    of every snapshot as plain column tuples. Goes through the Core connection:
+    no ORM objects or ORM result processing for 100k+ rows.
+    """
+    columns = (
+        CustomerRiskSnapshot.customer_id, CustomerRiskSnapshot.unpaid_count,
+        CustomerRiskSnapshot.total_open_debt, CustomerRiskSnapshot.has_overdue,
+        CustomerRiskSnapshot.risk_score,
+    )
+    rows = db.connection().execute(select(*columns)).all()
+    if not rows:
+        return tuple(() for _ in columns)
+    return tuple(zip(*rows))
+
+def has_customer_risks(db: Session) -> bool:
+    return db.query(CustomerRiskSnapshot.id).first() is not None
+
+def snapshot_to_dict(snap) -> dict:
+    """Same shape as RiskService results (reasons back to a list).
+    Works for ORM objects and column-projected rows."""
+    return {
+        "customer_id": snap.customer_id,
+        "customer_name": snap.customer_name,
+        "unpaid_count": snap.unpaid_count,
+        "total_open_debt": snap.total_open_debt,
+        "has_overdue": snap.has_overdue,
+        "risk_score": snap.risk_score,
+        "risk_level": snap.risk_level,
+        "reasons": snap.reasons.split("; ") if snap.reasons else [],
+    }
+
+def iter_customer_risk_rows(db: Session, batch_size: int = 1000) -> Iterator[dict]:
+    """Stream snapshots as dicts straight from the columns, batch_size rows at a time."""
+    columns = [getattr(CustomerRiskSnapshot, c) for c in ("customer_id",) + SNAPSHOT_COLUMNS]
+    rows = db.query(*columns)\
+             .order_by(CustomerRiskSnapshot.risk_score.desc())\
+             .yield_per(batch_size)
+    for row in rows:
+        yield snapshot_to_dict(row)
+
+def list_customer_risk_dicts(db: Session) -> List[dict]:
+    """Every snapshot as a result dict, highest risk first."""
+    return list(iter_customer_risk_rows(db))
+
+def list_customer_risks_page(
+    db: Session,
+    limit: int = 100,
+    *,
+    cursor: str | None = None,
+    levels: List[str] | None = None,
+    min_score: float | None = None,
+    max_score: float | None = None,
+    min_debt: float | None = None,
+    max_debt: float | None = None,
+    has_overdue: bool | None = None,
+    sort: str = "risk_score",
+    descending: bool = True,
+) -> Tuple[List[dict], str | None]:
+    """
+    Filtered, sorted page of snapshots, keyset-paginated on (sort key, id).
+    Returns (rows, next_cursor); next_cursor is None on the last page.
+    Raises ValueError for an unknown sort key or a malformed cursor.
+    """
+    if sort not in SNAPSHOT_SORT_KEYS:
+        raise ValueError(f"sort must be one of {', '.join(SNAPSHOT_SORT_KEYS)}")
+
+    sort_col = getattr(CustomerRiskSnapshot, sort)
+    columns = [CustomerRiskSnapshot.id, CustomerRiskSnapshot.customer_id] + \
+              [getattr(CustomerRiskSnapshot, c) for c in SNAPSHOT_COLUMNS]
+    q = db.query(*columns)
+
+    if levels:
+        q = q.filter(CustomerRiskSnapshot.risk_level.in_(levels))
+    if min_score is not None:
+        q = q.filter(CustomerRiskSnapshot.risk_score >= min_score)
+    if max_score is not None:
+        q = q.filter(CustomerRiskSnapshot.risk_score <= max_score)
+    if min_debt is not None:
+        q = q.filter(CustomerRiskSnapshot.total_open_debt >= min_debt)
+    if max_debt is not None:
+        q = q.filter(CustomerRiskSnapshot.total_open_debt <= max_debt)
+    if has_overdue is not None:
+        q = q.filter(CustomerRiskSnapshot.has_overdue == has_overdue)
+
+    if cursor:
+        try:
+            last_value, last_id = decode_cursor(cursor)
+            last_id = int(last_id)
+        except (TypeError, ValueError):
+            raise ValueError("Invalid cursor")
+
+        if descending:
+            after = or_(sort_col < last_value, and_(sort_col == last_value, CustomerRiskSnapshot.id < last_id))
+        else:
+            after = or_(sort_col > last_value, and_(sort_col == last_value, CustomerRiskSnapshot.id > last_id))
+        q = q.filter(after)
+
+    if descending:
+        q = q.order_by(sort_col.desc(), CustomerRiskSnapshot.id.desc())
+    else:
+        q = q.order_by(sort_col.asc(), CustomerRiskSnapshot.id.asc())
+
+    rows = q.limit(limit + 1).all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, sort), last.id)
+
+    return [snapshot_to_dict(row) for row in rows], next_cursor
+
 
 # DELETE
 def delete_customer_risk(db: Session, customer_id: int) -> bool:
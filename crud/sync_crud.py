@@ -0,0 +1,75 @@
+import os
+import socket
+import uuid
+from datetime import timedelta
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from models import SyncState, SyncLease, utcnow
+
+#GET
+def get_high_water_mark(db: Session, name: str) -> int | None:
+    state = db.query(SyncState).filter(SyncState.name == name).first()
+    return state.high_water_mark if state else None
+
+#SAVE / UPSERT
+def set_high_water_mark(db: Session, name: str, value: int, commit: bool = True) -> SyncState:
+    state = db.query(SyncState).filter(SyncState.name == name).first()
+
+    if state:
+        state.high_water_mark = int(value)
+    else:
+        state = SyncState(name=name, high_water_mark=int(value))
+        db.add(state)
+
+    if commit:
+        db.commit()
+    return state
+
+#LEASE
+def new_lease_owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+def acquire_lease(db: Session, name: str, owner: str, lease_seconds: float) -> bool:
+    """
+    Take the named lease for `owner` if it is free, expired or already ours.
+    Inserting the row or the conditional UPDATE is atomic, so only one
+    process wins when several try at once.
+    """
+    now = utcnow()
+    expires_at = now + timedelta(seconds=lease_seconds)
+
+    updated = db.query(SyncLease)\
+                .filter(SyncLease.name == name)\
+                .filter((SyncLease.expires_at <= now) | (SyncLease.owner == owner))\
+                .update({"owner": owner, "expires_at": expires_at}, synchronize_session=False)
+    if updated:
+        db.commit()
+        return True
+
+    db.add(SyncLease(name=name, owner=owner, expires_at=expires_at))
+    try:
+        db.commit()
+    except IntegrityError:
+        # someone else holds it
+        db.rollback()
+        return False
+    return True
+
+def renew_lease(db: Session, name: str, owner: str, lease_seconds: float) -> bool:
+    """Push the expiry of a lease `owner` still holds. False once someone else has it."""
+    updated = db.query(SyncLease)\
+                .filter(SyncLease.name == name, SyncLease.owner == owner)\
+                .update({"expires_at": utcnow() + timedelta(seconds=lease_seconds)}, synchronize_session=False)
+    db.commit()
+    return bool(updated)
+
+def release_lease(db: Session, name: str, owner: str) -> None:
+    db.query(SyncLease)\
+      .filter(SyncLease.name == name, SyncLease.owner == owner)\
+      .delete(synchronize_session=False)
+    db.commit()
+
+def is_lease_held(db: Session, name: str) -> bool:
+    return db.query(SyncLease.name)\
+             .filter(SyncLease.name == name, SyncLease.expires_at > utcnow())\
+             .first() is not None
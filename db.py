@@ -1,6 +1,9 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.pool import NullPool
 from settings import settings
+from metrics import track_pool
 
 
 DATABASE_URL = getattr(settings, "database_url", None) or "sqlite:///./skill.db"
@@ -10,9 +13,50 @@ engine = create_engine(DATABASE_URL, connect_args=connect_args)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+
+# async driver used for each backend, and drivers that already work with create_async_engine
+ASYNC_DRIVERS = {"sqlite": "aiosqlite", "postgresql": "asyncpg"}
+_ASYNC_CAPABLE = {"aiosqlite", "asyncpg", "psycopg"}
+
+
+def _async_url(url: str) -> str:
+    # same database through its async driver, also when the URL names a sync one (postgresql+psycopg2)
+    parsed = make_url(url)
+    backend, _, driver = parsed.drivername.partition("+")
+    if driver in _ASYNC_CAPABLE:
+        return url
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver known for {parsed.drivername!r} database URLs")
+    return parsed.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}").render_as_string(hide_password=False)
+
+
+ASYNC_DATABASE_URL = _async_url(DATABASE_URL)
+# SQLite connections are cheap to open and must not outlive their event loop
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    **({"poolclass": NullPool} if ASYNC_DATABASE_URL.startswith("sqlite") else {}),
+)
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+track_pool(engine, "sync")
+track_pool(async_engine.sync_engine, "async")
+
+def create_missing_indexes(*tables) -> None:
+    """
+    create_all skips tables that already exist, so indexes declared on them
+    later never reach a deployed database. Create whichever are missing.
+    """
+    for table in tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,155 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Tuple
+
+
+# returned by a fetch when Dolibarr answered 304 Not Modified
+NOT_MODIFIED = object()
+
+
+@dataclass
+class CacheEntry:
+    value: Any
+    expires_at: float
+    # conditional request headers for revalidation (If-None-Match / If-Modified-Since)
+    validators: Dict[str, str] = field(default_factory=dict)
+
+
+def validators_from(headers) -> Dict[str, str]:
+    validators = {}
+    if headers.get("etag"):
+        validators["If-None-Match"] = headers["etag"]
+    if headers.get("last-modified"):
+        validators["If-Modified-Since"] = headers["last-modified"]
+    return validators
+
+
+class ResponseCache:
+    """
+    TTL + LRU cache of decoded Dolibarr GET responses, keyed by url and params.
+
+    An expired entry is revalidated with its ETag / Last-Modified when Dolibarr
+    sent one (a 304 just renews it), otherwise fetched again. Identical requests
+    that miss at the same time share one in-flight fetch (single-flight), from
+    threads and coroutines alike.
+
+    Cached values are shared between callers and must be treated as read-only.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int, clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl_seconds
+        self.max_entries = max_entries
+        self._clock = clock
+        self._entries: "OrderedDict[Tuple, CacheEntry]" = OrderedDict()
+        self._inflight: Dict[Tuple, Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.coalesced = 0
+
+    @staticmethod
+    def key(url: str, params: dict | None) -> Tuple:
+        return url, tuple(sorted((k, str(v)) for k, v in (params or {}).items()))
+
+    def _lookup(self, key: Tuple) -> Tuple[CacheEntry | None, Future | None, bool]:
+        """(entry, in-flight future, is_leader); entry is set only when it is still fresh."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at > self._clock():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry, None, False
+
+            future = self._inflight.get(key)
+            if future is not None:
+                self.coalesced += 1
+                return None, future, False
+
+            self.misses += 1
+            future = self._inflight[key] = Future()
+            return None, future, True
+
+    def _stale(self, key: Tuple) -> CacheEntry | None:
+        with self._lock:
+            return self._entries.get(key)
+
+    def _store(self, key: Tuple, result, stale: CacheEntry | None) -> Any:
+        value, headers = result
+        with self._lock:
+            if value is NOT_MODIFIED and stale is not None:
+                self.revalidated += 1
+                entry = CacheEntry(stale.value, self._clock() + self.ttl, stale.validators)
+            else:
+                entry = CacheEntry(value, self._clock() + self.ttl, validators_from(headers or {}))
+
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return entry.value
+
+    def _settle(self, key: Tuple, future: Future, value=None, error: BaseException | None = None) -> None:
+        with self._lock:
+            self._inflight.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(value)
+
+    def get(self, key: Tuple, fetch: Callable[[Dict[str, str]], Tuple[Any, Any]]) -> Any:
+        """
+        Return the cached value for key, or call fetch(validators) -> (value, headers)
+        once for everyone waiting on it. fetch returns NOT_MODIFIED as value on a 304.
+        """
+        entry, future, leader = self._lookup(key)
+        if entry is not None:
+            return entry.value
+        if not leader:
+            return future.result()
+
+        stale = self._stale(key)
+        try:
+            value = self._store(key, fetch(stale.validators if stale else {}), stale)
+        except BaseException as e:
+            self._settle(key, future, error=e)
+            raise
+        self._settle(key, future, value)
+        return value
+
+    async def aget(self, key: Tuple, fetch: Callable[[Dict[str, str]], Awaitable[Tuple[Any, Any]]]) -> Any:
+        """Coroutine version of get, for AsyncDolibarrClient."""
+        entry, future, leader = self._lookup(key)
+        if entry is not None:
+            return entry.value
+        if not leader:
+            return await asyncio.wrap_future(future)
+
+        stale = self._stale(key)
+        try:
+            value = self._store(key, await fetch(stale.validators if stale else {}), stale)
+        except BaseException as e:
+            self._settle(key, future, error=e)
+            raise
+        self._settle(key, future, value)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "revalidated": self.revalidated,
+                "coalesced": self.coalesced,
+            }
@@ -1,35 +1,391 @@
+import asyncio
+import threading
+import time
 import httpx
-from typing import List, Dict
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Iterator, AsyncIterator
 from fastapi import HTTPException
 from settings import settings
+from dolibarr_cache import ResponseCache, NOT_MODIFIED
+from dolibarr_scheduler import RequestScheduler, should_retry
+from metrics import (
+    DOLIBARR_CONCURRENCY_LIMIT, DOLIBARR_REQUESTS, DOLIBARR_REQUEST_SECONDS, DOLIBARR_RETRIES, endpoint_label,
+    register_stats,
+)
+
+
+INVOICES_PATH = "/api/index.php/invoices"
+THIRDPARTIES_PATH = "/api/index.php/thirdparties"
+
+_http_client: httpx.Client | None = None
+_http_client_lock = threading.Lock()
+_async_http_client: httpx.AsyncClient | None = None
+_response_cache: ResponseCache | None = None
+_request_scheduler: RequestScheduler | None = None
+
+
+def _http2_available() -> bool:
+    # httpx only speaks HTTP/2 when the optional "h2" package is installed
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _pool_options() -> dict:
+    return {
+        "timeout": settings.dolibarr_timeout,
+        "limits": httpx.Limits(
+            max_connections=settings.dolibarr_max_connections,
+            max_keepalive_connections=settings.dolibarr_max_keepalive,
+            keepalive_expiry=settings.dolibarr_keepalive_expiry,
+        ),
+        "http2": settings.dolibarr_http2 and _http2_available(),
+    }
+
+
+def get_http_client() -> httpx.Client:
+    """
+    Process-wide pooled client, created on first use.
+    Connections are kept alive and reused across requests (HTTP/2 when available).
+    """
+    global _http_client
+    with _http_client_lock:
+        if _http_client is None or _http_client.is_closed:
+            _http_client = httpx.Client(**_pool_options())
+        return _http_client
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """Async counterpart of get_http_client, for the event loop that serves the app."""
+    global _async_http_client
+    if _async_http_client is None or _async_http_client.is_closed:
+        _async_http_client = httpx.AsyncClient(**_pool_options())
+    return _async_http_client
+
+
+def get_response_cache() -> ResponseCache | None:
+    """Process-wide response cache shared by every client, None when caching is disabled."""
+    global _response_cache
+    if settings.dolibarr_cache_ttl_seconds <= 0:
+        return None
+    with _http_client_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache(settings.dolibarr_cache_ttl_seconds, settings.dolibarr_cache_max_entries)
+        return _response_cache
+
+
+def clear_response_cache() -> None:
+    if _response_cache is not None:
+        _response_cache.clear()
+
+
+def get_request_scheduler() -> RequestScheduler:
+    """
+    Process-wide request scheduler: every client, sync or async, draws from the
+    same rate limit and in-flight limit, so concurrent refreshes can't pile up on Dolibarr.
+    """
+    global _request_scheduler
+    with _http_client_lock:
+        if _request_scheduler is None:
+            _request_scheduler = RequestScheduler(
+                rate=settings.dolibarr_rate_limit,
+                burst=settings.dolibarr_rate_burst,
+                min_concurrency=settings.dolibarr_min_concurrency,
+                max_concurrency=settings.dolibarr_max_concurrency,
+                latency_tolerance=settings.dolibarr_latency_tolerance,
+                retry_base_seconds=settings.dolibarr_retry_base_seconds,
+                retry_max_seconds=settings.dolibarr_retry_max_seconds,
+            )
+            DOLIBARR_CONCURRENCY_LIMIT.set_function(lambda: _request_scheduler.limit)
+        return _request_scheduler
+
+
+# read from whichever shared cache / scheduler exists when /metrics is scraped
+register_stats("dolibarr_cache", "Shared Dolibarr response cache",
+               lambda: _response_cache.stats() if _response_cache is not None else None,
+               counters=("hits", "misses", "revalidated", "coalesced"), gauges=("entries",))
+register_stats("dolibarr_scheduler", "Shared Dolibarr request scheduler",
+               lambda: _request_scheduler.stats() if _request_scheduler is not None else None,
+               counters=("throttled", "backoffs"), gauges=("in_flight",))
+
+
+def _record_request(path: str, status: str, started: float) -> None:
+    endpoint = endpoint_label(path)
+    DOLIBARR_REQUEST_SECONDS.labels(endpoint).observe(time.perf_counter() - started)
+    DOLIBARR_REQUESTS.labels(endpoint, status).inc()
+
+
+def modified_since_filter(ts: int) -> str:
+    """
+    sqlfilters clause selecting rows whose tms is at or after the unix timestamp ts.
+    tms is a local wall-clock time of the Dolibarr server, so ts is written in its zone.
+    """
+    stamp = datetime.fromtimestamp(ts, tz=ZoneInfo(settings.dolibarr_timezone)).strftime("%Y-%m-%d %H:%M:%S")
+    return f"(t.tms:>=:'{stamp}')"
+
+
+def close_http_client() -> None:
+    global _http_client
+    with _http_client_lock:
+        if _http_client is not None:
+            _http_client.close()
+            _http_client = None
+
+
+async def close_async_http_client() -> None:
+    global _async_http_client
+    if _async_http_client is not None:
+        await _async_http_client.aclose()
+        _async_http_client = None
 
 
 class DolibarrClient:
-    def __init__(self):
+    def __init__(
+        self,
+        http_client: httpx.Client | None = None,
+        cache: ResponseCache | None = None,
+        scheduler: RequestScheduler | None = None,
+    ):
         if not settings.dolibarr_base_url or not settings.dolibarr_api_key:
             raise RuntimeError("Missing DOLIBARR_BASE_URL or DOLIBARR_API_KEY in .env")
 
         self.base_url = settings.dolibarr_base_url.rstrip("/")
         self.headers = {"DOLAPIKEY": settings.dolibarr_api_key}
         self.timeout = settings.dolibarr_timeout
+        self._http_client = http_client
+        self.cache = cache or get_response_cache()
+        self.scheduler = scheduler or get_request_scheduler()
+
+    @property
+    def http(self) -> httpx.Client:
+        return self._http_client or get_http_client()
 
-    def _get(self, path: str, params: dict | None = None) -> List[Dict]:
-        url = f"{self.base_url}{path}"
+    def _handle_response(self, r: httpx.Response, not_found_ok: bool):
+        # list endpoints answer 404 when a page has no rows
+        if not_found_ok and r.status_code == 404:
+            return [], r.headers
+        if r.status_code == 304:
+            return NOT_MODIFIED, r.headers
+        r.raise_for_status()
+        return r.json(), r.headers
+
+    def _settle(self, path: str, started: float, r: httpx.Response | None, error: Exception | None) -> None:
+        """Hand one attempt's outcome to the scheduler and the metrics."""
+        failed = error is not None or (r is not None and should_retry(r.status_code))
+        self.scheduler.release(time.perf_counter() - started, overloaded=failed)
+        _record_request(path, str(r.status_code) if r is not None else "error", started)
+
+    def _retry_delay(self, path: str, attempt: int, r: httpx.Response | None) -> float | None:
+        """Seconds to wait before trying again, None when the attempt is final."""
+        if attempt >= settings.dolibarr_max_retries or not should_retry(r.status_code if r is not None else None):
+            return None
+        DOLIBARR_RETRIES.labels(endpoint_label(path)).inc()
+        return self.scheduler.retry_delay(attempt, r.headers.get("retry-after") if r is not None else None)
+
+    def _result(self, r: httpx.Response | None, error: Exception | None, not_found_ok: bool):
+        if error is not None:
+            raise HTTPException(status_code=502, detail=f"Dolibarr connection error: {error}")
         try:
-            with httpx.Client(timeout=self.timeout) as client:
-                r = client.get(url, headers=self.headers, params=params)
-                r.raise_for_status()
-                return r.json()
-        except httpx.RequestError as e:
-            raise HTTPException(status_code=502, detail=f"Dolibarr connection error: {e}")
+            return self._handle_response(r, not_found_ok)
         except httpx.HTTPStatusError as e:
             raise HTTPException(status_code=502, detail=f"Dolibarr API error: {e.response.text}")
 
+    def _fetch(self, path: str, params: dict | None, not_found_ok: bool, validators: dict | None = None):
+        """
+        GET with the scheduler's rate and in-flight limits. Every call here is
+        idempotent, so 429 / 5xx / connection errors are retried after a
+        jittered backoff; only the last failure surfaces as a 502.
+        """
+        url, headers = f"{self.base_url}{path}", {**self.headers, **(validators or {})}
+        attempt = 0
+        while True:
+            self.scheduler.acquire()
+            started, r, error = time.perf_counter(), None, None
+            try:
+                r = self.http.get(url, headers=headers, params=params)
+            except httpx.RequestError as e:
+                error = e
+            finally:
+                self._settle(path, started, r, error)
+
+            delay = self._retry_delay(path, attempt, r)
+            if delay is None:
+                return self._result(r, error, not_found_ok)
+            time.sleep(delay)
+            attempt += 1
+
+    def _get(self, path: str, params: dict | None = None, not_found_ok: bool = False) -> List[Dict]:
+        if self.cache is None:
+            return self._fetch(path, params, not_found_ok)[0]
+        return self.cache.get(
+            self.cache.key(f"{self.base_url}{path}", params),
+            lambda validators: self._fetch(path, params, not_found_ok, validators),
+        )
+
+    @staticmethod
+    def _list_params(modified_since: int | None = None, **extra) -> dict:
+        params = {"sortfield": "t.rowid", "sortorder": "ASC", **{k: v for k, v in extra.items() if v}}
+        if modified_since is not None:
+            params["sqlfilters"] = modified_since_filter(modified_since)
+        return params
+
+    def iter_pages(self, path: str, params: dict | None = None) -> Iterator[List[Dict]]:
+        """
+        Yield one page of rows at a time until Dolibarr returns a short page.
+        While the caller works on a full page, the next one is already being
+        fetched in the background, so at most two pages are held in memory.
+        """
+        limit = settings.dolibarr_page_size
+        base_params = {**(params or {}), "limit": limit}
+
+        def fetch(page: int) -> List[Dict]:
+            return self._get(path, params={**base_params, "page": page}, not_found_ok=True)
+
+        prefetcher = None
+        try:
+            page = 0
+            rows = fetch(page)
+            while rows:
+                next_rows = None
+                if len(rows) >= limit:
+                    # only full pages can have a successor
+                    prefetcher = prefetcher or ThreadPoolExecutor(max_workers=1)
+                    next_rows = prefetcher.submit(fetch, page + 1)
+
+                yield rows
+
+                if next_rows is None:
+                    return
+                rows = next_rows.result()
+                page += 1
+        finally:
+            if prefetcher is not None:
+                prefetcher.shutdown(wait=False, cancel_futures=True)
+
+    def iter_invoices(self, status: str | None = "unpaid", modified_since: int | None = None) -> Iterator[Dict]:
+        """
+        Stream every invoice of the tenant, filtered server side by status
+        ("draft", "unpaid", "paid", "cancelled" or None for all) and,
+        optionally, by modification time.
+        """
+        params = self._list_params(modified_since, status=status)
+        for rows in self.iter_pages(INVOICES_PATH, params=params):
+            yield from rows
+
+    def iter_customers(self, modified_since: int | None = None) -> Iterator[Dict]:
+        for rows in self.iter_pages(THIRDPARTIES_PATH, params=self._list_params(modified_since)):
+            yield from rows
+
     def get_customers(self) -> List[Dict]:
-        return self._get("/api/index.php/thirdparties", params={"limit": 200})
+        return list(self.iter_customers())
+
+    def get_customer(self, customer_id: int) -> Dict:
+        return self._get(f"{THIRDPARTIES_PATH}/{customer_id}")
+
+    def get_invoices_by_customer(self, customer_id: int, status: str | None = None) -> List[Dict]:
+        """Every invoice of one thirdparty, optionally filtered by status like iter_invoices."""
+        invoices = []
+        params = self._list_params(thirdparty_ids=customer_id, status=status)
+        for rows in self.iter_pages(INVOICES_PATH, params=params):
+            invoices.extend(rows)
+        return invoices
+
+
+class AsyncDolibarrClient(DolibarrClient):
+    """
+    Same API as DolibarrClient with coroutine methods, on a shared
+    httpx.AsyncClient, so slow Dolibarr calls don't hold a worker thread.
+    """
 
-    def get_invoices_by_customer(self, customer_id: int) -> List[Dict]:
-        return self._get(
-            "/api/index.php/invoices",
-            params={"thirdparty_ids": customer_id, "limit": 200},
+    def __init__(
+        self,
+        http_client: httpx.AsyncClient | None = None,
+        cache: ResponseCache | None = None,
+        scheduler: RequestScheduler | None = None,
+    ):
+        super().__init__(cache=cache, scheduler=scheduler)
+        self._http_client = http_client
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        return self._http_client or get_async_http_client()
+
+    async def _fetch(self, path: str, params: dict | None, not_found_ok: bool, validators: dict | None = None):
+        url, headers = f"{self.base_url}{path}", {**self.headers, **(validators or {})}
+        attempt = 0
+        while True:
+            await self.scheduler.acquire_async()
+            started, r, error = time.perf_counter(), None, None
+            try:
+                r = await self.http.get(url, headers=headers, params=params)
+            except httpx.RequestError as e:
+                error = e
+            finally:
+                self._settle(path, started, r, error)
+
+            delay = self._retry_delay(path, attempt, r)
+            if delay is None:
+                return self._result(r, error, not_found_ok)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _get(self, path: str, params: dict | None = None, not_found_ok: bool = False) -> List[Dict]:
+        if self.cache is None:
+            return (await self._fetch(path, params, not_found_ok))[0]
+        return await self.cache.aget(
+            self.cache.key(f"{self.base_url}{path}", params),
+            lambda validators: self._fetch(path, params, not_found_ok, validators),
         )
+
+    async def iter_pages(self, path: str, params: dict | None = None) -> AsyncIterator[List[Dict]]:
+        """Async iter_pages: the next full page is fetched in a task while this one is consumed."""
+        limit = settings.dolibarr_page_size
+        base_params = {**(params or {}), "limit": limit}
+
+        def fetch(page: int):
+            return self._get(path, params={**base_params, "page": page}, not_found_ok=True)
+
+        next_rows = None
+        try:
+            page = 0
+            rows = await fetch(page)
+            while rows:
+                next_rows = asyncio.ensure_future(fetch(page + 1)) if len(rows) >= limit else None
+
+                yield rows
+
+                if next_rows is None:
+                    return
+                rows = await next_rows
+                page += 1
+        finally:
+            if next_rows is not None and not next_rows.done():
+                next_rows.cancel()
+
+    async def iter_invoices(self, status: str | None = "unpaid", modified_since: int | None = None) -> AsyncIterator[Dict]:
+        params = self._list_params(modified_since, status=status)
+        async for rows in self.iter_pages(INVOICES_PATH, params=params):
+            for row in rows:
+                yield row
+
+    async def iter_customers(self, modified_since: int | None = None) -> AsyncIterator[Dict]:
+        async for rows in self.iter_pages(THIRDPARTIES_PATH, params=self._list_params(modified_since)):
+            for row in rows:
+                yield row
+
+    async def get_customers(self) -> List[Dict]:
+        return [c async for c in self.iter_customers()]
+
+    async def get_customer(self, customer_id: int) -> Dict:
+        return await self._get(f"{THIRDPARTIES_PATH}/{customer_id}")
+
+    async def get_invoices_by_customer(self, customer_id: int, status: str | None = None) -> List[Dict]:
+        invoices = []
+        params = self._list_params(thirdparty_ids=customer_id, status=status)
+        async for rows in self.iter_pages(INVOICES_PATH, params=params):
+            invoices.extend(rows)
+        return invoices
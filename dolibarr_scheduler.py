@@ -0,0 +1,181 @@
+import asyncio
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Callable, List, Tuple
+
+
+# a response with one of these statuses means Dolibarr is overloaded or failing; worth another try
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# latency rises below this many seconds over the baseline are noise, not overload
+LATENCY_SLACK_SECONDS = 0.05
+
+
+def should_retry(status_code: int | None) -> bool:
+    """status_code is None when no response came back (connection error, timeout)."""
+    return status_code is None or status_code in RETRY_STATUSES
+
+
+def retry_after_seconds(value: str | None) -> float | None:
+    """Seconds asked for by a Retry-After header (delay-seconds or HTTP-date form)."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class RequestScheduler:
+    """
+    Paces every Dolibarr request of the process, from threads and coroutines alike.
+
+    - Token bucket: at most `rate` requests start per second, with bursts of
+      up to `burst` (rate 0 = unlimited).
+    - Adaptive concurrency (AIMD): the in-flight limit grows by about one per
+      round of healthy responses, up to `max_concurrency`, and is halved when
+      Dolibarr answers 429 / 5xx or not at all, or cut by 10% when its smoothed
+      latency rises past `latency_tolerance` x the baseline. At most one cut per
+      round trip, so a burst of failures counts once.
+    - Retry delays: exponential backoff with full jitter, or the server's
+      Retry-After when it is longer.
+    """
+
+    def __init__(
+        self,
+        rate: float,
+        burst: int,
+        min_concurrency: int,
+        max_concurrency: int,
+        latency_tolerance: float = 2.0,
+        retry_base_seconds: float = 0.5,
+        retry_max_seconds: float = 30,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.min_concurrency = max(min_concurrency, 1)
+        self.max_concurrency = max(max_concurrency, self.min_concurrency)
+        self.latency_tolerance = latency_tolerance
+        self.retry_base = retry_base_seconds
+        self.retry_max = retry_max_seconds
+        self._clock = clock
+
+        self.limit = float(self.max_concurrency)
+        self.in_flight = 0
+        self._tokens = float(self.burst)
+        self._refilled_at = clock()
+        self._latency: float | None = None    # fast EWMA of response times
+        self._baseline: float | None = None   # slow EWMA that follows drops at once
+        self._last_cut = float("-inf")
+
+        self._cond = threading.Condition()
+        self._async_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+        self.throttled = 0
+        self.backoffs = 0
+
+    # --- admission ---
+
+    def _try_start(self) -> float | None:
+        """Take a slot and a token: 0 when started, else seconds to wait (None = until a slot frees up)."""
+        if self.in_flight >= int(self.limit):
+            return None
+        if self.rate > 0:
+            now = self._clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+            self._refilled_at = now
+            if self._tokens < 1:
+                self.throttled += 1
+                return (1 - self._tokens) / self.rate
+            self._tokens -= 1
+        self.in_flight += 1
+        return 0
+
+    def acquire(self) -> None:
+        with self._cond:
+            while (wait := self._try_start()) != 0:
+                self._cond.wait(wait)
+
+    async def acquire_async(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._cond:
+                wait = self._try_start()
+                if wait == 0:
+                    return
+                if wait is None:
+                    woken = loop.create_future()
+                    self._async_waiters.append((loop, woken))
+            if wait is None:
+                await woken
+            else:
+                await asyncio.sleep(wait)
+
+    def release(self, latency: float, overloaded: bool) -> None:
+        """End one request: `overloaded` when Dolibarr answered 429 / 5xx or not at all."""
+        with self._cond:
+            self.in_flight -= 1
+            self._adapt(latency, overloaded)
+            self._cond.notify_all()
+            waiters, self._async_waiters = self._async_waiters, []
+        for loop, woken in waiters:
+            loop.call_soon_threadsafe(_wake, woken)
+
+    # --- adaptive concurrency ---
+
+    def _adapt(self, latency: float, overloaded: bool) -> None:
+        if overloaded:
+            self._cut(0.5, latency)
+            return
+
+        self._latency = latency if self._latency is None else 0.8 * self._latency + 0.2 * latency
+        if self._baseline is None or latency < self._baseline:
+            self._baseline = latency
+        else:
+            self._baseline += 0.01 * (latency - self._baseline)
+
+        if self._latency > max(self._baseline * self.latency_tolerance, self._baseline + LATENCY_SLACK_SECONDS):
+            self._cut(0.9, latency)
+        else:
+            # additive increase: about +1 once `limit` requests have come back healthy
+            self.limit = min(self.limit + 1 / self.limit, float(self.max_concurrency))
+
+    def _cut(self, factor: float, latency: float) -> None:
+        now = self._clock()
+        if now - self._last_cut < max(self._latency or 0, latency):
+            return
+        self._last_cut = now
+        self.limit = max(self.limit * factor, float(self.min_concurrency))
+        self.backoffs += 1
+
+    # --- retries ---
+
+    def retry_delay(self, attempt: int, retry_after: str | None = None) -> float:
+        """Seconds to wait before retry number `attempt` (0-based)."""
+        delay = random.uniform(0, min(self.retry_max, self.retry_base * 2 ** attempt))
+        asked = retry_after_seconds(retry_after)
+        if asked is not None:
+            delay = max(delay, min(asked, self.retry_max))
+        return delay
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "limit": self.limit,
+                "in_flight": self.in_flight,
+                "throttled": self.throttled,
+                "backoffs": self.backoffs,
+                "latency": self._latency,
+                "baseline_latency": self._baseline,
+            }
+
+
+def _wake(future: asyncio.Future) -> None:
+    if not future.done():
+        future.set_result(None)
@@ -1,5 +1,37 @@
+import logging
 import smtplib
+import threading
+import time
 from email.message import EmailMessage
+from db import SessionLocal
+from crud import email_outbox_crud
+from settings import settings
+from metrics import EMAIL_QUEUE_DEPTH, SMTP_SEND_SECONDS, SMTP_SENDS
+
+
+logger = logging.getLogger(__name__)
+
+
+def build_message(user: str, to_email: str, subject: str, body: str, from_name: str) -> EmailMessage:
+    msg = EmailMessage()
+    msg["Subject"] = subject
+    msg["From"] = f"{from_name} <{user}>"
+    msg["To"] = to_email
+    msg.set_content(body)
+    return msg
+
+
+def alert_email(customer_name: str, message: str) -> tuple[str, str]:
+    """(subject, body) of the risk alert email (UI-friendly)."""
+    subject = f"🚨 Risk Alert – {customer_name}"
+    body = f"""Smart Customer Alerts
+
+Customer: {customer_name}
+
+Message:
+{message}
+"""
+    return subject, body
 
 
 def send_email_smtp(
@@ -12,13 +44,164 @@ def send_email_smtp(
     body: str,
     from_name: str = "Smart Customer Alerts",
 ):
-    msg = EmailMessage()
-    msg["Subject"] = subject
-    msg["From"] = f"{from_name} <{user}>"
-    msg["To"] = to_email
-    msg.set_content(body)
+    msg = build_message(user, to_email, subject, body, from_name)
 
     with smtplib.SMTP(host, port) as server:
         server.starttls()
         server.login(user, password)
         server.send_message(msg)
+
+
+class SMTPSession:
+    """
+    One warm, authenticated SMTP connection reused across messages.
+    Reconnects once if the server dropped the idle connection.
+    """
+
+    def __init__(self, host: str, port: int, user: str | None, password: str | None, starttls: bool = True):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self._server: smtplib.SMTP | None = None
+
+    def _connect(self) -> smtplib.SMTP:
+        server = smtplib.SMTP(self.host, self.port, timeout=30)
+        if self.starttls:
+            server.starttls()
+        if self.user and self.password:
+            server.login(self.user, self.password)
+        return server
+
+    def send(self, msg: EmailMessage) -> None:
+        started, result = time.perf_counter(), "error"
+        try:
+            self._send(msg)
+            result = "sent"
+        finally:
+            SMTP_SEND_SECONDS.observe(time.perf_counter() - started)
+            SMTP_SENDS.labels(result).inc()
+
+    def _send(self, msg: EmailMessage) -> None:
+        if self._server is None:
+            self._server = self._connect()
+
+        try:
+            self._server.send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            self._server = self._connect()
+            self._server.send_message(msg)
+
+    def close(self) -> None:
+        if self._server is None:
+            return
+        try:
+            self._server.quit()
+        except smtplib.SMTPException:
+            self._server.close()
+        except OSError:
+            pass
+        self._server = None
+
+
+class EmailDispatcher:
+    """
+    Sends queued rows of outbound_emails over a shared SMTPSession.
+    Runs in a daemon thread; notify() wakes it right after new emails are queued.
+    """
+
+    def __init__(self):
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._session: SMTPSession | None = None
+        self._lock = threading.Lock()
+
+    def _smtp(self) -> SMTPSession:
+        if self._session is None:
+            self._session = SMTPSession(
+                settings.email_host,
+                settings.email_port,
+                settings.email_user,
+                settings.email_pass,
+                starttls=settings.email_starttls,
+            )
+        return self._session
+
+    def dispatch_pending(self) -> int:
+        """Send one batch of due emails; returns how many were sent."""
+        with self._lock:
+            db = SessionLocal()
+            sent = 0
+            try:
+                batch = email_outbox_crud.claim_due_emails(
+                    db, settings.email_batch_size, settings.email_send_lease_seconds,
+                )
+                for email in batch:
+                    msg = build_message(settings.email_user, email.to_email, email.subject, email.body, email.from_name)
+                    try:
+                        self._smtp().send(msg)
+                    except (smtplib.SMTPException, OSError) as e:
+                        # drop the connection, the next attempt starts fresh
+                        self._smtp().close()
+                        email_outbox_crud.mark_attempt_failed(
+                            db, email, str(e),
+                            max_attempts=settings.email_max_attempts,
+                            retry_base_seconds=settings.email_retry_base_seconds,
+                        )
+                        continue
+                    email_outbox_crud.mark_sent(db, email)
+                    sent += 1
+            finally:
+                db.close()
+            return sent
+
+    def notify(self) -> None:
+        self._wake.set()
+
+    def start(self) -> None:
+        if not settings.email_host or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="email-dispatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if self._session:
+            self._session.close()
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                sent = self.dispatch_pending()
+            except Exception:
+                logger.exception("email dispatch failed")
+                sent = 0
+
+            # full batch -> more may be waiting, go again right away
+            if sent < settings.email_batch_size:
+                self._wake.wait(settings.email_poll_seconds)
+                self._wake.clear()
+
+
+def _queue_depth() -> int:
+    db = SessionLocal()
+    try:
+        return email_outbox_crud.count_pending(db)
+    except Exception:
+        # never fail the whole scrape over one gauge
+        logger.exception("reading email queue depth failed")
+        return float("nan")
+    finally:
+        db.close()
+
+
+email_dispatcher = EmailDispatcher()
+# read at scrape time, so the gauge is always current
+EMAIL_QUEUE_DEPTH.set_function(_queue_depth)
@@ -0,0 +1,110 @@
+import re
+from typing import Callable, Dict, Iterable
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, REGISTRY, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+
+# Histogram.observe is a bucket lookup plus an add, cheap enough to stay on in production.
+# Bucket bounds (seconds) are picked per hot path.
+NETWORK_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+DB_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+# one scoring pass covers every customer of a refresh, up to month-end sized runs
+SCORING_BUCKETS = (0.0001, 0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+DOLIBARR_REQUESTS = Counter(
+    "dolibarr_requests_total", "Requests sent to the Dolibarr API.", ["endpoint", "status"],
+)
+DOLIBARR_REQUEST_SECONDS = Histogram(
+    "dolibarr_request_seconds", "Dolibarr API request latency.", ["endpoint"], buckets=NETWORK_BUCKETS,
+)
+DOLIBARR_RETRIES = Counter(
+    "dolibarr_retries_total", "Dolibarr requests retried after a 429, 5xx or connection error.", ["endpoint"],
+)
+DOLIBARR_CONCURRENCY_LIMIT = Gauge(
+    "dolibarr_concurrency_limit", "Current adaptive limit of Dolibarr requests in flight.",
+)
+RISK_CALC_SECONDS = Histogram(
+    "risk_calc_seconds", "Time of one scoring pass over a refresh's customers, by risk engine.", ["engine"],
+    buckets=SCORING_BUCKETS,
+)
+SNAPSHOT_UPSERT_SECONDS = Histogram(
+    "snapshot_upsert_seconds", "Time of one bulk snapshot upsert.", buckets=DB_BUCKETS,
+)
+SNAPSHOT_UPSERT_ROWS = Counter(
+    "snapshot_upsert_rows_total", "Snapshot rows written by bulk upserts.",
+)
+RISK_REFRESH_SECONDS = Histogram(
+    "risk_refresh_seconds", "Duration of a risk refresh (Dolibarr crawl + persist).", ["mode"],
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1800),
+)
+SMTP_SEND_SECONDS = Histogram(
+    "smtp_send_seconds", "SMTP send latency per message.", buckets=NETWORK_BUCKETS,
+)
+SMTP_SENDS = Counter(
+    "smtp_sends_total", "Messages handed to the SMTP server.", ["result"],
+)
+EMAIL_QUEUE_DEPTH = Gauge(
+    "email_outbox_pending", "Emails waiting in outbound_emails (pending or sending).",
+)
+DB_CONNECTIONS_IN_USE = Gauge(
+    "db_connections_in_use", "DB connections currently held by sessions.", ["engine"],
+)
+DB_CONNECTION_CHECKOUTS = Counter(
+    "db_connection_checkouts_total", "DB connections handed to sessions.", ["engine"],
+)
+
+_ID_SEGMENT = re.compile(r"/\d+(?=/|$)")
+
+
+def endpoint_label(path: str) -> str:
+    """'/api/index.php/thirdparties/42' -> '/thirdparties/{id}', so ids don't blow up label cardinality."""
+    return _ID_SEGMENT.sub("/{id}", path.replace("/api/index.php", "", 1))
+
+
+def track_pool(engine, name: str) -> None:
+    """Count connections checked out of a SQLAlchemy (sync) engine's pool."""
+    from sqlalchemy import event
+
+    in_use = DB_CONNECTIONS_IN_USE.labels(name)
+    checkouts = DB_CONNECTION_CHECKOUTS.labels(name)
+
+    @event.listens_for(engine, "checkout")
+    def _checkout(*_):
+        checkouts.inc()
+        in_use.inc()
+
+    @event.listens_for(engine, "checkin")
+    def _checkin(*_):
+        in_use.dec()
+
+
+class _StatsCollector:
+    """Exposes the counts a component already keeps in its stats() dict, read at scrape time."""
+
+    def __init__(self, prefix: str, documentation: str, stats: Callable[[], Dict | None],
+                 counters: Iterable[str], gauges: Iterable[str]):
+        self.prefix = prefix
+        self.documentation = documentation
+        self.stats = stats
+        self.counters = tuple(counters)
+        self.gauges = tuple(gauges)
+
+    def collect(self):
+        stats = self.stats()
+        if stats is None:  # component not created yet
+            return
+        for key in self.counters:
+            yield CounterMetricFamily(f"{self.prefix}_{key}", f"{self.documentation} ({key}).", value=stats[key])
+        for key in self.gauges:
+            yield GaugeMetricFamily(f"{self.prefix}_{key}", f"{self.documentation} ({key}).", value=stats[key])
+
+
+def register_stats(prefix: str, documentation: str, stats: Callable[[], Dict | None],
+                   counters: Iterable[str] = (), gauges: Iterable[str] = ()) -> None:
+    """Export selected keys of a stats() callable: counters as <prefix>_<key>_total, gauges as <prefix>_<key>."""
+    REGISTRY.register(_StatsCollector(prefix, documentation, stats, counters, gauges))
+
+
+def render() -> tuple[bytes, str]:
+    """(body, content type) of the Prometheus text exposition."""
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,129 @@
+import time
+from collections.abc import Iterator as IteratorABC
+from typing import Callable, Dict, Iterator, List
+from sqlalchemy.orm import Session
+from db import SessionLocal
+from dolibarr_client import DolibarrClient
+from risk_service import RiskService, open_invoice
+from crud import aggregates_crud, mirror_crud, sync_crud
+from settings import settings
+
+
+MIRROR_SYNC_NAME = "mirror_sync"
+SYNC_BATCH_SIZE = 500
+
+
+def _invoice_changes(rows: List[Dict]) -> List[tuple]:
+    # open means open for scoring: in bulk mode drafts and cancelled invoices count as closed
+    status = RiskService._changed_invoice_status()
+    return [
+        (int(inv["id"]), int(inv["socid"]), open_invoice(inv) if mirror_crud.matches_status(inv, status) else None)
+        for inv in rows
+    ]
+
+
+def _batches(rows: Iterator[Dict], size: int = SYNC_BATCH_SIZE) -> Iterator[List[Dict]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def sync_mirror(db: Session, client: DolibarrClient, full: bool = False) -> Dict:
+    """
+    Copy thirdparties and invoices changed in Dolibarr since the last sync
+    into the mirror tables, and feed each invoice change to the aggregates.
+
+    full=True re-reads everything and also drops rows that no longer exist
+    in Dolibarr (deletions are invisible to an incremental sync).
+    Returns counts of what was written.
+    """
+    started_at = int(time.time())
+    mark = None if full else sync_crud.get_high_water_mark(db, MIRROR_SYNC_NAME)
+    since = max(mark - settings.incremental_overlap_seconds, 0) if mark is not None else None
+    newest = 0
+    stats = {"thirdparties": 0, "invoices": 0, "deleted_thirdparties": 0, "deleted_invoices": 0}
+
+    def note(rows: List[Dict]) -> None:
+        nonlocal newest
+        for row in rows:
+            try:
+                newest = max(newest, int(row.get("date_modification") or 0))
+            except (TypeError, ValueError):
+                continue
+
+    seen_thirdparties = set()
+    for batch in _batches(client.iter_customers(modified_since=since)):
+        stats["thirdparties"] += mirror_crud.upsert_thirdparties(db, batch)
+        seen_thirdparties.update(int(c["id"]) for c in batch)
+        note(batch)
+
+    seen_invoices = set()
+    # status=None: paid and cancelled invoices must reach the mirror too
+    for batch in _batches(client.iter_invoices(status=None, modified_since=since)):
+        mirror_crud.upsert_invoices(db, batch, commit=False)
+        aggregates_crud.apply_invoice_changes(db, _invoice_changes(batch), commit=False)
+        db.commit()
+        stats["invoices"] += len(batch)
+        seen_invoices.update(int(inv["id"]) for inv in batch)
+        note(batch)
+
+    if full:
+        gone = [(invoice_id, cid) for invoice_id, cid in mirror_crud.invoice_ids(db).items()
+                if invoice_id not in seen_invoices]
+        mirror_crud.delete_invoices(db, [invoice_id for invoice_id, _ in gone], commit=False)
+        aggregates_crud.apply_invoice_changes(db, [(invoice_id, cid, None) for invoice_id, cid in gone], commit=False)
+        gone_thirdparties = [cid for cid in mirror_crud.thirdparty_ids(db) if cid not in seen_thirdparties]
+        mirror_crud.delete_thirdparties(db, gone_thirdparties, commit=False)
+        db.commit()
+        stats["deleted_invoices"] = len(gone)
+        stats["deleted_thirdparties"] = len(gone_thirdparties)
+
+    if newest:
+        # as for risk refreshes, never past the start of this sync
+        sync_crud.set_high_water_mark(db, MIRROR_SYNC_NAME, max(min(newest, started_at), since or 0))
+    return stats
+
+
+class MirrorDataSource:
+    """
+    Reads customers and invoices from the mirror tables with the same API
+    as DolibarrClient, so RiskService scores at DB speed without calling the ERP.
+    Every call uses its own short session, so it is safe from worker threads.
+    """
+
+    def __init__(self, session_factory: Callable[[], Session] = SessionLocal):
+        self.session_factory = session_factory
+
+    def _read(self, fn, *args, **kwargs):
+        db = self.session_factory()
+        try:
+            result = fn(db, *args, **kwargs)
+            return list(result) if isinstance(result, IteratorABC) else result
+        finally:
+            db.close()
+
+    def iter_customers(self, modified_since: int | None = None) -> Iterator[Dict]:
+        return iter(self._read(mirror_crud.iter_thirdparties, modified_since))
+
+    def iter_invoices(self, status: str | None = "unpaid", modified_since: int | None = None) -> Iterator[Dict]:
+        return iter(self._read(mirror_crud.iter_invoices, status, modified_since))
+
+    def get_customers(self) -> List[Dict]:
+        return self._read(mirror_crud.list_thirdparties)
+
+    def get_customer(self, customer_id: int) -> Dict:
+        customer = self._read(mirror_crud.get_thirdparty, customer_id)
+        # invoices can reference a thirdparty the mirror has not seen yet
+        return customer or {"id": customer_id}
+
+    def get_invoices_by_customer(self, customer_id: int, status: str | None = None) -> List[Dict]:
+        return self._read(mirror_crud.invoices_by_customers, [customer_id], status)[customer_id]
+
+    def get_invoices_for_customers(self, customer_ids: List[int], status: str | None = None) -> List[List[Dict]]:
+        grouped = self._read(mirror_crud.invoices_by_customers, customer_ids, status)
+        return [grouped[cid] for cid in customer_ids]
@@ -1,7 +1,24 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, Text
+from sqlalchemy import Column, Integer, String, Float, Boolean, Date, DateTime, Text, Index
+from datetime import datetime, timezone
+from sqlalchemy.dialects import sqlite
 from sqlalchemy.sql import func
 from db import Base
 
+
+def utcnow() -> datetime:
+    # naive UTC, same as CURRENT_TIMESTAMP on SQLite
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+# on SQLite, store datetimes in the same text layout as CURRENT_TIMESTAMP so
+# server-default and client-set rows compare correctly in keyset queries
+TimestampType = DateTime(timezone=True).with_variant(
+    sqlite.DATETIME(
+        storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d",
+    ),
+    "sqlite",
+)
+
 class CustomerRiskSnapshot(Base):
     __tablename__ = "customer_risk_snapshots"
 
@@ -10,15 +27,88 @@ class CustomerRiskSnapshot(Base):
     customer_name = Column(String, nullable=False)
 
     unpaid_count = Column(Integer, nullable=False, default=0)
-    total_open_debt = Column(Float, nullable=False, default=0.0)
+    total_open_debt = Column(Float, nullable=False, default=0.0, index=True)
     has_overdue = Column(Boolean, nullable=False, default=False)
-    risk_score = Column(Float, nullable=False, default=0.0)
-    risk_level = Column(String, nullable=False, default="Low")
+    risk_score = Column(Float, nullable=False, default=0.0, index=True)
+    risk_level = Column(String, nullable=False, default="Low", index=True)
 
     reasons = Column(Text, nullable=False, default="[]")  # store as JSON string
 
 
 
+class CustomerRiskHistory(Base):
+    """
+    Append-only risk history. A row is written only when a customer's
+    values changed since the previous refresh, so each row holds from
+    recorded_at until the next row of the same customer.
+    recorded_on is the date partition / retention key.
+    """
+    __tablename__ = "customer_risk_history"
+
+    id = Column(Integer, primary_key=True)
+    customer_id = Column(Integer, nullable=False)
+    recorded_on = Column(Date, nullable=False, index=True)
+    recorded_at = Column(TimestampType, nullable=False)
+
+    unpaid_count = Column(Integer, nullable=False)
+    total_open_debt = Column(Float, nullable=False)
+    risk_score = Column(Float, nullable=False)
+    risk_level = Column(String, nullable=False)
+
+    __table_args__ = (
+        Index("ix_customer_risk_history_customer_id_recorded_at", "customer_id", "recorded_at"),
+    )
+
+
+class MirrorThirdparty(Base):
+    """Local copy of a Dolibarr thirdparty (raw API JSON in `data`)."""
+    __tablename__ = "mirror_thirdparties"
+
+    id = Column(Integer, primary_key=True)  # Dolibarr rowid
+    name = Column(String, nullable=True)
+    date_modification = Column(Integer, nullable=True, index=True)
+    data = Column(Text, nullable=False)
+
+
+class MirrorInvoice(Base):
+    """Local copy of a Dolibarr invoice (raw API JSON in `data`)."""
+    __tablename__ = "mirror_invoices"
+
+    id = Column(Integer, primary_key=True)  # Dolibarr rowid
+    customer_id = Column(Integer, nullable=False, index=True)  # socid
+    status = Column(Integer, nullable=True)  # 0 draft, 1 unpaid, 2 paid, 3 cancelled
+    paid = Column(Integer, nullable=True)
+    date_modification = Column(Integer, nullable=True, index=True)
+    data = Column(Text, nullable=False)
+
+
+class OpenInvoice(Base):
+    """
+    Unpaid invoices last seen in Dolibarr, one row per invoice, so the
+    aggregates below can be updated from single invoice changes.
+    """
+    __tablename__ = "open_invoices"
+
+    invoice_id = Column(Integer, primary_key=True)  # Dolibarr rowid
+    customer_id = Column(Integer, nullable=False, index=True)
+    amount = Column(Float, nullable=False, default=0.0)
+    due_date = Column(Date, nullable=True)
+
+
+class CustomerInvoiceAggregate(Base):
+    """
+    Per-customer totals over open_invoices: everything _calc_risk needs,
+    so a customer is scored in O(1). has_overdue is min_open_due_date < today.
+    """
+    __tablename__ = "customer_invoice_aggregates"
+
+    customer_id = Column(Integer, primary_key=True)
+    unpaid_count = Column(Integer, nullable=False, default=0)
+    total_open_debt = Column(Float, nullable=False, default=0.0)
+    min_open_due_date = Column(Date, nullable=True, index=True)
+    updated_at = Column(TimestampType, nullable=False, default=utcnow, onupdate=utcnow)
+
+
 class Alert(Base):
     __tablename__ = "alerts"
 
@@ -27,4 +117,63 @@ class Alert(Base):
     customer_name = Column(String, nullable=False)
     message = Column(String, nullable=False)
     status = Column(String, default="sent", nullable=False)
-    timestamp = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    timestamp = Column(TimestampType, server_default=func.now(), nullable=False)
+
+    __table_args__ = (
+        # keyset paging on (timestamp, id) and per-customer history
+        Index("ix_alerts_timestamp_id", "timestamp", "id"),
+        Index("ix_alerts_customer_id_timestamp", "customer_id", "timestamp"),
+    )
+
+
+class AlertCooldown(Base):
+    __tablename__ = "alert_cooldowns"
+
+    # (customer_id, rule) primary key doubles as the dedup lookup index
+    customer_id = Column(Integer, primary_key=True)
+    rule = Column(String, primary_key=True)
+    last_fired_at = Column(TimestampType, nullable=False)
+
+
+class SyncState(Base):
+    __tablename__ = "sync_state"
+
+    name = Column(String, primary_key=True)  # e.g. "risk_refresh"
+    high_water_mark = Column(Integer, nullable=False, default=0)  # unix ts of last Dolibarr change seen
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+
+
+class SyncLease(Base):
+    """
+    Cross-process lock: one row per named job, held by `owner` until `expires_at`.
+    An expired lease (crashed worker) can be taken over.
+    """
+    __tablename__ = "sync_leases"
+
+    name = Column(String, primary_key=True)  # e.g. "risk_refresh"
+    owner = Column(String, nullable=False)
+    expires_at = Column(TimestampType, nullable=False)
+
+
+class OutboundEmail(Base):
+    __tablename__ = "outbound_emails"
+
+    id = Column(Integer, primary_key=True, index=True)
+    alert_id = Column(Integer, nullable=True)
+    to_email = Column(String, nullable=False)
+    from_name = Column(String, nullable=False)
+    subject = Column(String, nullable=False)
+    body = Column(Text, nullable=False)
+
+    status = Column(String, nullable=False, default="pending")  # pending / sending / sent / failed
+    attempts = Column(Integer, nullable=False, default=0)
+    # when the row may be (re)claimed: retry time for pending, lease expiry for sending
+    next_attempt_at = Column(TimestampType, server_default=func.now(), nullable=False)
+    last_error = Column(Text, nullable=True)
+
+    created_at = Column(TimestampType, server_default=func.now(), nullable=False)
+    sent_at = Column(TimestampType, nullable=True)
+
+    __table_args__ = (
+        Index("ix_outbound_emails_status_next_attempt", "status", "next_attempt_at"),
+    )
@@ -0,0 +1,501 @@
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import date
+from typing import List, Dict, Callable
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from db import SessionLocal
+from dolibarr_client import DolibarrClient, AsyncDolibarrClient
+from risk_service import RiskService, RiskDataSource, score_aggregate
+from mirror_service import MirrorDataSource, sync_mirror
+from crud import aggregates_crud, history_crud, risk_crud, sync_crud
+from alert_rules import apply_alert_rules
+from email_service import email_dispatcher
+from metrics import RISK_REFRESH_SECONDS
+from settings import settings
+
+
+RISK_SYNC_NAME = "risk_refresh"
+MAX_KEPT_JOBS = 50
+HISTORY_COMPACTION_INTERVAL = 24 * 3600
+MIRROR_FULL_SYNC_INTERVAL = 24 * 3600
+
+logger = logging.getLogger(__name__)
+
+
+def _since(high_water_mark: int) -> int:
+    return max(high_water_mark - settings.incremental_overlap_seconds, 0)
+
+
+def _persist_refresh(
+    db: Session,
+    results: List[Dict],
+    since: int | None,
+    high_water_mark: int,
+    started_at: int,
+    open_invoices: Dict[int, Dict[int, tuple]] | None = None,
+) -> None:
+    previous = risk_crud.get_snapshot_states(db, [r["customer_id"] for r in results])
+    if open_invoices:
+        aggregates_crud.replace_customer_invoices(db, open_invoices, commit=False)
+    # history deltas, snapshots, alerts and the mark go out in one transaction:
+    # new snapshots must never be stored without the alerts their transitions raise
+    history_crud.record_changes(db, previous, results, commit=False)
+    risk_crud.bulk_upsert_customer_risk_snapshots(db, results, commit=False)
+    alerts = apply_alert_rules(db, previous, results) if settings.auto_alerts_enabled else []
+
+    # never move the mark past the start of this crawl: rows changed while
+    # it ran may have been read before the change
+    if high_water_mark:
+        mark = min(high_water_mark, started_at)
+        sync_crud.set_high_water_mark(db, RISK_SYNC_NAME, max(mark, since or 0), commit=False)
+    db.commit()
+
+    if alerts:
+        email_dispatcher.notify()
+
+
+def _persist_refresh_in_session(*args) -> None:
+    """_persist_refresh with a session of its own, for a worker thread."""
+    db = SessionLocal()
+    try:
+        _persist_refresh(db, *args)
+    finally:
+        db.close()
+
+
+class InFlightRefresh:
+    """A refresh running in this process; other callers wait on its future."""
+
+    def __init__(self, incremental: bool):
+        self.incremental = incremental
+        self.future: Future = Future()
+
+    def satisfies(self, incremental: bool) -> bool:
+        # a full refresh covers an incremental request, not the other way round
+        return incremental or not self.incremental
+
+
+_inflight: InFlightRefresh | None = None
+_inflight_lock = threading.Lock()
+
+
+def _join_or_lead(incremental: bool) -> tuple[InFlightRefresh, bool]:
+    """(refresh to wait on, False) while one is running, else (new refresh, True) for the caller to run."""
+    global _inflight
+    with _inflight_lock:
+        if _inflight is not None:
+            return _inflight, False
+        _inflight = InFlightRefresh(incremental)
+        return _inflight, True
+
+
+def _settle(flight: InFlightRefresh, results: List[Dict] | None = None, error: BaseException | None = None) -> None:
+    global _inflight
+    with _inflight_lock:
+        _inflight = None
+    if error is not None:
+        flight.future.set_exception(error)
+    else:
+        flight.future.set_result(results)
+
+
+class LeaseHeartbeat:
+    """
+    Keeps a held lease alive while the work under it runs: a crawl can take
+    longer than the lease, and another worker must not take it over midway.
+    Renews every third of the lease length, from a thread with its own session.
+    """
+
+    def __init__(self, name: str, owner: str, lease_seconds: float, session_factory: Callable[[], Session] = SessionLocal):
+        self.name = name
+        self.owner = owner
+        self.lease_seconds = lease_seconds
+        self.session_factory = session_factory
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def __enter__(self) -> "LeaseHeartbeat":
+        self._thread = threading.Thread(target=self._run, name=f"lease-{self.name}", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.lease_seconds / 3):
+            db = self.session_factory()
+            try:
+                if not sync_crud.renew_lease(db, self.name, self.owner, self.lease_seconds):
+                    logger.warning("Lease %s lost by %s", self.name, self.owner)
+                    return
+            except Exception:
+                # a missed beat is retried on the next one, well before expiry
+                logger.exception("Renewing lease %s failed", self.name)
+            finally:
+                db.close()
+
+
+def _other_worker_results(db: Session) -> List[Dict]:
+    """
+    Another worker holds the refresh lease: serve the last completed
+    snapshot set, or wait for that refresh to finish when there is none yet.
+    """
+    while not risk_crud.has_customer_risks(db) and sync_crud.is_lease_held(db, RISK_SYNC_NAME):
+        db.rollback()  # end the read transaction so the next check sees new commits
+        time.sleep(settings.refresh_lease_poll_seconds)
+    return risk_crud.list_customer_risk_dicts(db)
+
+
+def refresh_customers_risk(
+    db: Session,
+    client: RiskDataSource,
+    incremental: bool = False,
+    on_progress: Callable[[int, int], None] | None = None,
+) -> List[Dict]:
+    """
+    Recompute customer risk from Dolibarr and persist the snapshots.
+
+    incremental=True only recomputes customers changed since the stored
+    high-water mark (falls back to a full refresh when there is none yet).
+    Returns the recomputed rows.
+
+    Only one refresh runs at a time: callers arriving while one is in flight
+    in this process get its result, and while another worker holds the DB
+    lease they get the stored snapshots instead of crawling Dolibarr again.
+    """
+    while True:
+        flight, leader = _join_or_lead(incremental)
+        if leader:
+            break
+        try:
+            results = flight.future.result()
+        except Exception:
+            if flight.satisfies(incremental):
+                raise
+            continue
+        if flight.satisfies(incremental):
+            return results
+
+    try:
+        owner = sync_crud.new_lease_owner()
+        if not sync_crud.acquire_lease(db, RISK_SYNC_NAME, owner, settings.refresh_lease_seconds):
+            results = _other_worker_results(db)
+        else:
+            try:
+                with LeaseHeartbeat(RISK_SYNC_NAME, owner, settings.refresh_lease_seconds):
+                    results = _refresh(db, client, incremental, on_progress)
+            finally:
+                db.rollback()
+                sync_crud.release_lease(db, RISK_SYNC_NAME, owner)
+    except BaseException as e:
+        _settle(flight, error=e)
+        raise
+    _settle(flight, results)
+    return results
+
+
+def _refresh(
+    db: Session,
+    client: RiskDataSource,
+    incremental: bool,
+    on_progress: Callable[[int, int], None] | None,
+) -> List[Dict]:
+    timer = time.perf_counter()
+    started_at = int(time.time())
+    service = RiskService(client, on_progress=on_progress)
+
+    since = sync_crud.get_high_water_mark(db, RISK_SYNC_NAME) if incremental else None
+    if since is None:
+        results = service.get_customers_risk()
+    else:
+        results = service.get_changed_customers_risk(_since(since))
+
+    _persist_refresh(db, results, since, service.high_water_mark, started_at, service.open_invoices)
+    RISK_REFRESH_SECONDS.labels("full" if since is None else "incremental").observe(time.perf_counter() - timer)
+    return results
+
+
+async def refresh_customers_risk_async(
+    db: AsyncSession,
+    client: AsyncDolibarrClient,
+    incremental: bool = False,
+    on_progress: Callable[[int, int], None] | None = None,
+) -> List[Dict]:
+    """refresh_customers_risk on the async stack: Dolibarr is awaited, DB work runs via run_sync."""
+    while True:
+        flight, leader = _join_or_lead(incremental)
+        if leader:
+            break
+        try:
+            results = await asyncio.wrap_future(flight.future)
+        except Exception:
+            if flight.satisfies(incremental):
+                raise
+            continue
+        if flight.satisfies(incremental):
+            return results
+
+    try:
+        owner = sync_crud.new_lease_owner()
+        if not await db.run_sync(sync_crud.acquire_lease, RISK_SYNC_NAME, owner, settings.refresh_lease_seconds):
+            results = await _other_worker_results_async(db)
+        else:
+            try:
+                with LeaseHeartbeat(RISK_SYNC_NAME, owner, settings.refresh_lease_seconds):
+                    results = await _refresh_async(db, client, incremental, on_progress)
+            finally:
+                await db.rollback()
+                await db.run_sync(sync_crud.release_lease, RISK_SYNC_NAME, owner)
+    except BaseException as e:
+        _settle(flight, error=e)
+        raise
+    _settle(flight, results)
+    return results
+
+
+async def _other_worker_results_async(db: AsyncSession) -> List[Dict]:
+    while not await db.run_sync(risk_crud.has_customer_risks) \
+            and await db.run_sync(sync_crud.is_lease_held, RISK_SYNC_NAME):
+        await db.rollback()
+        await asyncio.sleep(settings.refresh_lease_poll_seconds)
+    return await db.run_sync(risk_crud.list_customer_risk_dicts)
+
+
+async def _refresh_async(
+    db: AsyncSession,
+    client: AsyncDolibarrClient,
+    incremental: bool,
+    on_progress: Callable[[int, int], None] | None,
+) -> List[Dict]:
+    timer = time.perf_counter()
+    started_at = int(time.time())
+    service = RiskService(client, on_progress=on_progress)
+
+    since = await db.run_sync(sync_crud.get_high_water_mark, RISK_SYNC_NAME) if incremental else None
+    if since is None:
+        results = await service.get_customers_risk_async()
+    else:
+        results = await service.get_changed_customers_risk_async(_since(since))
+
+    # a large persist would block every other request on the event loop
+    await run_in_threadpool(
+        _persist_refresh_in_session, results, since, service.high_water_mark, started_at, service.open_invoices,
+    )
+    RISK_REFRESH_SECONDS.labels("full" if since is None else "incremental").observe(time.perf_counter() - timer)
+    return results
+
+
+def rescore_overdue(db: Session, today: date | None = None) -> List[Dict] | None:
+    """
+    Re-score, from the aggregates table alone, customers whose earliest open
+    invoice has fallen due since their snapshot was written. Nothing changed
+    in Dolibarr for them, so incremental refreshes would not notice.
+
+    Runs under the refresh lease, as it writes snapshots and alerts from the
+    aggregates a crawl or mirror sync may be moving.
+    Returns None when another refresh or sync holds the lease.
+    """
+    owner = sync_crud.new_lease_owner()
+    if not sync_crud.acquire_lease(db, RISK_SYNC_NAME, owner, settings.refresh_lease_seconds):
+        return None
+    try:
+        return _rescore_overdue(db, today or date.today())
+    finally:
+        db.rollback()
+        sync_crud.release_lease(db, RISK_SYNC_NAME, owner)
+
+
+def _rescore_overdue(db: Session, today: date) -> List[Dict]:
+    ids = aggregates_crud.get_customers_turning_overdue(db, today)
+    if not ids:
+        return []
+
+    names = risk_crud.get_snapshot_states(db, ids)
+    aggregates = aggregates_crud.get_aggregates(db, ids)
+    results = [
+        {
+            "customer_id": cid,
+            "customer_name": names[cid]["customer_name"],
+            **score_aggregate(agg.unpaid_count, agg.total_open_debt, agg.min_open_due_date, today),
+        }
+        for cid, agg in aggregates.items()
+    ]
+    _persist_refresh(db, results, None, 0, int(time.time()))
+    return results
+
+
+def sync_mirror_exclusive(db: Session, client: DolibarrClient, full: bool = False) -> Dict | None:
+    """
+    sync_mirror under the refresh lease: mirror syncs and crawls both move
+    the invoice aggregates, so they must never run at the same time.
+    Returns None when another refresh or sync holds the lease.
+    """
+    owner = sync_crud.new_lease_owner()
+    if not sync_crud.acquire_lease(db, RISK_SYNC_NAME, owner, settings.refresh_lease_seconds):
+        return None
+    try:
+        with LeaseHeartbeat(RISK_SYNC_NAME, owner, settings.refresh_lease_seconds):
+            return sync_mirror(db, client, full=full)
+    finally:
+        db.rollback()
+        sync_crud.release_lease(db, RISK_SYNC_NAME, owner)
+
+
+class RefreshJob:
+    def __init__(self, mode: str, source: str = "dolibarr", mirror_sync: str = "incremental"):
+        self.id = uuid.uuid4().hex
+        self.mode = mode
+        # source "mirror": first sync the mirror ("incremental", "full" or "none"), then score from it
+        self.source = source
+        self.mirror_sync = mirror_sync
+        self.mirror_stats: Dict | None = None
+        self.status = "queued"  # queued -> running -> done | failed
+        self.processed = 0
+        self.total = 0
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+        self.error: str | None = None
+
+    def _on_progress(self, done: int, total: int) -> None:
+        self.processed = done
+        self.total = total
+
+    def run(self) -> None:
+        self.status = "running"
+        self.started_at = time.time()
+        db = SessionLocal()
+        try:
+            if self.source == "mirror":
+                if self.mirror_sync != "none":
+                    self.mirror_stats = sync_mirror_exclusive(db, DolibarrClient(), full=(self.mirror_sync == "full"))
+                client = MirrorDataSource()
+            else:
+                client = DolibarrClient()
+
+            results = refresh_customers_risk(
+                db, client, incremental=(self.mode == "incremental"), on_progress=self._on_progress,
+            )
+            self.processed = self.total = max(self.total, len(results))
+            self.status = "done"
+        except Exception as e:
+            logger.exception("risk refresh %s failed", self.id)
+            self.error = str(e)
+            self.status = "failed"
+        finally:
+            self.finished_at = time.time()
+            db.close()
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "mode": self.mode,
+            "source": self.source,
+            "mirror_sync": self.mirror_sync if self.source == "mirror" else None,
+            "mirror_stats": self.mirror_stats,
+            "status": self.status,
+            "processed": self.processed,
+            "total": self.total,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+        }
+
+
+_jobs: "OrderedDict[str, RefreshJob]" = OrderedDict()
+_jobs_lock = threading.Lock()
+
+
+def _register_job(job: RefreshJob) -> None:
+    with _jobs_lock:
+        _jobs[job.id] = job
+        while len(_jobs) > MAX_KEPT_JOBS:
+            _jobs.popitem(last=False)
+
+
+def start_refresh_job(mode: str = "full", source: str = "dolibarr", mirror_sync: str = "incremental") -> RefreshJob:
+    """Run a refresh in a background thread and return its job handle."""
+    job = RefreshJob(mode, source, mirror_sync)
+    _register_job(job)
+    threading.Thread(target=job.run, name=f"risk-refresh-{job.id}", daemon=True).start()
+    return job
+
+
+def get_refresh_job(job_id: str) -> RefreshJob | None:
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+
+class RiskRefresher:
+    """Recomputes snapshots every `interval` seconds in a daemon thread."""
+
+    def __init__(self, interval: float, mode: str = "incremental"):
+        self.interval = interval
+        self.mode = mode
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._last_compaction = 0.0
+        self._last_full_mirror_sync = 0.0
+
+    def start(self) -> None:
+        if self.interval <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="risk-refresher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            job = RefreshJob(self.mode, settings.risk_data_source, self._mirror_sync_mode())
+            _register_job(job)
+            job.run()
+            if job.mirror_stats is not None and job.mirror_sync == "full":
+                self._last_full_mirror_sync = time.time()
+            self._rescore_overdue()
+            if time.time() - self._last_compaction >= HISTORY_COMPACTION_INTERVAL:
+                self._compact_history()
+            self._stop.wait(self.interval)
+
+    def _mirror_sync_mode(self) -> str:
+        # deletions in Dolibarr only show up in a full sync, so run one daily
+        if time.time() - self._last_full_mirror_sync >= MIRROR_FULL_SYNC_INTERVAL:
+            return "full"
+        return "incremental"
+
+    def _rescore_overdue(self) -> None:
+        db = SessionLocal()
+        try:
+            rescore_overdue(db)
+        except Exception:
+            logger.exception("overdue re-score failed")
+        finally:
+            db.close()
+
+    def _compact_history(self) -> None:
+        db = SessionLocal()
+        try:
+            history_crud.compact_history(
+                db, settings.history_full_resolution_days, settings.history_retention_days,
+            )
+            self._last_compaction = time.time()
+        except Exception:
+            logger.exception("risk history compaction failed")
+        finally:
+            db.close()
+
+
+refresher = RiskRefresher(settings.risk_refresh_interval_seconds, settings.risk_refresh_mode)
@@ -1,41 +1,175 @@
-from typing import List, Dict
+import asyncio
+from typing import List, Dict, Callable, Iterator, Protocol
 from datetime import date, datetime
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from fastapi.concurrency import run_in_threadpool
 from dolibarr_client import DolibarrClient
+from metrics import RISK_CALC_SECONDS, register_stats
 from settings import settings
 
 
-class RiskService:
-    def __init__(self, client: DolibarrClient):
-        self.client = client
+DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%m/%d/%Y", "%Y-%m-%d %H:%M:%S")
+# formats that may also match a string of the key format, so they keep precedence
+_SHADOWED_BY = {"%m/%d/%Y": ("%d/%m/%Y",)}
 
-    def _parse_date(self, d) -> date | None:
-        if not d:
-            return None
+# how often each format matched; the most frequent one is tried first
+# (pre-seeded so the dict never resizes while other threads read it)
+_format_hits = Counter({fmt: 0 for fmt in DATE_FORMATS})
 
-        # אם זה כבר date / datetime
-        if isinstance(d, date) and not isinstance(d, datetime):
-            return d
-        if isinstance(d, datetime):
-            return d.date()
 
-        # אם זה Unix timestamp (מספר)
-        if isinstance(d, (int, float)):
-            try:
-                return datetime.fromtimestamp(d).date()
-            except Exception:
-                return None
-
-        # אם זה מחרוזת
-        if isinstance(d, str):
-            s = d.split("T")[0]
-            for fmt in ("%Y-%m-%d", "%d/%m/%Y", "%m/%d/%Y", "%Y-%m-%d %H:%M:%S"):
-                try:
-                    return datetime.strptime(s, fmt).date()
-                except Exception:
-                    pass
+def _formats_to_try() -> tuple:
+    preferred = _format_hits.most_common(1)[0][0]
+    first = _SHADOWED_BY.get(preferred, ()) + (preferred,)
+    return first + tuple(f for f in DATE_FORMATS if f not in first)
+
+
+@lru_cache(maxsize=settings.date_parse_cache_size)
+def parse_date_string(raw: str) -> date | None:
+    """
+    Parse a Dolibarr due-date string, memoized per raw value.
+    Gives the same result as trying DATE_FORMATS in order.
+    """
+    s = raw.split("T")[0]
+    for fmt in _formats_to_try():
+        try:
+            parsed = datetime.strptime(s, fmt).date()
+        except ValueError:
+            continue
+        _format_hits[fmt] += 1
+        return parsed
+    return None
+
+
+def parse_date(d) -> date | None:
+    """Due date of an invoice field: date, datetime, unix timestamp or Dolibarr string."""
+    if not d:
+        return None
+
+    # אם זה כבר date / datetime
+    if isinstance(d, date) and not isinstance(d, datetime):
+        return d
+    if isinstance(d, datetime):
+        return d.date()
+
+    # אם זה Unix timestamp (מספר)
+    if isinstance(d, (int, float)):
+        try:
+            return datetime.fromtimestamp(d).date()
+        except Exception:
             return None
 
+    # אם זה מחרוזת
+    if isinstance(d, str):
+        return parse_date_string(d)
+
+    return None
+
+
+def date_parse_stats() -> Dict:
+    info = parse_date_string.cache_info()
+    return {
+        "hits": info.hits,
+        "misses": info.misses,
+        "size": info.currsize,
+        "maxsize": info.maxsize,
+        "formats": dict(_format_hits),
+    }
+
+
+register_stats("date_parse_cache", "Due-date string parse cache", date_parse_stats,
+               counters=("hits", "misses"), gauges=("size",))
+
+
+def risk_level(score: float) -> str:
+    if score == 0:
+        return "Safe"
+    elif score <= 39:
+        return "Low"
+    elif score <= 69:
+        return "Medium"
+    return "High"
+
+
+def score_risk(unpaid_count: int, total_open_debt: float, has_overdue: bool) -> Dict:
+    """Score one customer from its invoice aggregates (same output as _calc_risk)."""
+    score = 0
+    reasons = []
+
+    if has_overdue:
+        score += 50
+        reasons.append("Has at least one overdue invoice (+50)")
+
+    if total_open_debt > settings.debt_threshold:
+        score += 30
+        reasons.append(f"Total open debt {total_open_debt:.2f} > {settings.debt_threshold} (+30)")
+
+    if unpaid_count >= settings.unpaid_n:
+        score += 20
+        reasons.append(f"Unpaid invoices {unpaid_count} >= {settings.unpaid_n} (+20)")
+
+    return {
+        "unpaid_count": unpaid_count,
+        "total_open_debt": round(total_open_debt, 2),
+        "has_overdue": has_overdue,
+        "risk_score": float(score),
+        "risk_level": risk_level(score),
+        "reasons": reasons,
+    }
+
+
+def score_aggregate(unpaid_count: int, total_open_debt: float, min_open_due_date: date | None, today: date | None = None) -> Dict:
+    """score_risk from stored per-customer aggregates: overdue means the earliest open due date has passed."""
+    today = today or date.today()
+    has_overdue = min_open_due_date is not None and min_open_due_date < today
+    return score_risk(unpaid_count, total_open_debt, has_overdue)
+
+
+def open_invoice(inv: Dict) -> tuple[float, date | None] | None:
+    """(amount, due date) of an unpaid invoice, None once it is paid."""
+    if inv.get("paid") == 1:  # בדוליבאר: 1 = שולם, 0 = לא שולם
         return None
+    amount = float(inv.get("total_ttc") or inv.get("total") or inv.get("amount") or 0)
+    # זה השדה של "Payment due on" בדוליבאר
+    due_raw = inv.get("date_lim_reglement") or inv.get("due_date") or inv.get("datedue")
+    return amount, parse_date(due_raw)
+
+
+class RiskDataSource(Protocol):
+    """
+    Where RiskService reads customers and invoices: DolibarrClient (live ERP)
+    or mirror_service.MirrorDataSource (local copy). A source may also offer
+    get_invoices_for_customers(ids, status) to load many customers in one go.
+    """
+
+    def get_customers(self) -> List[Dict]: ...
+    def get_customer(self, customer_id: int) -> Dict: ...
+    def get_invoices_by_customer(self, customer_id: int, status: str | None = None) -> List[Dict]: ...
+    def iter_customers(self, modified_since: int | None = None) -> Iterator[Dict]: ...
+    def iter_invoices(self, status: str | None = "unpaid", modified_since: int | None = None) -> Iterator[Dict]: ...
+
+
+class RiskService:
+    def __init__(self, client: RiskDataSource | DolibarrClient, on_progress: Callable[[int, int], None] | None = None):
+        self.client = client
+        # called with (customers_done, customers_total) while invoices are fetched
+        self.on_progress = on_progress
+        # latest Dolibarr date_modification seen by this service (unix ts)
+        self.high_water_mark = 0
+        # {customer_id: {invoice_id: (amount, due)}} of every scored customer, for the aggregates table
+        self.open_invoices: Dict[int, Dict[int, tuple]] = {}
+
+    def _note_modified(self, rows: List[Dict]) -> None:
+        for row in rows:
+            try:
+                ts = int(row.get("date_modification") or 0)
+            except (TypeError, ValueError):
+                continue
+            if ts > self.high_water_mark:
+                self.high_water_mark = ts
+
+    _parse_date = staticmethod(parse_date)
 
     def _calc_risk(self, invoices: List[Dict]) -> Dict:
         today = date.today()
@@ -45,66 +179,99 @@ class RiskService:
         has_overdue = False
 
         for inv in invoices:
-            amount = float(inv.get("total_ttc") or inv.get("total") or inv.get("amount") or 0)
+            state = open_invoice(inv)
+            if state is None:
+                continue
 
-            paid_flag = inv.get("paid")  # בדוליבאר: 1 = שולם, 0 = לא שולם
-            is_paid = (paid_flag == 1)
+            amount, due_date = state
+            unpaid_count += 1
+            total_open_debt += amount
+            if due_date and due_date < today:
+                has_overdue = True
 
-            if not is_paid:
-                unpaid_count += 1
-                total_open_debt += amount
+        return score_risk(unpaid_count, total_open_debt, has_overdue)
 
-                # זה השדה של "Payment due on" בדוליבאר
-                due_raw = inv.get("date_lim_reglement") or inv.get("due_date") or inv.get("datedue")
-                due_date = self._parse_date(due_raw)
+    def _open_invoices(self, invoices: List[Dict]) -> Dict[int, tuple]:
+        opened = {}
+        for inv in invoices:
+            invoice_id = inv.get("id") or inv.get("rowid")
+            state = open_invoice(inv)
+            if invoice_id is not None and state is not None:
+                opened[int(invoice_id)] = state
+        return opened
 
-                if due_date and due_date < today:
-                    has_overdue = True
+    @staticmethod
+    def _changed_invoice_status() -> str | None:
+        # a bulk crawl only sees unpaid invoices (no drafts or cancelled ones);
+        # incremental re-scores have to see the same set or snapshots flip between cycles
+        return "unpaid" if settings.risk_fetch_mode == "bulk" else None
 
-        score = 0
-        reasons = []
+    def _invoices_getter(self, status: str | None) -> Callable:
+        if status is None:
+            return self.client.get_invoices_by_customer
+        return partial(self.client.get_invoices_by_customer, status=status)
 
-        if has_overdue:
-            score += 50
-            reasons.append("Has at least one overdue invoice (+50)")
+    def _fetch_invoices(self, customer_ids: List[int], status: str | None = None) -> List[List[Dict]]:
+        """
+        Fetch invoices (all of them, or only those with `status`) for every
+        customer id, keeping the input order.
+        Up to settings.dolibarr_concurrency requests run in flight at once.
+        """
+        total = len(customer_ids)
+        # looked up on the class: the source has to define it, not just answer to any attribute
+        if callable(getattr(type(self.client), "get_invoices_for_customers", None)):
+            results = self.client.get_invoices_for_customers(customer_ids, status=status)
+            self._report_progress(total, total)
+            return results
 
-        if total_open_debt > settings.debt_threshold:
-            score += 30
-            reasons.append(f"Total open debt {total_open_debt:.2f} > {settings.debt_threshold} (+30)")
+        get_invoices = self._invoices_getter(status)
+        workers = min(settings.dolibarr_concurrency, total)
+        results = []
 
-        if unpaid_count >= settings.unpaid_n:
-            score += 20
-            reasons.append(f"Unpaid invoices {unpaid_count} >= {settings.unpaid_n} (+20)")
+        if workers <= 1:
+            for cid in customer_ids:
+                results.append(get_invoices(cid))
+                self._report_progress(len(results), total)
+            return results
 
-        if score == 0:
-            level = "Safe"
-        elif score <= 39:
-            level = "Low"
-        elif score <= 69:
-            level = "Medium"
-        else:
-            level = "High"
-
-
-        return {
-            "unpaid_count": unpaid_count,
-            "total_open_debt": round(total_open_debt, 2),
-            "has_overdue": has_overdue,
-            "risk_score": float(score),
-            "risk_level": level,
-            "reasons": reasons,
-        }
-    
-    def get_customers_risk(self) -> List[Dict]:
-        customers = self.client.get_customers()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for invoices in pool.map(get_invoices, customer_ids):
+                results.append(invoices)
+                self._report_progress(len(results), total)
+        return results
+
+    def _report_progress(self, done: int, total: int) -> None:
+        if self.on_progress:
+            self.on_progress(done, total)
+
+    def _fetch_invoices_bulk(self, customer_ids: List[int]) -> List[List[Dict]]:
+        """
+        Page through all unpaid invoices once and group them by socid.
+        Only validated unpaid invoices come back (drafts are filtered by Dolibarr).
+        """
+        by_customer = defaultdict(list)
+        for inv in self.client.iter_invoices(status="unpaid"):
+            by_customer[int(inv.get("socid"))].append(inv)
+
+        self._report_progress(len(customer_ids), len(customer_ids))
+        return [by_customer.get(cid, []) for cid in customer_ids]
+
+    def _score_customers(self, customers: List[Dict], invoices_per_customer: List[List[Dict]]) -> List[Dict]:
         results = []
 
-        for c in customers:
+        # timed per pass rather than per customer, so both engines report the same thing
+        with RISK_CALC_SECONDS.labels(settings.risk_engine).time():
+            if settings.risk_engine == "numpy":
+                from risk_vectorized import calc_risk_many
+                risks = calc_risk_many(invoices_per_customer, parse_date)
+            else:
+                risks = [self._calc_risk(invoices) for invoices in invoices_per_customer]
+
+        for c, invoices, risk in zip(customers, invoices_per_customer, risks):
             cid = int(c.get("id"))
             name = c.get("name") or c.get("nom") or f"customer_{cid}"
-
-            invoices = self.client.get_invoices_by_customer(cid)
-            risk = self._calc_risk(invoices)
+            self._note_modified(invoices)
+            self.open_invoices[cid] = self._open_invoices(invoices)
 
             results.append(
                 {
@@ -117,3 +284,96 @@ class RiskService:
         results.sort(key=lambda x: x["risk_score"], reverse=True)
         return results
 
+    def get_customers_risk(self) -> List[Dict]:
+        customers = self.client.get_customers()
+        self._note_modified(customers)
+
+        ids = [int(c.get("id")) for c in customers]
+        if settings.risk_fetch_mode == "bulk":
+            invoices_per_customer = self._fetch_invoices_bulk(ids)
+        else:
+            invoices_per_customer = self._fetch_invoices(ids)
+
+        return self._score_customers(customers, invoices_per_customer)
+
+    def get_changed_customers_risk(self, since: int) -> List[Dict]:
+        """
+        Recompute only the customers touched in Dolibarr since the unix
+        timestamp `since`: thirdparties modified since then plus the owners
+        of invoices modified since then.
+        """
+        changed = {}
+        for c in self.client.iter_customers(modified_since=since):
+            changed[int(c.get("id"))] = c
+        self._note_modified(list(changed.values()))
+
+        invoice_owners = set()
+        for inv in self.client.iter_invoices(status=None, modified_since=since):
+            self._note_modified([inv])
+            invoice_owners.add(int(inv.get("socid")))
+
+        customers = list(changed.values())
+        customers += [self.client.get_customer(cid) for cid in sorted(invoice_owners - changed.keys())]
+
+        ids = [int(c.get("id")) for c in customers]
+        return self._score_customers(customers, self._fetch_invoices(ids, self._changed_invoice_status()))
+
+    # --- async variants, for an AsyncDolibarrClient ---
+
+    async def _fetch_invoices_async(self, customer_ids: List[int], status: str | None = None) -> List[List[Dict]]:
+        """Like _fetch_invoices, with at most settings.dolibarr_concurrency requests awaiting at once."""
+        total = len(customer_ids)
+        get_invoices = self._invoices_getter(status)
+        limit = asyncio.Semaphore(max(settings.dolibarr_concurrency, 1))
+        done = 0
+
+        async def fetch(cid: int) -> List[Dict]:
+            nonlocal done
+            async with limit:
+                invoices = await get_invoices(cid)
+            done += 1
+            self._report_progress(done, total)
+            return invoices
+
+        return list(await asyncio.gather(*(fetch(cid) for cid in customer_ids)))
+
+    async def _fetch_invoices_bulk_async(self, customer_ids: List[int]) -> List[List[Dict]]:
+        by_customer = defaultdict(list)
+        async for inv in self.client.iter_invoices(status="unpaid"):
+            by_customer[int(inv.get("socid"))].append(inv)
+
+        self._report_progress(len(customer_ids), len(customer_ids))
+        return [by_customer.get(cid, []) for cid in customer_ids]
+
+    async def get_customers_risk_async(self) -> List[Dict]:
+        customers = await self.client.get_customers()
+        self._note_modified(customers)
+
+        ids = [int(c.get("id")) for c in customers]
+        if settings.risk_fetch_mode == "bulk":
+            invoices_per_customer = await self._fetch_invoices_bulk_async(ids)
+        else:
+            invoices_per_customer = await self._fetch_invoices_async(ids)
+
+        # CPU-bound: keep it off the event loop
+        return await run_in_threadpool(self._score_customers, customers, invoices_per_customer)
+
+    async def get_changed_customers_risk_async(self, since: int) -> List[Dict]:
+        changed = {}
+        async for c in self.client.iter_customers(modified_since=since):
+            changed[int(c.get("id"))] = c
+        self._note_modified(list(changed.values()))
+
+        invoice_owners = set()
+        async for inv in self.client.iter_invoices(status=None, modified_since=since):
+            self._note_modified([inv])
+            invoice_owners.add(int(inv.get("socid")))
+
+        customers = list(changed.values())
+        customers += await asyncio.gather(
+            *(self.client.get_customer(cid) for cid in sorted(invoice_owners - changed.keys()))
+        )
+
+        ids = [int(c.get("id")) for c in customers]
+        invoices_per_customer = await self._fetch_invoices_async(ids, self._changed_invoice_status())
+        return await run_in_threadpool(self._score_customers, customers, invoices_per_customer)
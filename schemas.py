@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import List, Literal
 
 RiskLevel = Literal["Safe", "Low", "Medium", "High"]
@@ -12,3 +12,16 @@ class CustomerRiskOut(BaseModel):
     risk_score: float
     risk_level: RiskLevel
     reasons: List[str]
+
+class RiskSimulationIn(BaseModel):
+    # None = the current DEBT_THRESHOLD / UNPAID_N
+    debt_threshold: float | None = None
+    unpaid_n: int | None = None
+    overdue_weight: float = 50
+    debt_weight: float = 30
+    unpaid_weight: float = 20
+    # highest score of the Low and Medium levels (0 is always Safe)
+    low_max: float = 39
+    medium_max: float = 69
+    # how many changed customers to list (all of them are counted)
+    limit: int = Field(100, ge=0, le=10000)
@@ -5,12 +5,67 @@ from dotenv import load_dotenv
 load_dotenv()
 
 class Settings(BaseModel):
+    database_url: str | None = os.getenv("DATABASE_URL")
     dolibarr_base_url: str = os.getenv("DOLIBARR_BASE_URL", "").rstrip("/")
     dolibarr_api_key: str = os.getenv("DOLIBARR_API_KEY", "")
     dolibarr_timeout: int = int(os.getenv("DOLIBARR_TIMEOUT", "20"))
+    # max invoice requests in flight at once (1 = serial)
+    dolibarr_concurrency: int = int(os.getenv("DOLIBARR_CONCURRENCY", "8"))
+
+    # shared HTTP connection pool to Dolibarr
+    dolibarr_max_connections: int = int(os.getenv("DOLIBARR_MAX_CONNECTIONS", "20"))
+    dolibarr_max_keepalive: int = int(os.getenv("DOLIBARR_MAX_KEEPALIVE", "10"))
+    dolibarr_keepalive_expiry: float = float(os.getenv("DOLIBARR_KEEPALIVE_EXPIRY", "30"))
+    dolibarr_http2: bool = os.getenv("DOLIBARR_HTTP2", "1") == "1"
+
+    # cache of Dolibarr GET responses (0 disables); keep the TTL below incremental_overlap_seconds
+    dolibarr_cache_ttl_seconds: float = float(os.getenv("DOLIBARR_CACHE_TTL_SECONDS", "30"))
+    dolibarr_cache_max_entries: int = int(os.getenv("DOLIBARR_CACHE_MAX_ENTRIES", "2048"))
+
+    # request scheduler shared by every Dolibarr call: token bucket (0 = unlimited) and adaptive in-flight limit
+    dolibarr_rate_limit: float = float(os.getenv("DOLIBARR_RATE_LIMIT", "25"))
+    dolibarr_rate_burst: int = int(os.getenv("DOLIBARR_RATE_BURST", "25"))
+    dolibarr_min_concurrency: int = int(os.getenv("DOLIBARR_MIN_CONCURRENCY", "1"))
+    dolibarr_max_concurrency: int = int(os.getenv("DOLIBARR_MAX_CONCURRENCY", "8"))
+    # back off when smoothed latency exceeds this multiple of the baseline
+    dolibarr_latency_tolerance: float = float(os.getenv("DOLIBARR_LATENCY_TOLERANCE", "2.0"))
+    # GETs failing with 429 / 5xx / connection errors are retried with jittered exponential backoff
+    dolibarr_max_retries: int = int(os.getenv("DOLIBARR_MAX_RETRIES", "3"))
+    dolibarr_retry_base_seconds: float = float(os.getenv("DOLIBARR_RETRY_BASE_SECONDS", "0.5"))
+    dolibarr_retry_max_seconds: float = float(os.getenv("DOLIBARR_RETRY_MAX_SECONDS", "30"))
+
+    # "per_customer" = one invoices request per thirdparty, "bulk" = page through all unpaid invoices once
+    risk_fetch_mode: str = os.getenv("RISK_FETCH_MODE", "per_customer")
+    dolibarr_page_size: int = int(os.getenv("DOLIBARR_PAGE_SIZE", "200"))
+    # zone the Dolibarr server writes tms in; modified_since filters compare against it
+    dolibarr_timezone: str = os.getenv("DOLIBARR_TIMEZONE", "UTC")
+    # incremental refresh re-reads this many seconds before the stored high-water mark
+    incremental_overlap_seconds: int = int(os.getenv("INCREMENTAL_OVERLAP_SECONDS", "300"))
+
+    # background snapshot refresh (0 disables the scheduler)
+    risk_refresh_interval_seconds: float = float(os.getenv("RISK_REFRESH_INTERVAL_SECONDS", "900"))
+    risk_refresh_mode: str = os.getenv("RISK_REFRESH_MODE", "incremental")
+    # "dolibarr" = score from live API reads, "mirror" = sync the local mirror tables, then score from them
+    risk_data_source: str = os.getenv("RISK_DATA_SOURCE", "dolibarr")
+    # one refresh at a time across workers: DB lease length, and how often waiters re-check it
+    refresh_lease_seconds: float = float(os.getenv("REFRESH_LEASE_SECONDS", "1800"))
+    refresh_lease_poll_seconds: float = float(os.getenv("REFRESH_LEASE_POLL_SECONDS", "1"))
+
+    # alerts raised automatically when a refresh shows a risk transition
+    auto_alerts_enabled: bool = os.getenv("AUTO_ALERTS_ENABLED", "1") == "1"
+    auto_alert_min_level: str = os.getenv("AUTO_ALERT_MIN_LEVEL", "High")
+    alert_cooldown_hours: float = float(os.getenv("ALERT_COOLDOWN_HOURS", "24"))
+
+    # risk history: every change kept for N days, then one row per customer per week, dropped after retention
+    history_full_resolution_days: int = int(os.getenv("HISTORY_FULL_RESOLUTION_DAYS", "90"))
+    history_retention_days: int = int(os.getenv("HISTORY_RETENTION_DAYS", "730"))
 
     debt_threshold: float = float(os.getenv("DEBT_THRESHOLD", "1000"))
     unpaid_n: int = int(os.getenv("UNPAID_N", "3"))
+    # "python" = per-invoice loop, "numpy" = columnar scoring for large invoice sets
+    risk_engine: str = os.getenv("RISK_ENGINE", "python")
+    # distinct due-date strings kept in the parse cache
+    date_parse_cache_size: int = int(os.getenv("DATE_PARSE_CACHE_SIZE", "4096"))
 
     #EMAIL SETTINGS
     email_host: str = os.getenv("EMAIL_HOST")
@@ -19,5 +74,13 @@ class Settings(BaseModel):
     email_pass: str = os.getenv("EMAIL_PASS")
     email_to: str = os.getenv("EMAIL_TO")
     email_from_name: str = os.getenv("EMAIL_FROM_NAME", "Smart Customer Alerts")
+    email_starttls: bool = os.getenv("EMAIL_STARTTLS", "1") == "1"
+
+    # outbound email queue (outbound_emails table)
+    email_batch_size: int = int(os.getenv("EMAIL_BATCH_SIZE", "20"))
+    email_max_attempts: int = int(os.getenv("EMAIL_MAX_ATTEMPTS", "5"))
+    email_retry_base_seconds: float = float(os.getenv("EMAIL_RETRY_BASE_SECONDS", "30"))
+    email_poll_seconds: float = float(os.getenv("EMAIL_POLL_SECONDS", "5"))
+    email_send_lease_seconds: int = int(os.getenv("EMAIL_SEND_LEASE_SECONDS", "300"))
 
 settings = Settings()
@@ -0,0 +1,33 @@
+from typing import Iterable, Iterator
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+
+try:
+    import orjson
+
+    def dumps(obj) -> bytes:
+        return orjson.dumps(obj)
+except ImportError:  # orjson is optional, fall back to the stdlib encoder
+    import json
+
+    def dumps(obj) -> bytes:
+        return json.dumps(obj, separators=(",", ":"), default=str).encode()
+
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def wants_ndjson(request: Request, format: str | None = None) -> bool:
+    if format:
+        return format == "ndjson"
+    return NDJSON_MEDIA_TYPE in request.headers.get("accept", "")
+
+
+def ndjson_lines(rows: Iterable[dict]) -> Iterator[bytes]:
+    for row in rows:
+        yield dumps(row) + b"\n"
+
+
+def ndjson_response(rows: Iterable[dict]) -> StreamingResponse:
+    """Stream rows one JSON object per line, without pydantic re-validation."""
+    return StreamingResponse(ndjson_lines(rows), media_type=NDJSON_MEDIA_TYPE)
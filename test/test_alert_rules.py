@@ -0,0 +1,94 @@
+import unittest
+from unittest.mock import MagicMock
+
+
+def _invoice(cid, due, total=200):
+    return {"id": cid * 10, "socid": cid, "total_ttc": total, "paid": 0, "date_lim_reglement": due}
+
+
+class TestAutomaticAlerts(unittest.TestCase):
+
+    def setUp(self):
+        from db import Base, engine, SessionLocal
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+        self.db = SessionLocal()
+
+        self.client = MagicMock()
+        self.client.get_customers.return_value = [
+            {"id": 1, "name": "Beta Corp"},
+            {"id": 2, "name": "Delta Ltd"},
+        ]
+        self.invoices = {1: [_invoice(1, "2099-01-01")], 2: [_invoice(2, "2099-01-01")]}
+        self.client.get_invoices_by_customer.side_effect = lambda cid: self.invoices[cid]
+
+    def tearDown(self):
+        self.db.close()
+
+    def _refresh(self):
+        from refresh_service import refresh_customers_risk
+        refresh_customers_risk(self.db, self.client)
+
+    def _alerts(self):
+        from models import Alert
+        return self.db.query(Alert).order_by(Alert.id).all()
+
+    def test_first_refresh_is_a_baseline(self):
+        self.invoices[1] = [_invoice(1, "2020-01-01", total=5000)]
+        self._refresh()
+        self.assertEqual(self._alerts(), [])
+
+    def test_transition_fires_once_within_cooldown(self):
+        self._refresh()
+
+        # Beta goes Safe -> overdue + big debt (High)
+        self.invoices[1] = [_invoice(1, "2020-01-01", total=5000)]
+        self._refresh()
+
+        alerts = self._alerts()
+        self.assertEqual(sorted(a.message.split(" ")[0] for a in alerts), ["Customer", "Risk"])
+        self.assertTrue(all(a.customer_id == 1 for a in alerts))
+
+        # same state again -> no transition, nothing new
+        self._refresh()
+        self.assertEqual(len(self._alerts()), 2)
+
+        # back to Safe and High again inside the cooldown window -> deduplicated
+        self.invoices[1] = [_invoice(1, "2099-01-01")]
+        self._refresh()
+        self.invoices[1] = [_invoice(1, "2020-01-01", total=5000)]
+        self._refresh()
+        self.assertEqual(len(self._alerts()), 2)
+
+    def test_failed_alerting_keeps_previous_snapshots(self):
+        from unittest.mock import patch
+        from crud import risk_crud
+
+        self._refresh()
+        self.invoices[1] = [_invoice(1, "2020-01-01", total=5000)]
+
+        with patch("refresh_service.apply_alert_rules", side_effect=RuntimeError("smtp queue down")):
+            with self.assertRaises(RuntimeError):
+                self._refresh()
+        self.db.rollback()
+        self.assertEqual(risk_crud.get_customer_risk(self.db, 1).risk_level, "Safe")
+
+        # the transition is still pending, so the next refresh alerts it
+        self._refresh()
+        self.assertEqual(len(self._alerts()), 2)
+
+    def test_detect_transitions(self):
+        from alert_rules import detect_transitions
+
+        low = {"risk_level": "Low", "has_overdue": False, "risk_score": 20.0, "total_open_debt": 10.0}
+        medium = {**low, "risk_level": "Medium", "risk_score": 50.0}
+        high = {**low, "risk_level": "High", "has_overdue": True, "risk_score": 100.0}
+
+        self.assertEqual(detect_transitions(None, high), [])
+        self.assertEqual(detect_transitions(low, medium), [])  # below AUTO_ALERT_MIN_LEVEL
+        self.assertEqual([r for r, _ in detect_transitions(low, high)], ["level_high", "became_overdue"])
+        self.assertEqual(detect_transitions(high, high), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -85,3 +85,4 @@ def test_create_alert_from_snapshot_pulls_customer_name_and_saves_alert():
     assert saved is not None
     assert saved.message == "Dear Beta Corp, your invoice is overdue."
     db.close()
+
@@ -0,0 +1,25 @@
+import unittest
+
+
+class TestAsyncDatabaseUrl(unittest.TestCase):
+
+    def test_sync_urls_map_to_async_drivers(self):
+        from db import _async_url
+
+        self.assertEqual(_async_url("sqlite:///./skill.db"), "sqlite+aiosqlite:///./skill.db")
+        self.assertEqual(_async_url("sqlite+pysqlite:///./skill.db"), "sqlite+aiosqlite:///./skill.db")
+        self.assertEqual(_async_url("postgresql://u:secret@db:5432/alerts"), "postgresql+asyncpg://u:secret@db:5432/alerts")
+        self.assertEqual(_async_url("postgresql+psycopg2://u:secret@db/alerts"), "postgresql+asyncpg://u:secret@db/alerts")
+        print("✓ sync and driver-qualified URLs map to the async driver")
+
+    def test_async_drivers_pass_through_and_unknown_backends_fail(self):
+        from db import _async_url
+
+        self.assertEqual(_async_url("postgresql+asyncpg://u@db/alerts"), "postgresql+asyncpg://u@db/alerts")
+        self.assertEqual(_async_url("postgresql+psycopg://u@db/alerts"), "postgresql+psycopg://u@db/alerts")
+        with self.assertRaises(ValueError):
+            _async_url("mysql+pymysql://u@db/alerts")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,157 @@
+import asyncio
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+import httpx
+from fastapi import HTTPException
+
+from dolibarr_cache import ResponseCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _make_client(handler, cache, client_cls=None, http_cls=httpx.Client):
+    from dolibarr_client import DolibarrClient
+
+    http = http_cls(transport=httpx.MockTransport(handler))
+    with patch("dolibarr_client.settings.dolibarr_base_url", "http://dolibarr.test"), \
+         patch("dolibarr_client.settings.dolibarr_api_key", "secret"):
+        return (client_cls or DolibarrClient)(http_client=http, cache=cache)
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def test_fresh_entry_is_served_until_ttl_expires(self):
+        clock = FakeClock()
+        calls = []
+
+        def handler(request):
+            calls.append(request)
+            return httpx.Response(200, json={"id": 5, "name": f"call {len(calls)}"})
+
+        client = _make_client(handler, ResponseCache(30, 10, clock=clock))
+
+        self.assertEqual(client.get_customer(5)["name"], "call 1")
+        self.assertEqual(client.get_customer(5)["name"], "call 1")
+        self.assertEqual(len(calls), 1)
+
+        clock.now += 31
+        self.assertEqual(client.get_customer(5)["name"], "call 2")
+        self.assertEqual(client.cache.stats()["hits"], 1)
+        print("✓ cached response served within TTL, refetched after")
+
+    def test_stale_entry_is_revalidated_with_etag(self):
+        clock = FakeClock()
+        seen = []
+
+        def handler(request):
+            seen.append(request.headers.get("If-None-Match"))
+            if request.headers.get("If-None-Match") == '"v1"':
+                return httpx.Response(304, headers={"ETag": '"v1"'})
+            return httpx.Response(200, json={"id": 5, "name": "Beta Corp"}, headers={"ETag": '"v1"'})
+
+        client = _make_client(handler, ResponseCache(30, 10, clock=clock))
+        client.get_customer(5)
+
+        clock.now += 31
+        self.assertEqual(client.get_customer(5), {"id": 5, "name": "Beta Corp"})
+        self.assertEqual(seen, [None, '"v1"'])
+        self.assertEqual(client.cache.stats()["revalidated"], 1)
+
+        # the 304 renewed the entry
+        client.get_customer(5)
+        self.assertEqual(len(seen), 2)
+        print("✓ expired entry revalidated with If-None-Match")
+
+    def test_least_recently_used_entry_is_evicted(self):
+        calls = []
+
+        def handler(request):
+            calls.append(request.url.path)
+            return httpx.Response(200, json={"path": request.url.path})
+
+        client = _make_client(handler, ResponseCache(30, 2))
+        client.get_customer(1)
+        client.get_customer(2)
+        client.get_customer(1)      # 1 becomes most recently used
+        client.get_customer(3)      # evicts 2
+        client.get_customer(1)
+        client.get_customer(2)
+
+        self.assertEqual(calls.count("/api/index.php/thirdparties/1"), 1)
+        self.assertEqual(calls.count("/api/index.php/thirdparties/2"), 2)
+        self.assertEqual(client.cache.stats()["entries"], 2)
+        print("✓ LRU eviction keeps the cache bounded")
+
+    def test_concurrent_identical_requests_share_one_fetch(self):
+        calls = []
+        release = threading.Event()
+
+        def handler(request):
+            calls.append(request)
+            release.wait(2)
+            return httpx.Response(200, json={"id": 5})
+
+        client = _make_client(handler, ResponseCache(30, 10))
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(client.get_customer(5))) for _ in range(5)]
+        for t in threads:
+            t.start()
+        time.sleep(0.1)
+        release.set()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{"id": 5}] * 5)
+        self.assertEqual(client.cache.stats()["coalesced"], 4)
+        print("✓ concurrent identical requests coalesced into one")
+
+    def test_errors_are_shared_but_not_cached(self):
+        calls = []
+
+        def handler(request):
+            calls.append(request)
+            if len(calls) == 1:
+                return httpx.Response(500, text="boom")
+            return httpx.Response(200, json={"id": 5})
+
+        client = _make_client(handler, ResponseCache(30, 10))
+        with patch("dolibarr_client.settings.dolibarr_max_retries", 0), self.assertRaises(HTTPException):
+            client.get_customer(5)
+
+        self.assertEqual(client.get_customer(5), {"id": 5})
+        self.assertEqual(len(calls), 2)
+        print("✓ failed fetch is not cached")
+
+    def test_async_requests_are_coalesced(self):
+        from dolibarr_client import AsyncDolibarrClient
+
+        calls = []
+
+        async def handler(request):
+            calls.append(request)
+            await asyncio.sleep(0.05)
+            return httpx.Response(200, json={"id": 5})
+
+        async def run():
+            client = _make_client(handler, ResponseCache(30, 10), AsyncDolibarrClient, httpx.AsyncClient)
+            results = await asyncio.gather(*(client.get_customer(5) for _ in range(5)))
+            await client.http.aclose()
+            return results
+
+        self.assertEqual(asyncio.run(run()), [{"id": 5}] * 5)
+        self.assertEqual(len(calls), 1)
+        print("✓ async requests coalesced into one")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+import unittest
+from unittest.mock import patch
+
+import httpx
+
+
+def _make_client(handler):
+    from dolibarr_client import DolibarrClient, clear_response_cache
+
+    clear_response_cache()
+    http = httpx.Client(transport=httpx.MockTransport(handler))
+    with patch("dolibarr_client.settings.dolibarr_base_url", "http://dolibarr.test"), \
+         patch("dolibarr_client.settings.dolibarr_api_key", "secret"):
+        return DolibarrClient(http_client=http)
+
+
+class TestDolibarrClientConnection(unittest.TestCase):
+
+    def test_shared_http_client_is_reused_until_closed(self):
+        from dolibarr_client import get_http_client, close_http_client
+
+        first = get_http_client()
+        self.assertIs(first, get_http_client())
+
+        close_http_client()
+        self.assertTrue(first.is_closed)
+        self.assertIsNot(first, get_http_client())
+        close_http_client()
+
+    def test_get_sends_api_key_and_params(self):
+        seen = []
+
+        def handler(request):
+            seen.append(request)
+            return httpx.Response(200, json=[{"id": 1, "name": "Beta Corp"}])
+
+        client = _make_client(handler)
+        customers = client.get_customers()
+
+        self.assertEqual(customers, [{"id": 1, "name": "Beta Corp"}])
+        self.assertEqual(seen[0].headers["DOLAPIKEY"], "secret")
+        self.assertEqual(seen[0].url.path, "/api/index.php/thirdparties")
+
+
+class TestDolibarrClientPaging(unittest.TestCase):
+
+    def test_iter_invoices_pages_until_short_page(self):
+        pages = {
+            "0": [{"id": 1, "socid": 1}, {"id": 2, "socid": 2}],
+            "1": [{"id": 3, "socid": 1}],
+        }
+        seen = []
+
+        def handler(request):
+            seen.append(dict(request.url.params))
+            return httpx.Response(200, json=pages[request.url.params["page"]])
+
+        client = _make_client(handler)
+        with patch("dolibarr_client.settings.dolibarr_page_size", 2):
+            invoices = list(client.iter_invoices(status="unpaid"))
+
+        self.assertEqual([i["id"] for i in invoices], [1, 2, 3])
+        self.assertEqual(len(seen), 2)
+        self.assertEqual(seen[0]["status"], "unpaid")
+        self.assertEqual(seen[0]["limit"], "2")
+
+    def test_iter_invoices_stops_on_404_page(self):
+        def handler(request):
+            if request.url.params["page"] == "0":
+                return httpx.Response(200, json=[{"id": 1, "socid": 1}, {"id": 2, "socid": 1}])
+            return httpx.Response(404, json={"error": {"message": "No invoice found"}})
+
+        client = _make_client(handler)
+        with patch("dolibarr_client.settings.dolibarr_page_size", 2):
+            invoices = list(client.iter_invoices())
+
+        self.assertEqual(len(invoices), 2)
+
+    def test_get_customers_follows_every_page(self):
+        def handler(request):
+            page = int(request.url.params["page"])
+            if page < 3:
+                return httpx.Response(200, json=[{"id": page * 2 + 1}, {"id": page * 2 + 2}])
+            return httpx.Response(404, json={"error": {"message": "Not found"}})
+
+        client = _make_client(handler)
+        with patch("dolibarr_client.settings.dolibarr_page_size", 2):
+            customers = client.get_customers()
+
+        self.assertEqual([c["id"] for c in customers], [1, 2, 3, 4, 5, 6])
+
+    def test_get_invoices_by_customer_without_invoices_is_empty(self):
+        client = _make_client(lambda request: httpx.Response(404, json={}))
+        self.assertEqual(client.get_invoices_by_customer(7), [])
+
+    def test_modified_since_filter_uses_dolibarr_timezone(self):
+        seen = []
+
+        def handler(request):
+            seen.append(request.url.params["sqlfilters"])
+            return httpx.Response(200, json=[])
+
+        client = _make_client(handler)
+        # 2024-01-15 12:00:00 UTC
+        list(client.iter_invoices(modified_since=1_705_320_000))
+        with patch("dolibarr_client.settings.dolibarr_timezone", "America/New_York"):
+            list(client.iter_invoices(modified_since=1_705_320_000))
+
+        self.assertEqual(seen, ["(t.tms:>=:'2024-01-15 12:00:00')", "(t.tms:>=:'2024-01-15 07:00:00')"])
+
+
+class TestAsyncDolibarrClient(unittest.TestCase):
+
+    def test_async_client_pages_like_sync_client(self):
+        import asyncio
+        from dolibarr_client import AsyncDolibarrClient, clear_response_cache
+
+        clear_response_cache()
+
+        def handler(request):
+            page = int(request.url.params["page"])
+            if page < 2:
+                return httpx.Response(200, json=[{"id": page * 2 + 1, "socid": 1}, {"id": page * 2 + 2, "socid": 2}])
+            return httpx.Response(404, json={})
+
+        async def run():
+            http = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+            with patch("dolibarr_client.settings.dolibarr_base_url", "http://dolibarr.test"), \
+                 patch("dolibarr_client.settings.dolibarr_api_key", "secret"), \
+                 patch("dolibarr_client.settings.dolibarr_page_size", 2):
+                client = AsyncDolibarrClient(http_client=http)
+                invoices = await client.get_invoices_by_customer(1)
+                streamed = [inv["id"] async for inv in client.iter_invoices()]
+            await http.aclose()
+            return invoices, streamed
+
+        invoices, streamed = asyncio.run(run())
+        self.assertEqual([i["id"] for i in invoices], [1, 2, 3, 4])
+        self.assertEqual(streamed, [1, 2, 3, 4])
+
+
+if __name__ == "__main__":
+    unittest.main()
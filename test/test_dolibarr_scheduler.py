@@ -0,0 +1,207 @@
+import asyncio
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+import httpx
+from fastapi import HTTPException
+
+from dolibarr_scheduler import RequestScheduler, retry_after_seconds
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _scheduler(**overrides):
+    options = {"rate": 0, "burst": 1, "min_concurrency": 1, "max_concurrency": 4, "retry_base_seconds": 0.001}
+    return RequestScheduler(**{**options, **overrides})
+
+
+def _make_client(handler, scheduler, client_cls=None, http_cls=httpx.Client):
+    from dolibarr_client import DolibarrClient, clear_response_cache
+
+    clear_response_cache()
+    http = http_cls(transport=httpx.MockTransport(handler))
+    with patch("dolibarr_client.settings.dolibarr_base_url", "http://dolibarr.test"), \
+         patch("dolibarr_client.settings.dolibarr_api_key", "secret"):
+        return (client_cls or DolibarrClient)(http_client=http, scheduler=scheduler)
+
+
+class TestRequestScheduler(unittest.TestCase):
+
+    def test_token_bucket_paces_request_starts(self):
+        clock = FakeClock()
+        scheduler = _scheduler(rate=10, burst=2, clock=clock)
+
+        self.assertEqual(scheduler._try_start(), 0)
+        self.assertEqual(scheduler._try_start(), 0)
+        self.assertAlmostEqual(scheduler._try_start(), 0.1)
+
+        clock.now += 0.1
+        self.assertEqual(scheduler._try_start(), 0)
+        self.assertEqual(scheduler.throttled, 1)
+        print("✓ token bucket allows a burst, then one request per 1/rate seconds")
+
+    def test_limit_backs_off_and_recovers(self):
+        clock = FakeClock()
+        scheduler = _scheduler(max_concurrency=8, clock=clock)
+
+        for _ in range(4):
+            scheduler.acquire()
+        scheduler.release(0.02, overloaded=False)
+        scheduler.release(0.02, overloaded=True)
+        self.assertEqual(scheduler.limit, 4)
+
+        # same round trip: a burst of failures is cut once
+        scheduler.release(0.02, overloaded=True)
+        self.assertEqual(scheduler.limit, 4)
+
+        clock.now += 1
+        scheduler.release(0.02, overloaded=True)
+        self.assertEqual(scheduler.limit, 2)
+        self.assertEqual(scheduler.backoffs, 2)
+
+        for _ in range(20):
+            scheduler.acquire()
+            scheduler.release(0.02, overloaded=False)
+        self.assertGreater(scheduler.limit, 5)
+        print("✓ in-flight limit halves on overload and grows back on healthy responses")
+
+    def test_rising_latency_cuts_the_limit(self):
+        clock = FakeClock()
+        scheduler = _scheduler(max_concurrency=10, clock=clock)
+
+        for _ in range(10):
+            scheduler.acquire()
+            scheduler.release(0.02, overloaded=False)
+        self.assertEqual(scheduler.limit, 10)
+
+        for _ in range(5):
+            clock.now += 1
+            scheduler.acquire()
+            scheduler.release(1.0, overloaded=False)
+        self.assertLess(scheduler.limit, 10)
+        self.assertGreaterEqual(scheduler.limit, 1)
+        print("✓ slower responses shrink the in-flight limit")
+
+    def test_retry_delay_uses_jitter_and_retry_after(self):
+        scheduler = _scheduler(retry_base_seconds=1, retry_max_seconds=5)
+
+        delays = [scheduler.retry_delay(3) for _ in range(50)]
+        self.assertTrue(all(0 <= d <= 5 for d in delays))
+        self.assertGreater(len(set(delays)), 1)
+
+        self.assertGreaterEqual(scheduler.retry_delay(0, "3"), 3)
+        self.assertEqual(scheduler.retry_delay(0, "120"), 5)
+        self.assertIsNone(retry_after_seconds("soon"))
+        self.assertEqual(retry_after_seconds("Wed, 21 Oct 2015 07:28:00 GMT"), 0)
+        print("✓ retry delays are jittered, capped and honour Retry-After")
+
+
+class TestSchedulerInClient(unittest.TestCase):
+
+    def test_transient_errors_are_retried(self):
+        calls = []
+
+        def handler(request):
+            calls.append(request)
+            if len(calls) == 1:
+                raise httpx.ConnectError("connection refused")
+            if len(calls) == 2:
+                return httpx.Response(503, text="busy")
+            if len(calls) == 3:
+                return httpx.Response(429, headers={"Retry-After": "0"}, text="slow down")
+            return httpx.Response(200, json={"id": 5})
+
+        scheduler = _scheduler()
+        client = _make_client(handler, scheduler)
+
+        self.assertEqual(client.get_customer(5), {"id": 5})
+        self.assertEqual(len(calls), 4)
+        self.assertEqual(scheduler.in_flight, 0)
+        self.assertGreaterEqual(scheduler.backoffs, 1)
+        print("✓ connection error, 503 and 429 retried until success")
+
+    def test_gives_up_after_max_retries_and_skips_client_errors(self):
+        calls = []
+
+        def handler(request):
+            calls.append(request)
+            return httpx.Response(500 if request.url.path.endswith("/1") else 400, text="boom")
+
+        client = _make_client(handler, _scheduler())
+        with patch("dolibarr_client.settings.dolibarr_max_retries", 2):
+            with self.assertRaises(HTTPException) as ctx:
+                client.get_customer(1)
+            self.assertEqual(ctx.exception.status_code, 502)
+            self.assertEqual(len(calls), 3)
+
+            with self.assertRaises(HTTPException):
+                client.get_customer(2)
+            self.assertEqual(len(calls), 4)
+        print("✓ 5xx retried up to the limit, 4xx not retried")
+
+    def test_in_flight_requests_stay_under_the_limit(self):
+        lock = threading.Lock()
+        active, peak = 0, 0
+
+        def handler(request):
+            nonlocal active, peak
+            with lock:
+                active += 1
+                peak = max(peak, active)
+            time.sleep(0.02)
+            with lock:
+                active -= 1
+            return httpx.Response(200, json={"id": 1})
+
+        client = _make_client(handler, _scheduler(max_concurrency=2))
+        threads = [threading.Thread(target=client.get_customer, args=(cid,)) for cid in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertLessEqual(peak, 2)
+        print("✓ concurrent callers wait for a free slot")
+
+    def test_async_client_shares_limits_and_retries(self):
+        from dolibarr_client import AsyncDolibarrClient
+
+        calls, active, peak = [], 0, 0
+
+        async def handler(request):
+            nonlocal active, peak
+            calls.append(request)
+            if len(calls) == 1:
+                return httpx.Response(502, text="bad gateway")
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+            return httpx.Response(200, json={"id": 1})
+
+        scheduler = _scheduler(max_concurrency=3)
+
+        async def run():
+            client = _make_client(handler, scheduler, AsyncDolibarrClient, httpx.AsyncClient)
+            results = await asyncio.gather(*(client.get_customer(cid) for cid in range(10)))
+            await client.http.aclose()
+            return results
+
+        results = asyncio.run(run())
+        self.assertEqual(results, [{"id": 1}] * 10)
+        self.assertEqual(len(calls), 11)
+        self.assertLessEqual(peak, 3)
+        self.assertEqual(scheduler.in_flight, 0)
+        print("✓ async client retries and respects the in-flight limit")
+
+
+if __name__ == "__main__":
+    unittest.main()
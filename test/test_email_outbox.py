@@ -0,0 +1,123 @@
+import socket
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+
+import pytest
+
+aiosmtpd_controller = pytest.importorskip("aiosmtpd.controller")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class _CollectingHandler:
+    def __init__(self):
+        self.messages = []
+        self.connections = 0
+
+    async def handle_EHLO(self, server, session, envelope, hostname, responses):
+        self.connections += 1
+        session.host_name = hostname
+        return responses
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(envelope)
+        return "250 OK"
+
+
+class TestEmailOutbox(unittest.TestCase):
+
+    def setUp(self):
+        from db import Base, engine
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+
+        self.port = _free_port()
+        self.patches = [
+            patch("email_service.settings.email_host", "127.0.0.1"),
+            patch("email_service.settings.email_port", self.port),
+            patch("email_service.settings.email_user", "alerts@example.com"),
+            patch("email_service.settings.email_pass", None),
+            patch("email_service.settings.email_starttls", False),
+            patch("email_service.settings.email_batch_size", 10),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+
+    def _enqueue(self, n):
+        from db import SessionLocal
+        from crud import email_outbox_crud
+
+        db = SessionLocal()
+        for i in range(n):
+            email_outbox_crud.enqueue_email(
+                db, to_email="risk@example.com", subject=f"Alert {i}", body="Overdue", from_name="Alerts",
+            )
+        db.close()
+
+    def _emails(self):
+        from db import SessionLocal
+        from models import OutboundEmail
+
+        db = SessionLocal()
+        rows = db.query(OutboundEmail).order_by(OutboundEmail.id).all()
+        db.close()
+        return rows
+
+    def test_batch_is_sent_over_one_warm_connection(self):
+        from email_service import EmailDispatcher
+
+        handler = _CollectingHandler()
+        controller = aiosmtpd_controller.Controller(handler, hostname="127.0.0.1", port=self.port)
+        controller.start()
+        try:
+            self._enqueue(3)
+            dispatcher = EmailDispatcher()
+            self.assertEqual(dispatcher.dispatch_pending(), 3)
+            self.assertEqual(dispatcher.dispatch_pending(), 0)
+            dispatcher.stop()
+        finally:
+            controller.stop()
+
+        self.assertEqual(len(handler.messages), 3)
+        self.assertEqual(handler.connections, 1)
+        self.assertTrue(all(e.status == "sent" and e.attempts == 1 for e in self._emails()))
+
+    def test_failed_send_is_retried_later(self):
+        from email_service import EmailDispatcher
+
+        # nothing listens on self.port
+        self._enqueue(1)
+        dispatcher = EmailDispatcher()
+        self.assertEqual(dispatcher.dispatch_pending(), 0)
+
+        email = self._emails()[0]
+        self.assertEqual(email.status, "pending")
+        self.assertEqual(email.attempts, 1)
+        self.assertIsNotNone(email.last_error)
+        self.assertGreater(email.next_attempt_at, datetime.utcnow())
+
+        # not due yet -> nothing is claimed
+        self.assertEqual(dispatcher.dispatch_pending(), 0)
+        self.assertEqual(self._emails()[0].attempts, 1)
+
+    def test_gives_up_after_max_attempts(self):
+        from email_service import EmailDispatcher
+
+        self._enqueue(1)
+        with patch("email_service.settings.email_max_attempts", 1):
+            EmailDispatcher().dispatch_pending()
+
+        self.assertEqual(self._emails()[0].status, "failed")
+
+
+if __name__ == "__main__":
+    unittest.main()
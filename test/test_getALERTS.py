@@ -95,6 +95,83 @@ class TestAlertsHistoryEndpoint(unittest.TestCase):
 
         print("✓ GET /alerts empty passed all assertions")
 
+    def test_get_alerts_keyset_pages(self):
+        """
+        Test GET /alerts paging with X-Next-Cursor
+        - rows sharing a timestamp are neither repeated nor skipped
+        """
+        from datetime import datetime
+        from db import SessionLocal
+        from models import Alert
+
+        db = SessionLocal()
+        db.add_all([
+            Alert(customer_id=3, customer_name="Gamma", message=f"m{i}", status="sent",
+                  timestamp=datetime(2024, 1, 1, 10, 0, 0))
+            for i in range(3)
+        ])
+        db.commit()
+        db.close()
+
+        seen = []
+        cursor = None
+        pages = 0
+        while True:
+            params = {"limit": 2}
+            if cursor:
+                params["cursor"] = cursor
+            response = self.client.get("/alerts", params=params)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(a["id"] for a in response.json())
+            pages += 1
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+
+        self.assertEqual(pages, 3)
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(len(set(seen)), 5)
+
+        print("✓ GET /alerts keyset paging passed all assertions")
+
+    def test_missing_indexes_created_on_existing_table(self):
+        from sqlalchemy import inspect
+        from db import engine, create_missing_indexes
+        from models import Alert
+
+        # a deployed alerts table from before the keyset indexes
+        for index in Alert.__table__.indexes:
+            index.drop(bind=engine)
+
+        create_missing_indexes(Alert.__table__)
+        create_missing_indexes(Alert.__table__)  # idempotent on every startup
+
+        names = {i["name"] for i in inspect(engine).get_indexes("alerts")}
+        self.assertIn("ix_alerts_timestamp_id", names)
+        self.assertIn("ix_alerts_customer_id_timestamp", names)
+        print("✓ startup adds keyset indexes to an existing alerts table")
+
+    def test_get_alerts_filters(self):
+        """
+        Test GET /alerts filters (customer_id, status, time range) + bad cursor
+        """
+        response = self.client.get("/alerts", params={"customer_id": 2})
+        self.assertEqual([a["customer_name"] for a in response.json()], ["Delta Ltd"])
+
+        response = self.client.get("/alerts", params={"status": "failed"})
+        self.assertEqual(response.json(), [])
+
+        response = self.client.get("/alerts", params={"since": "2000-01-01T00:00:00", "until": "2000-01-02T00:00:00"})
+        self.assertEqual(response.json(), [])
+
+        response = self.client.get("/alerts", params={"since": "2000-01-01T00:00:00"})
+        self.assertEqual(len(response.json()), 2)
+
+        response = self.client.get("/alerts", params={"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 400)
+
+        print("✓ GET /alerts filters passed all assertions")
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,160 @@
+import unittest
+from datetime import date, timedelta
+from unittest.mock import MagicMock
+
+
+class TestInvoiceAggregates(unittest.TestCase):
+
+    def setUp(self):
+        from db import Base, engine, SessionLocal
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+        self.db = SessionLocal()
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_changes_adjust_aggregate_and_min_due_date(self):
+        from crud import aggregates_crud
+
+        aggregates_crud.apply_invoice_changes(self.db, [
+            (1, 7, (100.0, date(2030, 1, 10))),
+            (2, 7, (250.0, date(2030, 3, 1))),
+        ])
+        agg = aggregates_crud.get_aggregates(self.db, [7])[7]
+        self.assertEqual((agg.unpaid_count, agg.total_open_debt, agg.min_open_due_date), (2, 350.0, date(2030, 1, 10)))
+
+        # invoice 1 (holding the min due date) gets paid
+        aggregates_crud.apply_invoice_changes(self.db, [(1, 7, None)])
+        agg = aggregates_crud.get_aggregates(self.db, [7])[7]
+        self.assertEqual((agg.unpaid_count, agg.total_open_debt, agg.min_open_due_date), (1, 250.0, date(2030, 3, 1)))
+
+        aggregates_crud.apply_invoice_changes(self.db, [(2, 7, None)])
+        agg = aggregates_crud.get_aggregates(self.db, [7])[7]
+        self.assertEqual((agg.unpaid_count, agg.total_open_debt, agg.min_open_due_date), (0, 0.0, None))
+        print("✓ aggregates follow single invoice changes")
+
+    def test_replace_closes_missing_invoices_and_moves_owner(self):
+        from crud import aggregates_crud
+
+        aggregates_crud.replace_customer_invoices(self.db, {
+            1: {10: (100.0, date(2030, 1, 1)), 11: (50.0, None)},
+            2: {20: (70.0, date(2030, 2, 1))},
+        })
+        # 10 was paid, 11 was reassigned to customer 2
+        aggregates_crud.replace_customer_invoices(self.db, {
+            1: {},
+            2: {20: (70.0, date(2030, 2, 1)), 11: (50.0, date(2029, 12, 1))},
+        })
+
+        aggs = aggregates_crud.get_aggregates(self.db, [1, 2])
+        self.assertEqual(aggs[1].unpaid_count, 0)
+        self.assertEqual((aggs[2].unpaid_count, aggs[2].total_open_debt, aggs[2].min_open_due_date),
+                         (2, 120.0, date(2029, 12, 1)))
+        print("✓ full customer invoice sets replace stored ones")
+
+    def test_unchanged_replace_touches_nothing_and_keeps_exact_totals(self):
+        from sqlalchemy import event
+        from db import engine
+        from crud import aggregates_crud
+
+        amounts = [1234.56, 0.1, 0.2, 7777.77, 3.33, 1.01, 2278.18]
+        open_by_customer = {
+            cid: {cid * 100 + i: (a, date(2030, 1, 1 + i)) for i, a in enumerate(amounts)}
+            for cid in range(1, 1201)
+        }
+        aggregates_crud.replace_customer_invoices(self.db, open_by_customer)
+        expected = aggregates_crud.get_aggregates(self.db, [1])[1].total_open_debt
+
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(engine, "before_cursor_execute", listener)
+        try:
+            for _ in range(3):
+                self.assertEqual(aggregates_crud.replace_customer_invoices(self.db, open_by_customer), [])
+        finally:
+            event.remove(engine, "before_cursor_execute", listener)
+
+        # one invoice read per chunk of customers, nothing written or rescanned
+        self.assertEqual(len([s for s in statements if s.lstrip().upper().startswith("SELECT")]), 3 * 3)
+        self.assertEqual(aggregates_crud.get_aggregates(self.db, [1])[1].total_open_debt, expected)
+        print("✓ identical invoice sets cost no writes and leave totals untouched")
+
+    def test_aggregate_score_matches_invoice_scan(self):
+        from risk_service import RiskService, score_aggregate, open_invoice
+
+        service = RiskService(client=None)
+        today = date.today()
+        invoices = [
+            {"id": 1, "total_ttc": 600, "paid": 0, "date_lim_reglement": (today - timedelta(days=3)).isoformat()},
+            {"id": 2, "total_ttc": 700, "paid": 0, "date_lim_reglement": "2099-01-01"},
+            {"id": 3, "total_ttc": 900, "paid": 1, "date_lim_reglement": "2000-01-01"},
+            {"id": 4, "total_ttc": 10, "paid": 0},
+        ]
+        states = [s for s in (open_invoice(inv) for inv in invoices) if s]
+        dues = [d for _, d in states if d]
+
+        self.assertEqual(
+            score_aggregate(len(states), sum(a for a, _ in states), min(dues), today),
+            service._calc_risk(invoices),
+        )
+
+
+class TestOverdueRescore(unittest.TestCase):
+
+    def setUp(self):
+        from db import Base, engine, SessionLocal
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+        self.db = SessionLocal()
+
+        self.due = date.today() + timedelta(days=5)
+        self.client = MagicMock()
+        self.client.get_customers.return_value = [{"id": 1, "name": "Beta Corp"}, {"id": 2, "name": "Delta Ltd"}]
+        self.client.get_invoices_by_customer.side_effect = lambda cid: [
+            {"id": cid * 10, "socid": cid, "total_ttc": 200, "paid": 0 if cid == 1 else 1,
+             "date_lim_reglement": self.due.isoformat()},
+        ]
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_refresh_stores_aggregates_and_rescore_needs_no_crawl(self):
+        from refresh_service import refresh_customers_risk, rescore_overdue
+        from crud import aggregates_crud, risk_crud
+
+        refresh_customers_risk(self.db, self.client)
+        agg = aggregates_crud.get_aggregates(self.db, [1])[1]
+        self.assertEqual((agg.unpaid_count, agg.min_open_due_date), (1, self.due))
+        self.assertFalse(risk_crud.get_customer_risk(self.db, 1).has_overdue)
+
+        self.client.reset_mock()
+        self.assertEqual(rescore_overdue(self.db, today=self.due), [])
+
+        results = rescore_overdue(self.db, today=self.due + timedelta(days=1))
+
+        self.assertEqual([r["customer_id"] for r in results], [1])
+        self.assertTrue(risk_crud.get_customer_risk(self.db, 1).has_overdue)
+        self.assertEqual(risk_crud.get_customer_risk(self.db, 1).risk_score, 50.0)
+        self.client.get_invoices_by_customer.assert_not_called()
+        # already flagged -> nothing left to re-score
+        self.assertEqual(rescore_overdue(self.db, today=self.due + timedelta(days=1)), [])
+        print("✓ calendar re-score flips has_overdue from aggregates only")
+
+    def test_rescore_waits_for_refresh_lease(self):
+        from refresh_service import refresh_customers_risk, rescore_overdue, RISK_SYNC_NAME
+        from crud import risk_crud, sync_crud
+
+        refresh_customers_risk(self.db, self.client)
+        self.assertTrue(sync_crud.acquire_lease(self.db, RISK_SYNC_NAME, "other-worker", 60))
+
+        self.assertIsNone(rescore_overdue(self.db, today=self.due + timedelta(days=1)))
+        self.assertFalse(risk_crud.get_customer_risk(self.db, 1).has_overdue)
+
+        sync_crud.release_lease(self.db, RISK_SYNC_NAME, "other-worker")
+        self.assertEqual([r["customer_id"] for r in rescore_overdue(self.db, today=self.due + timedelta(days=1))], [1])
+        print("✓ calendar re-score skips while a refresh holds the lease")
+
+
+if __name__ == "__main__":
+    unittest.main()
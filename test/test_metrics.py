@@ -0,0 +1,99 @@
+import unittest
+from unittest.mock import patch
+
+import httpx
+from fastapi.testclient import TestClient
+
+
+class TestMetricsEndpoint(unittest.TestCase):
+
+    def setUp(self):
+        from db import Base, engine
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+
+        from app import app
+        self.client = TestClient(app)
+
+    def test_metrics_exposes_prometheus_text(self):
+        from db import SessionLocal
+        from crud import email_outbox_crud
+
+        db = SessionLocal()
+        email_outbox_crud.enqueue_email(db, to_email="ops@example.com", subject="s", body="b", from_name="n")
+        db.close()
+
+        response = self.client.get("/metrics")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("text/plain"))
+        self.assertIn("email_outbox_pending 1.0", response.text)
+        self.assertIn("db_connection_checkouts_total", response.text)
+        print("✓ /metrics returns Prometheus text with queue depth")
+
+    def test_dolibarr_requests_are_counted_per_endpoint(self):
+        from dolibarr_client import DolibarrClient
+        from dolibarr_cache import ResponseCache
+
+        http = httpx.Client(transport=httpx.MockTransport(lambda request: httpx.Response(200, json={"id": 42})))
+        with patch("dolibarr_client.settings.dolibarr_base_url", "http://dolibarr.test"), \
+             patch("dolibarr_client.settings.dolibarr_api_key", "secret"):
+            client = DolibarrClient(http_client=http, cache=ResponseCache(30, 10))
+        client.get_customer(42)
+        client.get_customer(43)
+
+        text = self.client.get("/metrics").text
+        self.assertIn('dolibarr_requests_total{endpoint="/thirdparties/{id}",status="200"}', text)
+        self.assertIn('dolibarr_request_seconds_count{endpoint="/thirdparties/{id}"}', text)
+        print("✓ Dolibarr requests timed and labelled by endpoint template")
+
+    def test_scoring_is_timed_for_both_engines(self):
+        from unittest.mock import MagicMock
+        from prometheus_client import REGISTRY
+        from risk_service import RiskService
+
+        client = MagicMock()
+        client.get_customers.return_value = [{"id": 1, "name": "Beta Corp"}]
+        client.get_invoices_by_customer.return_value = [{"id": 10, "socid": 1, "total_ttc": 200, "paid": 0}]
+
+        def passes(engine):
+            return REGISTRY.get_sample_value("risk_calc_seconds_count", {"engine": engine}) or 0
+
+        for engine in ("python", "numpy"):
+            before = passes(engine)
+            with patch("risk_service.settings.risk_engine", engine):
+                RiskService(client).get_customers_risk()
+            self.assertEqual(passes(engine), before + 1)
+
+        self.assertIn('risk_calc_seconds_count{engine="numpy"}', self.client.get("/metrics").text)
+        print("✓ scoring pass timed for the python and numpy engines")
+
+    def test_cache_and_scheduler_stats_are_exported(self):
+        from prometheus_client import REGISTRY
+        from risk_service import parse_date, date_parse_stats
+        from dolibarr_client import get_request_scheduler, get_response_cache
+
+        parse_date("2031-07-14")
+        parse_date("2031-07-14")
+        cache = get_response_cache()
+        scheduler = get_request_scheduler()
+
+        self.assertEqual(REGISTRY.get_sample_value("date_parse_cache_hits_total"), date_parse_stats()["hits"])
+        self.assertGreaterEqual(REGISTRY.get_sample_value("date_parse_cache_hits_total"), 1)
+        self.assertEqual(REGISTRY.get_sample_value("dolibarr_cache_misses_total"), cache.stats()["misses"])
+        self.assertEqual(REGISTRY.get_sample_value("dolibarr_scheduler_backoffs_total"), scheduler.stats()["backoffs"])
+
+        text = self.client.get("/metrics").text
+        self.assertIn("dolibarr_cache_entries", text)
+        self.assertIn("dolibarr_scheduler_in_flight", text)
+        print("✓ parse cache, response cache and scheduler stats exported")
+
+    def test_endpoint_label_strips_ids(self):
+        from metrics import endpoint_label
+
+        self.assertEqual(endpoint_label("/api/index.php/thirdparties/42"), "/thirdparties/{id}")
+        self.assertEqual(endpoint_label("/api/index.php/invoices"), "/invoices")
+
+
+if __name__ == "__main__":
+    unittest.main()
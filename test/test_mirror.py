@@ -0,0 +1,158 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+
+CUSTOMERS = [
+    {"id": 1, "name": "Beta Corp", "date_modification": 1_700_000_000},
+    {"id": 2, "name": "Delta Ltd", "date_modification": 1_700_000_100},
+]
+INVOICES = [
+    {"id": 10, "socid": 1, "total_ttc": 800, "paid": 0, "statut": 1,
+     "date_lim_reglement": "2099-01-01", "date_modification": 1_700_000_200},
+    {"id": 11, "socid": 1, "total_ttc": 400, "paid": 0, "statut": 1,
+     "date_lim_reglement": "2020-01-01", "date_modification": 1_700_000_300},
+    {"id": 20, "socid": 2, "total_ttc": 90, "paid": 1, "statut": 2,
+     "date_lim_reglement": "2020-01-01", "date_modification": 1_700_000_400},
+]
+
+
+def _fake_dolibarr(customers, invoices):
+    client = MagicMock()
+    client.iter_customers.side_effect = lambda modified_since=None: iter(customers)
+    client.iter_invoices.side_effect = lambda status=None, modified_since=None: iter(invoices)
+    client.get_customers.return_value = customers
+    client.get_invoices_by_customer.side_effect = lambda cid: [i for i in invoices if i["socid"] == cid]
+    return client
+
+
+class TestMirrorSync(unittest.TestCase):
+
+    def setUp(self):
+        from db import Base, engine, SessionLocal
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+        self.db = SessionLocal()
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_sync_copies_rows_and_feeds_aggregates(self):
+        from mirror_service import sync_mirror, MIRROR_SYNC_NAME
+        from crud import aggregates_crud, mirror_crud, sync_crud
+
+        stats = sync_mirror(self.db, _fake_dolibarr(CUSTOMERS, INVOICES), full=True)
+
+        self.assertEqual((stats["thirdparties"], stats["invoices"]), (2, 3))
+        self.assertEqual(mirror_crud.counts(self.db), {"thirdparties": 2, "invoices": 3})
+        self.assertEqual(sync_crud.get_high_water_mark(self.db, MIRROR_SYNC_NAME), 1_700_000_400)
+
+        aggs = aggregates_crud.get_aggregates(self.db, [1, 2])
+        self.assertEqual((aggs[1].unpaid_count, aggs[1].total_open_debt), (2, 1200.0))
+        self.assertNotIn(2, aggs)
+        print("✓ mirror sync stores thirdparties, invoices and aggregates")
+
+    def test_incremental_sync_applies_payment(self):
+        from mirror_service import sync_mirror
+        from crud import aggregates_crud
+
+        sync_mirror(self.db, _fake_dolibarr(CUSTOMERS, INVOICES), full=True)
+
+        paid = {**INVOICES[1], "paid": 1, "statut": 2, "date_modification": 1_700_000_900}
+        client = _fake_dolibarr([], [paid])
+        sync_mirror(self.db, client)
+
+        self.assertEqual(client.iter_invoices.call_args.kwargs["modified_since"], 1_700_000_400 - 300)
+        agg = aggregates_crud.get_aggregates(self.db, [1])[1]
+        self.assertEqual((agg.unpaid_count, agg.total_open_debt), (1, 800.0))
+        print("✓ incremental sync moves only the changed invoice")
+
+    def test_full_sync_drops_deleted_invoices(self):
+        from mirror_service import sync_mirror
+        from crud import aggregates_crud, mirror_crud
+
+        sync_mirror(self.db, _fake_dolibarr(CUSTOMERS, INVOICES), full=True)
+        stats = sync_mirror(self.db, _fake_dolibarr(CUSTOMERS, INVOICES[1:]), full=True)
+
+        self.assertEqual(stats["deleted_invoices"], 1)
+        self.assertEqual(mirror_crud.counts(self.db)["invoices"], 2)
+        self.assertEqual(aggregates_crud.get_aggregates(self.db, [1])[1].total_open_debt, 400.0)
+
+    def test_bulk_mode_sync_keeps_cancelled_invoices_out_of_aggregates(self):
+        from mirror_service import sync_mirror
+        from refresh_service import refresh_customers_risk, rescore_overdue
+        from crud import aggregates_crud, risk_crud
+
+        customers = [{"id": 3, "name": "Gamma Inc", "date_modification": 1_700_000_000}]
+        invoices = [
+            {"id": 30, "socid": 3, "total_ttc": 100, "paid": 0, "statut": 3,  # cancelled
+             "date_lim_reglement": "2020-01-01", "date_modification": 1_700_000_100},
+            {"id": 31, "socid": 3, "total_ttc": 50, "paid": 0, "statut": 1,
+             "date_lim_reglement": "2099-01-01", "date_modification": 1_700_000_200},
+        ]
+        client = _fake_dolibarr(customers, invoices)
+        client.iter_invoices.side_effect = lambda status=None, modified_since=None: iter(
+            [i for i in invoices if status != "unpaid" or i["statut"] == 1]
+        )
+
+        with patch("risk_service.settings.risk_fetch_mode", "bulk"):
+            refresh_customers_risk(self.db, client)
+            sync_mirror(self.db, client, full=True)
+            # nothing changed in Dolibarr since
+            refresh_customers_risk(self.db, _fake_dolibarr([], []), incremental=True)
+            self.assertEqual(rescore_overdue(self.db), [])
+
+        agg = aggregates_crud.get_aggregates(self.db, [3])[3]
+        self.assertEqual((agg.unpaid_count, agg.total_open_debt), (1, 50.0))
+        self.assertFalse(risk_crud.get_customer_risk(self.db, 3).has_overdue)
+        print("✓ bulk mode: mirror sync keeps cancelled invoices out of the aggregates")
+
+
+class TestMirrorDataSource(unittest.TestCase):
+
+    def setUp(self):
+        from db import Base, engine, SessionLocal
+        from mirror_service import sync_mirror
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+        self.db = SessionLocal()
+        self.dolibarr = _fake_dolibarr(CUSTOMERS, INVOICES)
+        sync_mirror(self.db, self.dolibarr, full=True)
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_mirror_scores_like_dolibarr(self):
+        from risk_service import RiskService
+        from mirror_service import MirrorDataSource
+
+        self.assertEqual(
+            RiskService(MirrorDataSource()).get_customers_risk(),
+            RiskService(self.dolibarr).get_customers_risk(),
+        )
+        print("✓ scores from the mirror match scores from Dolibarr")
+
+    def test_rescore_after_threshold_change_does_not_call_dolibarr(self):
+        from refresh_service import refresh_customers_risk
+        from mirror_service import MirrorDataSource
+        from crud import risk_crud
+
+        refresh_customers_risk(self.db, MirrorDataSource())
+        self.assertEqual(risk_crud.get_customer_risk(self.db, 1).risk_score, 80.0)
+
+        self.dolibarr.reset_mock()
+        with patch("risk_service.settings.debt_threshold", 5000):
+            refresh_customers_risk(self.db, MirrorDataSource())
+
+        self.assertEqual(risk_crud.get_customer_risk(self.db, 1).risk_score, 50.0)
+        self.dolibarr.get_invoices_by_customer.assert_not_called()
+        print("✓ re-score from the mirror after a threshold change")
+
+    def test_unpaid_filter_matches_dolibarr_status(self):
+        from mirror_service import MirrorDataSource
+
+        self.assertEqual([i["id"] for i in MirrorDataSource().iter_invoices(status="unpaid")], [10, 11])
+        self.assertEqual([i["id"] for i in MirrorDataSource().iter_invoices(status="paid")], [20])
+
+
+if __name__ == "__main__":
+    unittest.main()
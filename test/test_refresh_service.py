@@ -0,0 +1,243 @@
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock
+
+
+class TestIncrementalRefresh(unittest.TestCase):
+
+    def setUp(self):
+        from db import Base, engine, SessionLocal
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+        self.db = SessionLocal()
+
+        self.client = MagicMock()
+        self.client.get_customers.return_value = [
+            {"id": 1, "name": "Beta Corp", "date_modification": 1_700_000_000},
+            {"id": 2, "name": "Delta Ltd", "date_modification": 1_700_000_100},
+        ]
+        self.client.get_invoices_by_customer.side_effect = lambda cid: [
+            {"id": cid * 10, "socid": cid, "total_ttc": 200, "paid": 0,
+             "date_lim_reglement": "2099-01-01", "date_modification": 1_700_000_050},
+        ]
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_full_refresh_stores_high_water_mark(self):
+        from refresh_service import refresh_customers_risk, RISK_SYNC_NAME
+        from crud import sync_crud
+
+        results = refresh_customers_risk(self.db, self.client)
+
+        self.assertEqual(len(results), 2)
+        self.assertEqual(sync_crud.get_high_water_mark(self.db, RISK_SYNC_NAME), 1_700_000_100)
+
+    def test_incremental_refresh_recomputes_only_changed_customers(self):
+        from refresh_service import refresh_customers_risk
+        from crud import risk_crud
+
+        refresh_customers_risk(self.db, self.client)
+
+        # one overdue invoice changed for customer 2, nothing else
+        self.client.iter_customers.return_value = iter([])
+        self.client.iter_invoices.return_value = iter([
+            {"id": 21, "socid": 2, "date_modification": 1_700_000_500},
+        ])
+        self.client.get_customer.return_value = {"id": 2, "name": "Delta Ltd"}
+        self.client.get_invoices_by_customer.side_effect = lambda cid: [
+            {"id": 21, "socid": 2, "total_ttc": 5000, "paid": 0,
+             "date_lim_reglement": "2020-01-01", "date_modification": 1_700_000_500},
+        ]
+
+        results = refresh_customers_risk(self.db, self.client, incremental=True)
+
+        self.assertEqual([r["customer_id"] for r in results], [2])
+        self.client.get_invoices_by_customer.assert_called_with(2)
+        self.assertEqual(risk_crud.get_customer_risk(self.db, 2).risk_level, "High")
+        self.assertEqual(risk_crud.get_customer_risk(self.db, 1).total_open_debt, 200.0)
+
+    def test_incremental_without_mark_runs_full_refresh(self):
+        from refresh_service import refresh_customers_risk
+
+        results = refresh_customers_risk(self.db, self.client, incremental=True)
+
+        self.assertEqual(len(results), 2)
+        self.client.iter_invoices.assert_not_called()
+
+    def test_async_refresh_scores_and_persists_off_the_event_loop(self):
+        import asyncio
+        from unittest.mock import AsyncMock, patch
+        from db import AsyncSessionLocal
+        from refresh_service import refresh_customers_risk_async, _persist_refresh
+        from risk_service import RiskService
+        from crud import risk_crud
+
+        async_client = MagicMock()
+        async_client.get_customers = AsyncMock(return_value=self.client.get_customers.return_value)
+        async_client.get_invoices_by_customer = AsyncMock(side_effect=self.client.get_invoices_by_customer.side_effect)
+
+        threads = {}
+        score = RiskService._score_customers
+
+        def record(name, fn):
+            def wrapper(*args, **kwargs):
+                threads[name] = threading.current_thread()
+                return fn(*args, **kwargs)
+            return wrapper
+
+        async def run():
+            async with AsyncSessionLocal() as db:
+                return await refresh_customers_risk_async(db, async_client)
+
+        with patch("refresh_service._persist_refresh", record("persist", _persist_refresh)), \
+             patch.object(RiskService, "_score_customers", record("score", score)):
+            results = asyncio.run(run())
+
+        self.assertEqual(len(results), 2)
+        self.assertIsNot(threads["score"], threading.main_thread())
+        self.assertIsNot(threads["persist"], threading.main_thread())
+        self.assertEqual(risk_crud.get_customer_risk(self.db, 1).total_open_debt, 200.0)
+        print("✓ async refresh keeps scoring and persistence off the event loop")
+
+
+class TestRefreshSingleFlight(unittest.TestCase):
+
+    def setUp(self):
+        from db import Base, engine
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+
+        self.release = threading.Event()
+        self.crawling = threading.Event()  # set once the leading refresh reached Dolibarr
+        self.client = MagicMock()
+        self.client.get_customers.return_value = [{"id": 1, "name": "Beta Corp"}]
+
+        def slow_invoices(cid):
+            self.crawling.set()
+            self.release.wait(5)
+            return [{"id": 10, "socid": cid, "total_ttc": 200, "paid": 0, "date_lim_reglement": "2099-01-01"}]
+
+        self.client.get_invoices_by_customer.side_effect = slow_invoices
+
+    def _refresh_in_thread(self, results, incremental=False):
+        from db import SessionLocal
+        from refresh_service import refresh_customers_risk
+
+        def run():
+            db = SessionLocal()
+            try:
+                results.append(refresh_customers_risk(db, self.client, incremental=incremental))
+            finally:
+                db.close()
+
+        t = threading.Thread(target=run)
+        t.start()
+        return t
+
+    def test_concurrent_refreshes_share_one_crawl(self):
+        results = []
+        threads = [self._refresh_in_thread(results) for _ in range(4)]
+        time.sleep(0.2)
+        self.release.set()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(self.client.get_customers.call_count, 1)
+        self.assertEqual(len(results), 4)
+        self.assertTrue(all(r == results[0] for r in results))
+        print("✓ concurrent refreshes coalesced into one Dolibarr crawl")
+
+    def test_full_refresh_does_not_reuse_incremental_result(self):
+        results = []
+        first = self._refresh_in_thread(results, incremental=True)
+        # the incremental refresh must lead: only start the full one once it is crawling
+        self.assertTrue(self.crawling.wait(2))
+        second = self._refresh_in_thread(results)
+        time.sleep(0.2)
+        self.release.set()
+        first.join()
+        second.join()
+
+        self.assertEqual(self.client.get_customers.call_count, 2)
+        print("✓ full refresh waits for the incremental one, then runs")
+
+    def test_lease_held_by_other_worker_serves_stored_snapshots(self):
+        from db import SessionLocal
+        from refresh_service import refresh_customers_risk, RISK_SYNC_NAME
+        from crud import risk_crud, sync_crud
+
+        db = SessionLocal()
+        try:
+            risk_crud.upsert_customer_risk_snapshot(db, {
+                "customer_id": 7, "customer_name": "Stored Ltd", "unpaid_count": 0, "total_open_debt": 0,
+                "has_overdue": False, "risk_score": 0, "risk_level": "Safe", "reasons": [],
+            })
+            self.assertTrue(sync_crud.acquire_lease(db, RISK_SYNC_NAME, "other-worker", 60))
+
+            results = refresh_customers_risk(db, self.client)
+
+            self.assertEqual([r["customer_id"] for r in results], [7])
+            self.client.get_customers.assert_not_called()
+            self.assertFalse(sync_crud.acquire_lease(db, RISK_SYNC_NAME, "me", 60))
+        finally:
+            db.close()
+        print("✓ lease held elsewhere -> last snapshots, no crawl")
+
+    def test_lease_is_released_after_failed_refresh(self):
+        from db import SessionLocal
+        from refresh_service import refresh_customers_risk, RISK_SYNC_NAME
+        from crud import sync_crud
+
+        self.client.get_customers.side_effect = RuntimeError("Dolibarr down")
+        db = SessionLocal()
+        try:
+            with self.assertRaises(RuntimeError):
+                refresh_customers_risk(db, self.client)
+            self.assertFalse(sync_crud.is_lease_held(db, RISK_SYNC_NAME))
+        finally:
+            db.close()
+        print("✓ lease released when the refresh fails")
+
+    def test_long_refresh_keeps_its_lease(self):
+        from unittest.mock import patch
+        from db import SessionLocal
+        from refresh_service import RISK_SYNC_NAME
+        from crud import sync_crud
+
+        results = []
+        # SQLite stores lease expiry to the second, so keep the lease a few seconds long
+        with patch("refresh_service.settings.refresh_lease_seconds", 2):
+            crawl = self._refresh_in_thread(results)
+            self.assertTrue(self.crawling.wait(2))
+            # past the lease length: only the heartbeat keeps it held
+            time.sleep(2.5)
+
+            db = SessionLocal()
+            try:
+                self.assertFalse(sync_crud.acquire_lease(db, RISK_SYNC_NAME, "other-worker", 60))
+            finally:
+                db.close()
+            self.release.set()
+            crawl.join()
+
+        self.assertEqual(len(results[0]), 1)
+        print("✓ lease renewed while a long refresh runs, no takeover")
+
+    def test_expired_lease_can_be_taken_over(self):
+        from db import SessionLocal
+        from refresh_service import RISK_SYNC_NAME
+        from crud import sync_crud
+
+        db = SessionLocal()
+        try:
+            self.assertTrue(sync_crud.acquire_lease(db, RISK_SYNC_NAME, "crashed-worker", -1))
+            self.assertTrue(sync_crud.acquire_lease(db, RISK_SYNC_NAME, "me", 60))
+            self.assertFalse(sync_crud.acquire_lease(db, RISK_SYNC_NAME, "crashed-worker", 60))
+        finally:
+            db.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
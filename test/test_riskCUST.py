@@ -4,7 +4,7 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
 import unittest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
 from fastapi.testclient import TestClient
 
 
@@ -19,7 +19,7 @@ class TestRiskCustomersEndpoint(unittest.TestCase):
         from app import app
         self.client = TestClient(app)
 
-    @patch("app.DolibarrClient")
+    @patch("app.AsyncDolibarrClient")
     def test_get_risk_customers_success(self, mock_dolibarr_client):
         fake_client_instance = MagicMock()
         mock_dolibarr_client.return_value = fake_client_instance
@@ -28,7 +28,7 @@ class TestRiskCustomersEndpoint(unittest.TestCase):
             {"id": 1, "name": "Beta Corp"},
             {"id": 2, "name": "Delta Ltd"},
         ]
-        fake_client_instance.get_customers.return_value = fake_customers
+        fake_client_instance.get_customers = AsyncMock(return_value=fake_customers)
 
         beta_invoices = [
             {"id": 101, "socid": 1, "total_ttc": 1650, "paid": 0, "date_lim_reglement": "2023-01-01"},
@@ -38,9 +38,9 @@ class TestRiskCustomersEndpoint(unittest.TestCase):
             {"id": 201, "socid": 2, "total_ttc": 200, "paid": 0, "date_lim_reglement": "2099-01-01"},
         ]
 
-        fake_client_instance.get_invoices_by_customer.side_effect = lambda cid: (
+        fake_client_instance.get_invoices_by_customer = AsyncMock(side_effect=lambda cid: (
             beta_invoices if cid == 1 else delta_invoices if cid == 2 else []
-        )
+        ))
 
         response = self.client.get("/risk/customers")
         self.assertEqual(response.status_code, 200)
@@ -79,7 +79,7 @@ class TestRiskCustomersEndpoint(unittest.TestCase):
         print("✓ GET /risk/customers passed all assertions")
 
 
-    @patch("app.DolibarrClient")
+    @patch("app.AsyncDolibarrClient")
     def test_get_risk_customers_dolibarr_failure(self, mock_dolibarr_client):
         """
         Error case:
@@ -87,7 +87,7 @@ class TestRiskCustomersEndpoint(unittest.TestCase):
         """
 
         fake_client_instance = MagicMock()
-        fake_client_instance.get_customers.side_effect = Exception("Dolibarr down")
+        fake_client_instance.get_customers = AsyncMock(side_effect=Exception("Dolibarr down"))
         mock_dolibarr_client.return_value = fake_client_instance
 
         response = self.client.get("/risk/customers")
@@ -100,6 +100,118 @@ class TestRiskCustomersEndpoint(unittest.TestCase):
 
         print("✓ GET /risk/customers handles Dolibarr failure correctly")
 
+    @patch("app.AsyncDolibarrClient")
+    def test_get_risk_customers_served_from_snapshots(self, mock_dolibarr_client):
+        from db import SessionLocal
+        from crud import risk_crud
+
+        db = SessionLocal()
+        risk_crud.upsert_customer_risk_snapshot(db, {
+            "customer_id": 1,
+            "customer_name": "Beta Corp",
+            "unpaid_count": 2,
+            "total_open_debt": 2150.0,
+            "has_overdue": True,
+            "risk_score": 100.0,
+            "risk_level": "High",
+            "reasons": ["Has at least one overdue invoice (+50)", "Unpaid invoices 2 >= 2 (+20)"],
+        })
+        db.close()
+
+        response = self.client.get("/risk/customers")
+        self.assertEqual(response.status_code, 200)
+
+        body = response.json()
+        self.assertEqual(len(body), 1)
+        self.assertEqual(body[0]["customer_name"], "Beta Corp")
+        self.assertEqual(len(body[0]["reasons"]), 2)
+        mock_dolibarr_client.assert_not_called()
+
+        print("✓ GET /risk/customers served stored snapshots")
+
+    @patch("app.AsyncDolibarrClient")
+    def test_get_risk_customers_ndjson_stream(self, mock_dolibarr_client):
+        import json
+        from db import SessionLocal
+        from crud import risk_crud
+
+        db = SessionLocal()
+        risk_crud.bulk_upsert_customer_risk_snapshots(db, [
+            {
+                "customer_id": cid,
+                "customer_name": f"Customer {cid}",
+                "unpaid_count": cid,
+                "total_open_debt": 100.0 * cid,
+                "has_overdue": False,
+                "risk_score": 10.0 * cid,
+                "risk_level": "Low",
+                "reasons": [],
+            }
+            for cid in range(1, 4)
+        ])
+        db.close()
+
+        response = self.client.get("/risk/customers", headers={"Accept": "application/x-ndjson"})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("application/x-ndjson"))
+
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        self.assertEqual([r["customer_id"] for r in rows], [3, 2, 1])
+        self.assertEqual(rows[0]["reasons"], [])
+
+        by_param = self.client.get("/risk/customers?format=ndjson")
+        self.assertEqual(by_param.text, response.text)
+        mock_dolibarr_client.assert_not_called()
+
+        print("✓ GET /risk/customers streams NDJSON")
+
+    @patch("app.AsyncDolibarrClient")
+    @patch("app.DolibarrClient")
+    def test_get_risk_customers_refresh_uses_mirror_source(self, mock_dolibarr_client, mock_async_client):
+        fake_client_instance = MagicMock()
+        mock_dolibarr_client.return_value = fake_client_instance
+        fake_client_instance.iter_customers.side_effect = lambda modified_since=None: iter([{"id": 1, "name": "Beta Corp"}])
+        fake_client_instance.iter_invoices.side_effect = lambda status=None, modified_since=None: iter([
+            {"id": 101, "socid": 1, "total_ttc": 1650, "paid": 0, "statut": 1, "date_lim_reglement": "2023-01-01"},
+        ])
+
+        with patch("app.settings.risk_data_source", "mirror"):
+            response = self.client.get("/risk/customers?refresh=true")
+
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual([(c["customer_id"], c["total_open_debt"]) for c in body], [(1, 1650.0)])
+        mock_async_client.assert_not_called()
+        fake_client_instance.get_invoices_by_customer.assert_not_called()
+
+        print("✓ GET /risk/customers?refresh=true scores from the mirror when configured")
+
+    @patch("refresh_service.DolibarrClient")
+    def test_post_risk_refresh_returns_job_progress(self, mock_dolibarr_client):
+        fake_client_instance = MagicMock()
+        mock_dolibarr_client.return_value = fake_client_instance
+        fake_client_instance.get_customers.return_value = [{"id": 1, "name": "Beta Corp"}]
+        fake_client_instance.get_invoices_by_customer.return_value = []
+
+        response = self.client.post("/risk/refresh")
+        self.assertEqual(response.status_code, 202)
+        job_id = response.json()["job_id"]
+
+        import time
+        for _ in range(100):
+            job = self.client.get(f"/risk/refresh/{job_id}").json()
+            if job["status"] in ("done", "failed"):
+                break
+            time.sleep(0.02)
+
+        self.assertEqual(job["status"], "done", job)
+        self.assertEqual(job["processed"], 1)
+        self.assertEqual(job["total"], 1)
+
+        self.assertEqual(self.client.get("/risk/refresh/unknown").status_code, 404)
+
+        print("✓ POST /risk/refresh runs a background job")
+
 
 if __name__ == "__main__":
     unittest.main()
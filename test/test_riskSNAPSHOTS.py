@@ -0,0 +1,96 @@
+import unittest
+from fastapi.testclient import TestClient
+
+
+class TestRiskSnapshotsEndpoint(unittest.TestCase):
+
+    def setUp(self):
+        from db import Base, engine, SessionLocal
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+
+        from app import app
+        self.client = TestClient(app)
+
+        from crud import risk_crud
+        levels = ["Safe", "Low", "Medium", "High"]
+
+        db = SessionLocal()
+        risk_crud.bulk_upsert_customer_risk_snapshots(db, [
+            {
+                "customer_id": cid,
+                "customer_name": f"Customer {cid}",
+                "unpaid_count": cid % 5,
+                "total_open_debt": 250.0 * cid,
+                "has_overdue": cid % 2 == 0,
+                "risk_score": [0.0, 20.0, 50.0, 100.0][cid % 4],
+                "risk_level": levels[cid % 4],
+                "reasons": [],
+            }
+            for cid in range(1, 21)
+        ])
+        db.close()
+
+    def test_missing_indexes_created_on_existing_table(self):
+        from sqlalchemy import inspect
+        from db import engine, create_missing_indexes
+        from models import CustomerRiskSnapshot
+
+        added = ("ix_customer_risk_snapshots_risk_score", "ix_customer_risk_snapshots_risk_level",
+                 "ix_customer_risk_snapshots_total_open_debt")
+        for index in CustomerRiskSnapshot.__table__.indexes:
+            if index.name in added:
+                index.drop(bind=engine)
+
+        create_missing_indexes(CustomerRiskSnapshot.__table__)
+
+        names = {i["name"] for i in inspect(engine).get_indexes("customer_risk_snapshots")}
+        self.assertTrue(set(added) <= names)
+        print("✓ startup adds filter/sort indexes to an existing snapshots table")
+
+    def test_high_risk_only(self):
+        response = self.client.get("/risk/snapshots", params={"level": "High"})
+        self.assertEqual(response.status_code, 200)
+
+        body = response.json()
+        self.assertEqual(len(body), 5)
+        self.assertTrue(all(r["risk_level"] == "High" for r in body))
+        self.assertNotIn("X-Next-Cursor", response.headers)
+
+        print("✓ GET /risk/snapshots level filter passed all assertions")
+
+    def test_filters_combine(self):
+        response = self.client.get("/risk/snapshots", params={
+            "level": ["Medium", "High"], "min_debt": 1000, "has_overdue": True,
+        })
+        body = response.json()
+
+        self.assertEqual(sorted(r["customer_id"] for r in body), [6, 10, 14, 18])
+        self.assertTrue(all(r["has_overdue"] for r in body))
+        self.assertTrue(all(r["total_open_debt"] >= 1000 for r in body))
+
+    def test_keyset_pages_by_debt(self):
+        seen = []
+        cursor = None
+        while True:
+            params = {"sort": "total_open_debt", "order": "asc", "limit": 6}
+            if cursor:
+                params["cursor"] = cursor
+            response = self.client.get("/risk/snapshots", params=params)
+            self.assertEqual(response.status_code, 200)
+            seen.extend(r["total_open_debt"] for r in response.json())
+            cursor = response.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+
+        self.assertEqual(seen, [250.0 * cid for cid in range(1, 21)])
+
+        print("✓ GET /risk/snapshots keyset paging passed all assertions")
+
+    def test_bad_cursor(self):
+        response = self.client.get("/risk/snapshots", params={"cursor": "garbage"})
+        self.assertEqual(response.status_code, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import unittest
+
+
+def _row(cid, debt, level="Low"):
+    return {
+        "customer_id": cid,
+        "customer_name": f"Customer {cid}",
+        "unpaid_count": 1,
+        "total_open_debt": debt,
+        "has_overdue": False,
+        "risk_score": 20.0,
+        "risk_level": level,
+        "reasons": ["Unpaid invoices 1 >= 1 (+20)"],
+    }
+
+
+class TestBulkSnapshotUpsert(unittest.TestCase):
+
+    def setUp(self):
+        from db import Base, engine, SessionLocal
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+        self.db = SessionLocal()
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_bulk_upsert_snapshots_inserts_and_updates_in_one_call(self):
+        from crud import risk_crud
+        from models import CustomerRiskSnapshot
+
+        written = risk_crud.bulk_upsert_customer_risk_snapshots(
+            self.db, [_row(cid, 100.0) for cid in range(1, 8)], chunk_size=3,
+        )
+        self.assertEqual(written, 7)
+
+        # second pass updates a few existing rows and adds a new one
+        risk_crud.bulk_upsert_customer_risk_snapshots(self.db, [_row(2, 999.0, "High"), _row(8, 50.0)])
+
+        self.assertEqual(self.db.query(CustomerRiskSnapshot).count(), 8)
+
+        updated = risk_crud.get_customer_risk(self.db, 2)
+        self.assertEqual(updated.total_open_debt, 999.0)
+        self.assertEqual(updated.risk_level, "High")
+        self.assertEqual(updated.reasons, "Unpaid invoices 1 >= 1 (+20)")
+        self.assertEqual(risk_crud.get_customer_risk(self.db, 1).total_open_debt, 100.0)
+        print("✓ bulk snapshot upsert inserts and updates across chunks")
+
+
+if __name__ == "__main__":
+    unittest.main()
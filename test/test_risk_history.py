@@ -0,0 +1,91 @@
+import unittest
+from datetime import date, datetime, timedelta
+from unittest.mock import MagicMock
+from fastapi.testclient import TestClient
+
+
+class TestRiskHistory(unittest.TestCase):
+
+    def setUp(self):
+        # app imports every model, so drop_all / create_all see all tables
+        from app import app
+        from db import Base, engine, SessionLocal
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+        self.db = SessionLocal()
+        self.client = TestClient(app)
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_only_changes_are_recorded(self):
+        from refresh_service import refresh_customers_risk
+
+        debts = {1: 200, 2: 300}
+        client = MagicMock()
+        client.get_customers.return_value = [{"id": 1, "name": "Beta Corp"}, {"id": 2, "name": "Delta Ltd"}]
+        client.get_invoices_by_customer.side_effect = lambda cid: [
+            {"id": cid, "socid": cid, "total_ttc": debts[cid], "paid": 0, "date_lim_reglement": "2099-01-01"},
+        ]
+
+        refresh_customers_risk(self.db, client)
+        refresh_customers_risk(self.db, client)
+        debts[1] = 5000
+        refresh_customers_risk(self.db, client)
+
+        response = self.client.get("/risk/customers/1/history", params={"days": 90})
+        self.assertEqual(response.status_code, 200)
+        points = response.json()
+        self.assertEqual([p["total_open_debt"] for p in points], [200.0, 5000.0])
+        self.assertEqual(points[-1]["risk_level"], "Low")
+
+        self.assertEqual(len(self.client.get("/risk/customers/2/history").json()), 1)
+
+        print("✓ GET /risk/customers/{id}/history passed all assertions")
+
+    def test_compaction_downsamples_and_expires(self):
+        from crud import history_crud
+        from models import CustomerRiskHistory
+
+        today = date(2024, 12, 31)
+
+        def add(day, score):
+            self.db.add(CustomerRiskHistory(
+                customer_id=1, recorded_on=day, recorded_at=datetime.combine(day, datetime.min.time()),
+                unpaid_count=1, total_open_debt=1.0, risk_score=score, risk_level="Low",
+            ))
+
+        add(today - timedelta(days=900), 0.5)                    # past retention, superseded
+        add(today - timedelta(days=800), 1.0)                    # past retention, value at the cutoff
+        for offset in range(3):                                   # same old ISO week
+            add(date(2024, 6, 3) + timedelta(days=offset), 10.0 + offset)
+        add(today - timedelta(days=5), 50.0)                      # recent, kept as is
+        add(today - timedelta(days=4), 60.0)
+        self.db.commit()
+
+        stats = history_crud.compact_history(self.db, full_resolution_days=90, retention_days=730, today=today)
+
+        self.assertEqual(stats, {"expired": 1, "downsampled": 2})
+        scores = [r.risk_score for r in self.db.query(CustomerRiskHistory).order_by(CustomerRiskHistory.id)]
+        self.assertEqual(scores, [1.0, 12.0, 50.0, 60.0])
+
+    def test_compaction_keeps_only_row_of_stable_customer(self):
+        from crud import history_crud
+        from models import CustomerRiskHistory, utcnow
+
+        old = utcnow() - timedelta(days=800)
+        self.db.add(CustomerRiskHistory(
+            customer_id=3, recorded_on=old.date(), recorded_at=old,
+            unpaid_count=2, total_open_debt=400.0, risk_score=20.0, risk_level="Low",
+        ))
+        self.db.commit()
+
+        stats = history_crud.compact_history(self.db, full_resolution_days=90, retention_days=730)
+
+        self.assertEqual(stats["expired"], 0)
+        points = history_crud.get_customer_history(self.db, 3, days=30)
+        self.assertEqual([p["risk_score"] for p in points], [20.0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,169 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from risk_service import RiskService
+
+
+class TestRiskServiceFetch(unittest.TestCase):
+
+    def _fake_client(self):
+        client = MagicMock()
+        client.get_customers.return_value = [
+            {"id": i, "name": f"Customer {i}"} for i in range(1, 21)
+        ]
+        # every odd customer has one overdue invoice
+        client.get_invoices_by_customer.side_effect = lambda cid: (
+            [{"id": cid * 10, "socid": cid, "total_ttc": 100 * cid, "paid": 0,
+              "date_lim_reglement": "2020-01-01"}] if cid % 2 else []
+        )
+        return client
+
+    def test_concurrent_fetch_matches_serial(self):
+        with patch("risk_service.settings.dolibarr_concurrency", 1):
+            serial = RiskService(self._fake_client()).get_customers_risk()
+
+        with patch("risk_service.settings.dolibarr_concurrency", 8):
+            concurrent = RiskService(self._fake_client()).get_customers_risk()
+
+        self.assertEqual(len(serial), 20)
+        self.assertEqual(serial, concurrent)
+
+    def test_fetch_invoices_keeps_customer_order(self):
+        client = self._fake_client()
+        service = RiskService(client)
+
+        with patch("risk_service.settings.dolibarr_concurrency", 4):
+            invoices = service._fetch_invoices([3, 2, 1])
+
+        self.assertEqual([inv[0]["socid"] if inv else None for inv in invoices], [3, None, 1])
+        self.assertEqual(client.get_invoices_by_customer.call_count, 3)
+
+    def test_bulk_mode_groups_invoices_by_socid(self):
+        client = self._fake_client()
+        client.iter_invoices.return_value = iter([
+            {"id": cid * 10, "socid": cid, "total_ttc": 100 * cid, "paid": 0,
+             "date_lim_reglement": "2020-01-01"}
+            for cid in range(1, 21, 2)
+        ])
+
+        with patch("risk_service.settings.risk_fetch_mode", "bulk"):
+            bulk = RiskService(client).get_customers_risk()
+
+        client.get_invoices_by_customer.assert_not_called()
+        client.iter_invoices.assert_called_once_with(status="unpaid")
+        self.assertEqual(bulk, RiskService(self._fake_client()).get_customers_risk())
+
+    def test_bulk_mode_incremental_uses_same_status_filter(self):
+        invoices = {
+            1: [{"id": 10, "socid": 1, "total_ttc": 100, "paid": 0, "statut": 1},
+                {"id": 11, "socid": 1, "total_ttc": 900, "paid": 0, "statut": 0}],  # draft
+        }
+        client = MagicMock()
+        client.iter_customers.return_value = iter([])
+        client.iter_invoices.return_value = iter([{"id": 11, "socid": 1, "date_modification": 5}])
+        client.get_customer.return_value = {"id": 1, "name": "Beta Corp"}
+        client.get_invoices_by_customer.side_effect = lambda cid, status=None: [
+            inv for inv in invoices[cid] if status != "unpaid" or inv["statut"] == 1
+        ]
+
+        with patch("risk_service.settings.risk_fetch_mode", "bulk"):
+            [changed] = RiskService(client).get_changed_customers_risk(0)
+
+        client.get_invoices_by_customer.assert_called_once_with(1, status="unpaid")
+        self.assertEqual((changed["unpaid_count"], changed["total_open_debt"]), (1, 100.0))
+
+    def test_async_fetch_matches_sync(self):
+        import asyncio
+        from unittest.mock import AsyncMock
+
+        sync_client = self._fake_client()
+        async_client = MagicMock()
+        async_client.get_customers = AsyncMock(return_value=sync_client.get_customers.return_value)
+        async_client.get_invoices_by_customer = AsyncMock(side_effect=sync_client.get_invoices_by_customer.side_effect)
+
+        with patch("risk_service.settings.dolibarr_concurrency", 3):
+            results = asyncio.run(RiskService(async_client).get_customers_risk_async())
+
+        self.assertEqual(results, RiskService(self._fake_client()).get_customers_risk())
+        self.assertEqual(async_client.get_invoices_by_customer.await_count, 20)
+
+
+class TestDateParsing(unittest.TestCase):
+
+    def setUp(self):
+        from risk_service import parse_date_string, _format_hits
+        parse_date_string.cache_clear()
+        for fmt in _format_hits:
+            _format_hits[fmt] = 0
+
+    def test_repeated_values_hit_the_cache(self):
+        from risk_service import date_parse_stats
+
+        service = RiskService(MagicMock())
+        for _ in range(5):
+            self.assertEqual(str(service._parse_date("2024-03-05")), "2024-03-05")
+
+        stats = date_parse_stats()
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["hits"], 4)
+        self.assertEqual(stats["formats"]["%Y-%m-%d"], 1)
+
+    def test_learned_format_keeps_day_first_precedence(self):
+        service = RiskService(MagicMock())
+
+        # teach the parser that this instance writes month-first dates
+        for day in range(13, 29):
+            service._parse_date(f"12/{day}/2024")
+
+        # still ambiguous -> day-first wins, as before the cache existed
+        self.assertEqual(str(service._parse_date("01/02/2024")), "2024-02-01")
+        self.assertEqual(str(service._parse_date("2024-03-05T10:00:00")), "2024-03-05")
+        self.assertIsNone(service._parse_date("not a date"))
+
+
+class TestVectorizedEngine(unittest.TestCase):
+
+    def _random_groups(self, n_customers=300):
+        import random
+        rnd = random.Random(42)
+        due_values = [
+            "2020-01-01", "2099-12-31", "01/02/2020", "12/31/2099", "2021-06-30T10:00:00",
+            "2024-03-05 10:00:00", "not a date", "", None, 1_500_000_000, 4_000_000_000,
+        ]
+        groups = []
+        for cid in range(n_customers):
+            invoices = []
+            for _ in range(rnd.randint(0, 8)):
+                invoices.append({
+                    "socid": cid,
+                    "total_ttc": rnd.choice([rnd.uniform(0, 900), "123.45", None, 0]),
+                    "amount": rnd.choice([None, 10]),
+                    "paid": rnd.choice([0, 1, "1", None]),
+                    rnd.choice(["date_lim_reglement", "due_date", "datedue"]): rnd.choice(due_values),
+                })
+            groups.append(invoices)
+        return groups
+
+    def test_numpy_engine_matches_calc_risk(self):
+        from risk_vectorized import calc_risk_many
+
+        service = RiskService(MagicMock())
+        groups = self._random_groups()
+
+        expected = [service._calc_risk(g) for g in groups]
+        self.assertEqual(calc_risk_many(groups, service._parse_date), expected)
+
+    def test_numpy_engine_selected_by_setting(self):
+        client = MagicMock()
+        client.get_customers.return_value = [{"id": 1, "name": "Beta Corp"}, {"id": 2, "name": "Delta Ltd"}]
+        client.get_invoices_by_customer.side_effect = lambda cid: self._random_groups(3)[cid]
+
+        python_results = RiskService(client).get_customers_risk()
+        with patch("risk_service.settings.risk_engine", "numpy"):
+            numpy_results = RiskService(client).get_customers_risk()
+
+        self.assertEqual(numpy_results, python_results)
+
+
+if __name__ == "__main__":
+    unittest.main()
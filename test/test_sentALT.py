@@ -38,8 +38,9 @@ class TestAlertsSendEndpoint(unittest.TestCase):
         db.commit()
         db.close()
 
-    @patch("app.send_email_smtp", autospec=True)
-    def test_send_alert_success(self, mock_send_email):
+    @patch("app.settings.email_to", "risk-team@example.com")
+    @patch("app.email_dispatcher")
+    def test_send_alert_success(self, mock_dispatcher):
         self._insert_snapshot(customer_id=1)
 
         payload = {"customer_id": 1, "message": "Dear Beta Corp, your invoice is overdue."}
@@ -50,17 +51,23 @@ class TestAlertsSendEndpoint(unittest.TestCase):
         self.assertEqual(body["status"], "sent")
         self.assertIsInstance(body["alert_id"], int)
 
-        # ✅ verify that "sending email" was triggered, but not really sent
-        self.assertTrue(mock_send_email.called)
+        # ✅ verify that the email was queued and the dispatcher woken, but not really sent
+        self.assertTrue(mock_dispatcher.notify.called)
 
-        # DB assert: alert saved
+        # DB assert: alert saved + email in the outbox
         from db import SessionLocal
-        from models import Alert
+        from models import Alert, OutboundEmail
 
         db = SessionLocal()
         alert = db.query(Alert).filter(Alert.id == body["alert_id"]).first()
+        email = db.query(OutboundEmail).filter(OutboundEmail.alert_id == body["alert_id"]).first()
         db.close()
 
+        self.assertIsNotNone(email)
+        self.assertEqual(email.status, "pending")
+        self.assertIn("Beta Corp", email.subject)
+        self.assertIn(payload["message"], email.body)
+
         self.assertIsNotNone(alert)
         self.assertEqual(alert.customer_id, 1)
         self.assertEqual(alert.status, "sent")
@@ -78,6 +85,45 @@ class TestAlertsSendEndpoint(unittest.TestCase):
         self.assertEqual(response.status_code, 400)
         self.assertTrue(isinstance(response.json().get("detail"), str))
 
+    @patch("app.settings.email_to", "risk-team@example.com")
+    @patch("app.email_dispatcher")
+    def test_send_alerts_batch(self, mock_dispatcher):
+        self._insert_snapshot(customer_id=1)
+        self._insert_snapshot(customer_id=2)
+
+        payload = {"items": [
+            {"customer_id": 1, "message": "Invoice overdue"},
+            {"customer_id": 2},
+            {"customer_id": 999, "message": "no snapshot"},
+            {"message": "missing id"},
+        ]}
+        response = self.client.post("/alerts/send-batch", json=payload)
+        self.assertEqual(response.status_code, 200)
+
+        body = response.json()
+        self.assertEqual(body["sent"], 2)
+        self.assertEqual(body["failed"], 2)
+
+        results = body["results"]
+        self.assertEqual([r["status"] for r in results], ["sent", "sent", "error", "error"])
+        self.assertEqual(results[3]["detail"], "customer_id is required")
+        self.assertTrue(mock_dispatcher.notify.called)
+
+        from db import SessionLocal
+        from models import Alert, OutboundEmail
+
+        db = SessionLocal()
+        alerts = db.query(Alert).order_by(Alert.id).all()
+        emails = db.query(OutboundEmail).count()
+        db.close()
+
+        self.assertEqual([a.message for a in alerts], ["Invoice overdue", "Automatic risk alert"])
+        self.assertEqual(emails, 2)
+
+    def test_send_alerts_batch_requires_items(self):
+        response = self.client.post("/alerts/send-batch", json={"items": []})
+        self.assertEqual(response.status_code, 400)
+
 
 if __name__ == "__main__":
     unittest.main()
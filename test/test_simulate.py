@@ -0,0 +1,92 @@
+import unittest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+
+
+class TestRiskSimulation(unittest.TestCase):
+
+    def setUp(self):
+        from db import Base, engine, SessionLocal
+        from crud import risk_crud
+        from risk_service import score_risk
+
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+        self.db = SessionLocal()
+
+        customers = [
+            (1, "Alpha SARL", 0, 0.0, False),      # Safe
+            (2, "Beta Corp", 1, 1500.0, False),    # debt > 1000 -> Low (30)
+            (3, "Gamma SA", 3, 800.0, False),      # unpaid >= 3 -> Low (20)
+            (4, "Delta Ltd", 3, 5000.0, True),     # everything -> High (100)
+        ]
+        with patch("risk_service.settings") as s:
+            s.debt_threshold, s.unpaid_n = 1000, 3
+            rows = [
+                {"customer_id": cid, "customer_name": name, **score_risk(unpaid, debt, overdue)}
+                for cid, name, unpaid, debt, overdue in customers
+            ]
+        risk_crud.bulk_upsert_customer_risk_snapshots(self.db, rows)
+
+        from app import app
+        self.client = TestClient(app)
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_alternative_thresholds(self):
+        response = self.client.post("/risk/simulate", json={"debt_threshold": 2000, "unpaid_n": 2})
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+
+        self.assertEqual(body["customers"], 4)
+        self.assertEqual(body["current_distribution"], {"Safe": 1, "Low": 2, "Medium": 0, "High": 1})
+        # Beta drops to Safe (debt under 2000), Gamma and Delta are unchanged
+        self.assertEqual(body["simulated_distribution"], {"Safe": 2, "Low": 1, "Medium": 0, "High": 1})
+        self.assertEqual(body["changed_count"], 1)
+        self.assertEqual(body["changes"], [{
+            "customer_id": 2, "customer_name": "Beta Corp",
+            "current_score": 30.0, "current_level": "Low",
+            "simulated_score": 0.0, "simulated_level": "Safe",
+        }])
+        self.assertEqual(body["parameters"]["debt_threshold"], 2000)
+
+        print("✓ POST /risk/simulate rescored with alternative thresholds")
+
+    def test_weights_cutoffs_and_limit(self):
+        from crud import risk_crud
+
+        response = self.client.post("/risk/simulate", json={
+            "debt_threshold": 1000, "unpaid_n": 3,
+            "debt_weight": 45, "unpaid_weight": 40, "low_max": 29, "limit": 1,
+        })
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+
+        # Beta 45 -> Medium, Gamma 40 -> Medium, both changed; highest score listed first
+        self.assertEqual(body["simulated_distribution"], {"Safe": 1, "Low": 0, "Medium": 2, "High": 1})
+        self.assertEqual(body["changed_count"], 2)
+        self.assertEqual([c["customer_id"] for c in body["changes"]], [2])
+
+        # nothing is written back
+        self.assertEqual(risk_crud.get_snapshot_states(self.db, [2])[2]["risk_score"], 30.0)
+
+        print("✓ POST /risk/simulate applied weights, cut-offs and limit")
+
+    def test_invalid_cutoffs_and_empty_table(self):
+        response = self.client.post("/risk/simulate", json={"low_max": 50, "medium_max": 40})
+        self.assertEqual(response.status_code, 400)
+
+        from db import Base, engine
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+        body = self.client.post("/risk/simulate", json={}).json()
+        self.assertEqual(body["customers"], 0)
+        self.assertEqual(body["changed_count"], 0)
+        self.assertEqual(body["simulated_distribution"], {"Safe": 0, "Low": 0, "Medium": 0, "High": 0})
+
+        print("✓ POST /risk/simulate rejects bad cut-offs and handles no snapshots")
+
+
+if __name__ == "__main__":
+    unittest.main()